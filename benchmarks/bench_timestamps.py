@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+"""
+Micro-benchmark of the deferred created_at/updated_at handling.
+
+Compares reloading and re-serializing records whose timestamps are never
+read (they stay ISO strings) with the eager path, where every timestamp
+is parsed on reload and formatted again by to_dict().
+
+Usage: python3 -m benchmarks.bench_timestamps [count]
+"""
+import sys
+import time
+from datetime import datetime
+from models.place import Place
+
+
+def best_of(func, repeat=3):
+    """Return the best wall time of func() over repeat runs"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(count=100000):
+    now = datetime.now().isoformat()
+    records = [{"__class__": "Place", "id": str(i), "created_at": now,
+                "updated_at": now, "name": "place"} for i in range(count)]
+
+    def reload():
+        return [Place(**record) for record in records]
+
+    def reload_eager():
+        objects = reload()
+        for obj in objects:
+            obj.created_at, obj.updated_at
+        return objects
+
+    deferred, eager = reload(), reload_eager()
+    results = {
+        "reload deferred": best_of(reload),
+        "reload eager": best_of(reload_eager),
+        "save deferred": best_of(lambda: [o.to_dict() for o in deferred]),
+        "save eager": best_of(lambda: [o.to_dict() for o in eager]),
+    }
+    print(f"{count} objects")
+    for name, seconds in results.items():
+        print(f"{name:16} {seconds * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
@@ -0,0 +1,212 @@
+#!/usr/bin/python3
+"""
+Benchmark suite for the storage engine and the model hot paths.
+
+Measures BaseModel() creation, to_dict(), storage save() and reload(),
+and the console all, show and update commands, for each store size.
+Storage is configured from the HBNB_* environment variables as usual,
+so every storage mode can be measured; the suite runs in a temporary
+directory and leaves no file behind.
+
+Usage:
+    python3 -m benchmarks.suite run [--sizes 1000,10000] [--repeat 3]
+                                    [--output results.json]
+    python3 -m benchmarks.suite compare old.json new.json [--threshold 0.2]
+
+compare prints the change of the time per operation of every benchmark
+found in both runs and exits with status 1 if one got slower by more
+than the threshold.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SIZES = (1000, 10000, 100000, 1000000)
+# at most this many show and update commands are timed per size
+SHOWS = 1000
+UPDATES = 10
+# a run taking this long is not repeated
+LONG_RUN = 5.0
+
+
+def best_of(func, repeat, setup=None):
+    """Return the best wall time of func() over repeat runs, calling
+    setup() untimed before each, or the time of a single long run"""
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        if elapsed > LONG_RUN:
+            break
+    return best
+
+
+def run_size(count, repeat):
+    """Return the results of every benchmark on a store of count objects,
+    by name: the best time and the number of operations it covers"""
+    from console import HBNBCommand
+    from models import storage
+    from models.base_model import BaseModel
+
+    results = {}
+    objects = []
+
+    def create():
+        objects[:] = [BaseModel() for _ in range(count)]
+
+    def record(name, seconds, ops):
+        results[name] = {"seconds": seconds, "ops": ops,
+                         "us_per_op": seconds / ops * 1e6}
+
+    record("create", best_of(create, repeat, storage.clear), count)
+    record("to_dict", best_of(
+        lambda: [obj.to_dict() for obj in objects], repeat), count)
+
+    def mark_all():
+        for obj in objects:
+            storage.new(obj)
+
+    record("save", best_of(storage.save, repeat, mark_all), count)
+    ids = [obj.id for obj in objects]
+    del objects[:]
+    record("reload", best_of(
+        lambda: (storage.reload(), len(storage.all())), repeat), count)
+
+    console = HBNBCommand(stdout=io.StringIO())
+    sample = random.Random(0).sample
+    shows = [f"show BaseModel {id}" for id in sample(ids, min(SHOWS, count))]
+    updates = [f'update BaseModel {id} name "benchmark"'
+               for id in sample(ids, min(UPDATES, count))]
+
+    def commands(lines):
+        with open(os.devnull, "w") as devnull, \
+                contextlib.redirect_stdout(devnull):
+            for line in lines:
+                console.onecmd(line)
+
+    record("console_all", best_of(
+        lambda: commands(["all BaseModel"]), repeat), count)
+    record("console_show", best_of(
+        lambda: commands(shows), repeat), len(shows))
+    record("console_update", best_of(
+        lambda: commands(updates), repeat), len(updates))
+    storage.clear()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, repeat):
+    """Return the results of the whole suite with the run's settings"""
+    workdir = tempfile.mkdtemp(prefix="hbnb-bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        results = {}
+        for count in sizes:
+            results[str(count)] = run_size(count, repeat)
+            print_results({str(count): results[str(count)]}, sys.stderr)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "environment": {key: value for key, value in os.environ.items()
+                            if key.startswith("HBNB_")},
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def print_results(results, file=sys.stdout):
+    for count, benchmarks in results.items():
+        for name, result in benchmarks.items():
+            print(f"{count:>8} {name:16} {result['seconds'] * 1000:11.1f} ms"
+                  f" {result['us_per_op']:11.2f} us/op", file=file)
+
+
+def compare(old, new, threshold):
+    """Print the change of every benchmark of both runs and return the
+    names of those that regressed by more than threshold"""
+    regressions = []
+    for count, benchmarks in new["results"].items():
+        for name, result in benchmarks.items():
+            before = old["results"].get(count, {}).get(name)
+            if before is None:
+                continue
+            change = result["us_per_op"] / before["us_per_op"] - 1
+            flag = ""
+            if change > threshold:
+                flag = "  REGRESSION"
+                regressions.append(f"{name}@{count}")
+            print(f"{count:>8} {name:16} {before['us_per_op']:11.2f} ->"
+                  f" {result['us_per_op']:11.2f} us/op {change:+8.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m benchmarks.suite")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument(
+        "--sizes", default=",".join(map(str, SIZES)),
+        help="comma separated store sizes (default: %(default)s)")
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--output", help="write the results there")
+    compare_parser = commands.add_parser(
+        "compare", help="compare two result files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.2,
+                                help="tolerated slowdown (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        sizes = [int(size) for size in args.sizes.split(",")]
+        results = run(sizes, args.repeat)
+        text = json.dumps(results, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+        return 0
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    regressions = compare(old, new, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,25 +4,16 @@ Command Interpreter Module for HBNB Project
 """
 
 import cmd
-from models.base_model import BaseModel
-from models import storage
-from models.user import User
-from models.amenity import Amenity
-from models.city import City
-from models.place import Place
-from models.review import Review
-from models.state import State
-
-
-MODELS = {
-    "BaseModel": BaseModel,
-    "User": User,
-    "City": City,
-    "Place": Place,
-    "Review": Review,
-    "State": State,
-    "Amenity": Amenity,
-}
+import json
+import math
+import sys
+import models
+from models.engine import stats
+from models.engine.geo import coordinates
+
+
+# model classes by name, imported on first use
+MODELS = models.classes
 
 
 def validate_args(args_list):
@@ -46,9 +37,35 @@ def validate_args(args_list):
     return True
 
 
+def parse_numbers(args_list):
+    """
+    Returns the arguments as floats, or None if one is not a finite
+    number.
+    """
+    try:
+        numbers = [float(arg) for arg in args_list]
+    except ValueError:
+        return None
+    if not all(map(math.isfinite, numbers)):
+        return None
+    return numbers
+
+
 class HBNBCommand(cmd.Cmd):
     prompt = "(hbnb) "
 
+    def precmd(self, line):
+        """Picks up what other processes wrote before each command"""
+        # storage is only created by the first command that uses it
+        if "storage" in vars(models):
+            models.storage.refresh()
+        return line
+
+    def postloop(self):
+        """Writes what a pending batch saved before exiting"""
+        if "storage" in vars(models):
+            models.storage.commit()
+
     def emptyline(self):
         """Do nothing when an empty line is entered"""
         pass
@@ -61,6 +78,46 @@ class HBNBCommand(cmd.Cmd):
         """Handles EOF to exit the program (Ctrl+D)."""
         return True
 
+    def do_begin(self, args):
+        """
+        Starts a batch: changes are kept in memory until commit
+        (or the end of the session) writes them at once
+        """
+        models.storage.begin()
+
+    def do_commit(self, args):
+        """Ends the batch started by begin and writes its changes"""
+        models.storage.commit()
+
+    def do_flush(self, args):
+        """Writes the changes made so far, even inside a batch"""
+        models.storage.flush()
+
+    def do_stats(self, args):
+        """
+        Prints the figures recorded by the instrumentation (HBNB_STATS=1)
+        Usage: stats [json|reset]
+        """
+        if args == "reset":
+            stats.reset()
+            return
+        figures = stats.snapshot()
+        if args == "json":
+            print(json.dumps(figures, indent=2))
+            return
+        if args:
+            print(f"** invalid option: {args} **")
+            return
+        if not figures["enabled"]:
+            print("** stats are off, set HBNB_STATS=1 **")
+        for name, timer in figures["timers"].items():
+            print(f"{name:22} {timer['calls']:9} calls"
+                  f"  p50 {timer['p50_us']:10.1f} us"
+                  f"  p99 {timer['p99_us']:10.1f} us"
+                  f"  total {timer['total_ms']:10.1f} ms")
+        for name, value in figures["counters"].items():
+            print(f"{name:22} {value:9}")
+
     def do_create(self, cls_name):
         """Creates an instance of a Model"""
         if not cls_name:
@@ -70,7 +127,7 @@ class HBNBCommand(cmd.Cmd):
             print("** class doesn't exist **")
             return
 
-        new_model = MODELS[cls_name]()
+        new_model = models.storage.classes()[cls_name]()
         new_model.save()
         print(new_model.id)
 
@@ -86,10 +143,9 @@ class HBNBCommand(cmd.Cmd):
 
         class_name = args_list[0]
         instance_id = args_list[1]
-        key = "{}.{}".format(class_name, instance_id)
-        objects = storage.all()
-        if key in objects:
-            print(objects[key])
+        instance = models.storage.get(class_name, instance_id)
+        if instance is not None:
+            print(instance)
         else:
             print("** no instance found **")
 
@@ -101,37 +157,133 @@ class HBNBCommand(cmd.Cmd):
 
         class_name = args_list[0]
         instance_id = args_list[1]
-        objects = storage.all()
-        key = "{}.{}".format(class_name, instance_id)
-        if key in objects:
-            del objects[key]
-            storage.save()
+        instance = models.storage.get(class_name, instance_id)
+        if instance is not None:
+            models.storage.delete(instance)
+            models.storage.save()
         else:
             print("** no instance found **")
 
-    def do_all(self, cls):
+    def do_all(self, args):
         """
         Prints all string representation of all instances
         based or not on the class name.
+        Usage: all [<class name>] [limit=<n>] [offset=<n>] [lines]
+        With lines, each instance is printed on its own line instead
+        of as one list. Instances are printed as they are read.
+        """
+        args_list = args.split()
+        cls = None
+        # If class name is provided, it must be valid and only
+        # instances of that class are printed
+        if args_list and "=" not in args_list[0] and \
+                args_list[0] != "lines":
+            cls = args_list.pop(0)
+            if cls not in MODELS:
+                print("** class doesn't exist **")
+                return
+
+        limit, offset, lines = None, 0, False
+        for option in args_list:
+            name, _, value = option.partition("=")
+            if option == "lines":
+                lines = True
+            elif name in ("limit", "offset") and value.isdigit():
+                if name == "limit":
+                    limit = int(value)
+                else:
+                    offset = int(value)
+            else:
+                print(f"** invalid option: {option} **")
+                return
+
+        objects = models.storage.iterate(cls, offset=offset, limit=limit)
+        if lines:
+            for obj in objects:
+                print(obj)
+            return
+        # same output as printing the list of strings, one item at a time
+        print("[", end="")
+        for i, obj in enumerate(objects):
+            print(", " if i else "", repr(str(obj)), sep="", end="")
+        print("]")
+
+    def do_near(self, args):
         """
-        objects = storage.all()
-        obj_list = []
-
-        # If no class name is provided, print all instances
-        if not cls:
-            for obj in objects.values():
-                obj_list.append(str(obj))
-        # If class name is provided and valid, print only
-        # instances of that class
-        elif cls in MODELS:
-            for key, obj in objects.items():
-                if key.split(".")[0] == cls:
-                    obj_list.append(str(obj))
+        Prints the instances nearest to a point, with their distance
+        Usage: near <class name> <latitude> <longitude> [radius=<km>] [k=<n>]
+        Without radius the k nearest are printed (5 by default), with it
+        those within radius kilometres, at most k if given.
+        """
+        args_list = args.split()
+        if not args_list:
+            print("** class name missing **")
+            return
+        if args_list[0] not in MODELS:
+            print("** class doesn't exist **")
+            return
+        point = parse_numbers(args_list[1:3])
+        if point is None or len(point) < 2:
+            print("** latitude and longitude missing **")
+            return
+        if coordinates(*point) is None:
+            print("** invalid coordinates **")
+            return
+        radius, k = None, None
+        for option in args_list[3:]:
+            name, _, value = option.partition("=")
+            if name == "radius" and parse_numbers([value]):
+                radius, = parse_numbers([value])
+            elif name == "k" and value.isdigit():
+                k = int(value)
+            else:
+                print(f"** invalid option: {option} **")
+                return
+        if radius is None:
+            found = models.storage.nearest(
+                args_list[0], *point, 5 if k is None else k)
         else:
+            found = models.storage.nearby(args_list[0], *point, radius)[:k]
+        for km, obj in found:
+            print(f"{km:.3f} km {obj}")
+
+    def do_within(self, args):
+        """
+        Prints the instances located in a bounding box
+        Usage: within <class name> <south> <west> <north> <east>
+        """
+        args_list = args.split()
+        if not args_list:
+            print("** class name missing **")
+            return
+        if args_list[0] not in MODELS:
             print("** class doesn't exist **")
             return
+        box = parse_numbers(args_list[1:])
+        if box is None or len(box) != 4:
+            print("** south, west, north and east needed **")
+            return
+        for obj in models.storage.within(args_list[0], *box).values():
+            print(obj)
 
-        print(obj_list)
+    def do_search(self, args):
+        """
+        Prints the instances best matching words, with their score
+        Usage: search <class name> <words>
+        Review text and Place name and description are searched.
+        """
+        args_list = args.split(maxsplit=1)
+        if not args_list:
+            print("** class name missing **")
+            return
+        if args_list[0] not in MODELS:
+            print("** class doesn't exist **")
+            return
+        if len(args_list) < 2:
+            print("** words missing **")
+            return
+        for score, obj in models.storage.search(*args_list):
+            print(f"{score:.3f} {obj}")
 
     def do_update(self, args):
         """
@@ -172,12 +324,8 @@ class HBNBCommand(cmd.Cmd):
             return
 
         # Find the instance and update it
-        key = "{}.{}".format(class_name, instance_id)
-        objects = storage.all()
-
-        if key in objects:
-            instance = objects[key]
-
+        instance = models.storage.get(class_name, instance_id)
+        if instance is not None:
             # Try to cast the value to the appropriate type
             try:
                 # First try to convert to int or float if possible
@@ -201,4 +349,7 @@ class HBNBCommand(cmd.Cmd):
 
 
 if __name__ == "__main__":
+    # --batch runs the whole session as one batch, for piped scripts
+    if "--batch" in sys.argv[1:]:
+        models.storage.begin()
     HBNBCommand().cmdloop()
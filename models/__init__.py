@@ -1,7 +1,90 @@
 #!/usr/bin/env python3
-"""Initializes the storage engine"""
+"""Initializes the storage engine
 
-from models.engine.file_storage import FileStorage
+`models.storage` is created and reloaded the first time it is used, not
+when the package is imported, and model classes are imported the first
+time they are looked up in `models.classes`.
 
-storage = FileStorage()
-storage.reload()
+HBNB_TYPE_STORAGE=db selects the SQLite engine (database file set by
+HBNB_DB_PATH), anything else the JSON file engine. HBNB_STORAGE_CLASSES,
+a comma separated list of class names, limits the classes loaded up front.
+"""
+import importlib
+import os
+import threading
+from collections.abc import Mapping
+
+
+class ModelRegistry(Mapping):
+    """Model classes by name, each imported from its module on lookup"""
+
+    def __init__(self, modules):
+        self.__modules = modules
+        self.__classes = {}
+
+    def __getitem__(self, name):
+        if name not in self.__classes:
+            module = importlib.import_module(self.__modules[name])
+            self.__classes[name] = getattr(module, name)
+        return self.__classes[name]
+
+    def __contains__(self, name):
+        return name in self.__modules
+
+    def __iter__(self):
+        return iter(self.__modules)
+
+    def __len__(self):
+        return len(self.__modules)
+
+
+classes = ModelRegistry({
+    "BaseModel": "models.base_model",
+    "User": "models.user",
+    "Amenity": "models.amenity",
+    "City": "models.city",
+    "Place": "models.place",
+    "Review": "models.review",
+    "State": "models.state",
+})
+
+_lock = threading.Lock()
+
+
+def create_storage():
+    """Returns a storage engine configured from the environment, reloaded"""
+    if os.getenv("HBNB_TYPE_STORAGE") == "db":
+        from models.engine.db_storage import DBStorage
+        engine = DBStorage(
+            os.getenv("HBNB_DB_PATH"),
+            slots=os.getenv("HBNB_STORAGE_SLOTS") == "1",
+        )
+    else:
+        from models.engine.file_storage import FileStorage
+        engine = FileStorage(
+            journal=os.getenv("HBNB_STORAGE_JOURNAL") == "1",
+            compact_after=int(
+                os.getenv("HBNB_STORAGE_COMPACT_AFTER", "10000")),
+            lazy=os.getenv("HBNB_STORAGE_LAZY") == "1",
+            stream=os.getenv("HBNB_STORAGE_STREAM") == "1",
+            slots=os.getenv("HBNB_STORAGE_SLOTS") == "1",
+            codec=os.getenv("HBNB_STORAGE_CODEC", "json"),
+            sharded=os.getenv("HBNB_STORAGE_SHARDED") == "1",
+            threadsafe=os.getenv("HBNB_STORAGE_THREADSAFE") == "1",
+            columnar=os.getenv("HBNB_STORAGE_COLUMNAR") == "1",
+            cached=os.getenv("HBNB_STORAGE_CACHED") == "1",
+        )
+    names = os.getenv("HBNB_STORAGE_CLASSES")
+    engine.reload(names.split(",") if names else None)
+    return engine
+
+
+def __getattr__(name):
+    """Creates `storage` on first access"""
+    global storage
+    if name != "storage":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _lock:
+        if "storage" not in globals():
+            storage = create_storage()
+    return storage
@@ -4,3 +4,8 @@ from models.base_model import BaseModel
 class Amenity(BaseModel):
     """Amenity class that inherits from BaseModel"""
     name = ""
+
+    @property
+    def places(self):
+        """The places offering this amenity"""
+        return self._referrers("Place", "amenity_ids__contains")
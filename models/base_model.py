@@ -3,13 +3,72 @@
 
 import uuid
 from datetime import datetime
-from models import storage
+import models
+from models.engine import stats
+
+TIMESTAMPS = ("created_at", "updated_at")
+
+
+class _Timestamp:
+    """
+    Descriptor for created_at and updated_at.
+
+    An ISO string loaded from storage is kept as-is and only parsed the
+    first time the attribute is read, so objects that are reloaded and
+    saved again without being looked at never parse nor format it.
+    """
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        try:
+            value = obj.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(
+                f"'{type(obj).__name__}' object has no attribute "
+                f"'{self.name}'") from None
+        if type(value) is str:
+            value = obj.__dict__[self.name] = datetime.fromisoformat(value)
+        return value
+
+    def __set__(self, obj, value):
+        obj.__dict__[self.name] = value
+
+
+class _SlotTimestamp:
+    """
+    _Timestamp for the compact classes, backed by a slot.
+    """
+
+    def __init__(self, slot):
+        self.slot = slot
+
+    def __set_name__(self, owner, name):
+        member = owner.__dict__[self.slot]
+        self.load, self.store = member.__get__, member.__set__
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        value = self.load(obj)
+        if type(value) is str:
+            value = datetime.fromisoformat(value)
+            self.store(obj, value)
+        return value
+
+    def __set__(self, obj, value):
+        self.store(obj, value)
 
 
 class BaseModel:
     """
     Base class for all AirBnB clone models with attributes and methods.
     """
+    created_at = _Timestamp()
+    updated_at = _Timestamp()
 
     def __init__(self, *args, **kwargs):
         """
@@ -19,25 +78,44 @@ class BaseModel:
         Otherwise, it creates a new instance with a unique ID and timestamps,
         and stores it in the storage engine.
         """
+        # not stored yet, so there is nothing to tell storage about
+        setattr = object.__setattr__
         if kwargs:
             for key, value in kwargs.items():
                 if key == "__class__":
                     continue
-                if key in ("created_at", "updated_at"):
-                    value = datetime.fromisoformat(value)
-                setattr(self, key, value)
+                if key in TIMESTAMPS and type(value) is not str:
+                    raise TypeError(
+                        f"{key} must be an ISO format str, not "
+                        f"{type(value).__name__}")
+                try:
+                    setattr(self, key, value)
+                except AttributeError:
+                    # a key a read-only property shadows, like
+                    # State.cities: kept, so that it is saved back
+                    self.__dict__[key] = value
         else:
-            self.id = str(uuid.uuid4())
-            self.created_at = datetime.now()
-            self.updated_at = self.created_at
-            storage.new(self)
+            now = datetime.now()
+            setattr(self, "id", str(uuid.uuid4()))
+            setattr(self, "created_at", now)
+            setattr(self, "updated_at", now)
+            models.storage.new(self)
 
     def __str__(self):
         """
         Return string representation of the BaseModel instance.
         Format: [<class name>] (<self.id>) <self.__dict__>
         """
-        return f"[{self.__class__.__name__}] ({self.id}) {self.__dict__}"
+        for name in TIMESTAMPS:
+            getattr(self, name, None)
+        return f"[{self.__class__.__name__}] ({self.id}) {self._attributes()}"
+
+    def __setattr__(self, name, value):
+        """
+        Set an attribute and let storage refresh its indexes.
+        """
+        super().__setattr__(name, value)
+        models.storage.touch(self, name)
 
     def save(self):
         """
@@ -45,15 +123,121 @@ class BaseModel:
         and save the instance to the storage engine.
         """
         self.updated_at = datetime.now()
-        from models import storage
-        storage.save()
+        models.storage.new(self)
+        models.storage.save()
 
     def to_dict(self):
         """
         Return a dictionary representation of the instance.
         """
-        dict_rep = self.__dict__.copy()
+        dict_rep = self._attributes().copy()
         dict_rep["__class__"] = self.__class__.__name__
-        dict_rep["created_at"] = self.created_at.isoformat()
-        dict_rep["updated_at"] = self.updated_at.isoformat()
+        for name in TIMESTAMPS:
+            if type(dict_rep[name]) is not str:
+                dict_rep[name] = dict_rep[name].isoformat()
         return dict_rep
+
+    def _referrers(self, cls, attr):
+        """
+        Return the instances of cls whose attr refers to this instance.
+        Storage indexes the attributes named in each class's _references.
+        """
+        return list(models.storage.query(cls, **{attr: self.id}).values())
+
+    def _attributes(self):
+        """
+        Return the attributes set on the instance, by name. Timestamps
+        that were not read yet are still ISO strings.
+        """
+        return self.__dict__
+
+    @classmethod
+    def compact(cls):
+        """
+        Return a variant of the class that keeps its declared attributes
+        in __slots__ instead of the instance __dict__.
+
+        The variant has the same name and is a subclass of cls. Class
+        level defaults still apply to unset attributes, and attributes
+        that were not declared are kept in the instance __dict__.
+
+        The saving is limited: as neither BaseModel nor the models
+        declare __slots__, instances still have room for a __dict__ and
+        weak references, and every declared attribute takes a slot even
+        if unset. On CPython 3.11 a Place with every attribute set takes
+        about 200 bytes instead of 270, but one with only an id and
+        timestamps takes more than a regular Place.
+        """
+        if issubclass(cls, _CompactModel):
+            return cls
+        if cls not in _compact_classes:
+            defaults = {"_extra": False}
+            for klass in reversed(cls.__mro__):
+                for name, value in vars(klass).items():
+                    if not name.startswith("_") and not callable(value) \
+                            and not hasattr(value, "__get__"):
+                        defaults[name] = value
+            fields = ("id",) + TIMESTAMPS + tuple(
+                name for name in defaults
+                if name not in ("id", "_extra") + TIMESTAMPS)
+            slots = tuple("_" + name if name in TIMESTAMPS else name
+                          for name in fields)
+            _compact_classes[cls] = type(cls.__name__, (_CompactModel, cls), {
+                "__slots__": slots + ("_extra",),
+                "created_at": _SlotTimestamp("_created_at"),
+                "updated_at": _SlotTimestamp("_updated_at"),
+                "__module__": cls.__module__,
+                "__qualname__": cls.__qualname__,
+                "__doc__": cls.__doc__,
+                "_fields": fields,
+                "_defaults": defaults,
+            })
+        return _compact_classes[cls]
+
+
+stats.instrument(BaseModel, "__init__", "to_dict", "save")
+
+_compact_classes = {}
+
+
+class _CompactModel:
+    """
+    Behaviour shared by the slotted classes built by BaseModel.compact().
+    """
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        """Fall back to the class level default of an unset slot."""
+        try:
+            return self._defaults[name]
+        except KeyError:
+            raise AttributeError(
+                f"'{type(self).__name__}' object has no attribute '{name}'"
+            ) from None
+
+    def __init__(self, *args, **kwargs):
+        """Flag attributes loaded into the instance __dict__."""
+        super().__init__(*args, **kwargs)
+        for name in kwargs:
+            if name not in self._fields and name != "__class__":
+                object.__setattr__(self, "_extra", True)
+                break
+
+    def __setattr__(self, name, value):
+        """Remember when an attribute lands in the instance __dict__."""
+        if name not in self._fields:
+            object.__setattr__(self, "_extra", True)
+        super().__setattr__(name, value)
+
+    def _attributes(self):
+        """Gather set slots, then any extra attribute."""
+        attrs = {}
+        get = object.__getattribute__
+        for name, slot in zip(self._fields, self.__slots__):
+            try:
+                attrs[name] = get(self, slot)
+            except AttributeError:
+                pass
+        if self._extra:
+            attrs.update(self.__dict__)
+        return attrs
@@ -5,3 +5,9 @@ class City(BaseModel):
     """City class that inherits from BaseModel"""
     name = ""
     state_id = ""
+    _references = ("state_id",)
+
+    @property
+    def places(self):
+        """The places in this city"""
+        return self._referrers("Place", "city_id")
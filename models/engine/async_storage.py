@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+"""Asyncio facade over a storage engine"""
+import asyncio
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncStorage:
+    """Runs the calls of a storage engine in a worker thread so that
+    serialization and file I/O do not block the event loop.
+
+    Calls go to a single worker, so they run one at a time and in order.
+    Code on the event loop that also uses the engine directly (as
+    BaseModel.save() does) needs a thread-safe engine, such as
+    FileStorage(threadsafe=True) or DBStorage.
+
+    asave() requests made while a save is running are coalesced: they
+    all wait for one more save, started once the running one ends, which
+    writes every change made before it.
+    """
+
+    def __init__(self, storage, executor=None, batch_size=1000):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.__own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="storage")
+        self.__queued = None
+        self.__saving = None
+
+    async def run(self, func, *args, **kwargs):
+        """Returns func(*args, **kwargs), called in the worker"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs))
+
+    async def asave(self):
+        """Saves the storage, or joins the next save if one is running"""
+        if self.__queued is None:
+            self.__queued = asyncio.get_running_loop().create_future()
+            if self.__saving is None:
+                self.__saving = asyncio.ensure_future(self.__save())
+        await asyncio.shield(self.__queued)
+
+    async def __save(self):
+        try:
+            while self.__queued is not None:
+                done, self.__queued = self.__queued, None
+                try:
+                    await self.run(self.storage.save)
+                except Exception as e:
+                    done.set_exception(e)
+                else:
+                    done.set_result(None)
+        finally:
+            self.__saving = None
+
+    async def areload(self):
+        """Reloads the storage"""
+        await self.run(self.storage.reload)
+
+    async def arefresh(self):
+        """Picks up the changes of other processes, see refresh()"""
+        return await self.run(self.storage.refresh)
+
+    async def aall(self, cls=None):
+        """Returns all(cls)"""
+        return await self.run(self.storage.all, cls)
+
+    async def aget(self, cls, id):
+        """Returns get(cls, id)"""
+        return await self.run(self.storage.get, cls, id)
+
+    async def acount(self, cls=None):
+        """Returns count(cls)"""
+        return await self.run(self.storage.count, cls)
+
+    async def aquery(self, cls, **predicates):
+        """Returns query(cls, **predicates)"""
+        return await self.run(self.storage.query, cls, **predicates)
+
+    async def aiterate(self, cls=None, offset=0, limit=None):
+        """Yields iterate(cls, offset, limit), reading the instances in
+        batches of batch_size in the worker"""
+        objects = self.storage.iterate(cls, offset=offset, limit=limit)
+        while True:
+            batch = await self.run(
+                list, itertools.islice(objects, self.batch_size))
+            if not batch:
+                return
+            for obj in batch:
+                yield obj
+
+    def __aiter__(self):
+        return self.aiterate()
+
+    async def aclose(self):
+        """Waits for a running save and stops the worker if it was
+        created here"""
+        if self.__saving is not None:
+            await asyncio.shield(self.__saving)
+        if self.__own_executor:
+            self.executor.shutdown()
@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+"""Bitmap indexes of list attributes, behind the contains and all
+predicates of query()
+
+Every instance gets a row number, and every element of a list attribute
+a bitmap of the rows holding it, such as the Places offering an Amenity.
+The bitmaps are kept in bytearrays, changed a bit at a time, and turned
+into Python ints for a lookup, which intersects them with `&` a machine
+word at a time: "has all of these amenities" costs a few microseconds
+per bitmap before the matching rows are listed.
+"""
+from models.engine.query import MISSING
+
+
+class BitmapIndex:
+    """Keeps a bitmap of rows for each element of the attrs of the
+    instances of model.
+
+    Values that are not lists or tuples, and elements that cannot be
+    hashed, leave the key aside as a candidate of every lookup: callers
+    check conditions on the candidates, as with HashIndex.
+    """
+
+    def __init__(self, attrs, model=None):
+        self.attrs = tuple(attrs)
+        self.defaults = tuple(getattr(model, attr, MISSING)
+                              for attr in self.attrs)
+        self.clear()
+
+    def clear(self):
+        self.keys = []
+        self.rows = {}
+        self.free = []
+        # bytes of every bitmap, doubled as rows are added
+        self.width = 0
+        # attr -> element -> bytearray of its rows, and their number
+        self.bits = {attr: {} for attr in self.attrs}
+        self.counts = {attr: {} for attr in self.attrs}
+        self.aside = {attr: {} for attr in self.attrs}
+        # key -> the elements of attrs it is stored with
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, key, obj):
+        """Stores the elements of an instance or decoded record under key,
+        replacing those stored"""
+        record = obj if type(obj) is dict else obj._attributes()
+        row = self.rows.get(key)
+        if row is None:
+            if self.free:
+                row = self.free.pop()
+                self.keys[row] = key
+            else:
+                row = len(self.keys)
+                self.keys.append(key)
+                if row >> 3 >= self.width:
+                    self.widen()
+            self.rows[key] = row
+            old = None
+        else:
+            old = self.entries[key]
+        entry = []
+        for i, attr in enumerate(self.attrs):
+            value = record.get(attr, self.defaults[i])
+            # the elements, MISSING, or None for a value kept aside
+            items = MISSING if value is MISSING else None
+            if type(value) is list or type(value) is tuple:
+                try:
+                    items = frozenset(value)
+                except TypeError:
+                    pass
+            entry.append(items)
+            if old is not None:
+                if items == old[i]:
+                    continue
+                self.unstore(attr, key, row, old[i])
+            if items is None:
+                self.aside[attr][key] = None
+            elif items is not MISSING:
+                self.store(attr, row, items)
+        self.entries[key] = tuple(entry)
+
+    def discard(self, key):
+        """Removes key from the index"""
+        row = self.rows.pop(key, None)
+        if row is not None:
+            for attr, items in zip(self.attrs, self.entries.pop(key)):
+                self.unstore(attr, key, row, items)
+            self.keys[row] = None
+            self.free.append(row)
+
+    def widen(self):
+        extra = bytes(max(self.width, 64))
+        self.width += len(extra)
+        for bits in self.bits.values():
+            for bitmap in bits.values():
+                bitmap.extend(extra)
+
+    def store(self, attr, row, items):
+        bits, counts = self.bits[attr], self.counts[attr]
+        byte, bit = row >> 3, 1 << (row & 7)
+        for item in items:
+            try:
+                bits[item][byte] |= bit
+                counts[item] += 1
+            except KeyError:
+                bits[item] = bytearray(self.width)
+                bits[item][byte] |= bit
+                counts[item] = 1
+
+    def unstore(self, attr, key, row, items):
+        if items is None or items is MISSING:
+            self.aside[attr].pop(key, None)
+            return
+        bits, counts = self.bits[attr], self.counts[attr]
+        byte, mask = row >> 3, ~(1 << (row & 7)) & 0xFF
+        for item in items:
+            counts[item] -= 1
+            if counts[item]:
+                bits[item][byte] &= mask
+            else:
+                del counts[item], bits[item]
+
+    def bitmap(self, attr, item):
+        """Returns the rows holding item in attr, as an int"""
+        return int.from_bytes(self.bits[attr].get(item, b""), "little")
+
+    def candidates(self, conditions):
+        """Returns the keys the contains and all conditions narrow the
+        conditions down to, or None if there are none"""
+        wanted = {}
+        for attr, op, value in conditions:
+            if attr not in self.bits:
+                continue
+            try:
+                if op == "contains":
+                    items = {value}
+                elif op == "all" and not isinstance(value, str):
+                    items = set(value)
+                else:
+                    continue
+            except TypeError:
+                continue
+            if items:
+                wanted.setdefault(attr, set()).update(items)
+        if not wanted:
+            return None
+        keys = None
+        for attr, items in wanted.items():
+            counts = self.counts[attr]
+            rows = -1
+            # the rarest elements first, which empty the result soonest
+            for item in sorted(items, key=lambda item: counts.get(item, 0)):
+                rows &= self.bitmap(attr, item)
+                if not rows:
+                    break
+            found = self.decode(rows)
+            found.extend(self.aside[attr])
+            if keys is None or len(found) < len(keys):
+                keys = found
+        return keys
+
+    def decode(self, rows):
+        """Returns the keys of the rows set in the int rows"""
+        # the binary digits, lowest row first
+        digits = bin(rows)[:1:-1]
+        keys, found = self.keys, []
+        row = digits.find("1")
+        while row != -1:
+            found.append(keys[row])
+            row = digits.find("1", row + 1)
+        return found
@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+"""Codecs for the snapshot file written by FileStorage
+
+A snapshot maps keys to to_dict() records. JSON snapshots are plain JSON
+text, as they have always been. Binary snapshots start with a header line
+naming their codec, b"HBNB <name>\\n", which load() uses to pick the
+right decoder whatever codec storage is configured with.
+
+The "mmap" codec writes a models.engine.snapshot file, which FileStorage
+opens in place rather than loading.
+
+The pickle codec must only be used on files this application wrote:
+unpickling data from an untrusted source can run arbitrary code.
+"""
+import io
+import json
+import marshal
+import pickle
+
+from models.engine import snapshot
+from models.engine.json_stream import iter_items
+
+MAGIC = b"HBNB "
+
+
+class JSONCodec:
+    """Text JSON, the default and the interchange format"""
+    name = "json"
+
+    @staticmethod
+    def dump(obj_dict, f):
+        text = io.TextIOWrapper(f, encoding="utf-8")
+        json.dump(obj_dict, text)
+        text.detach()
+
+    @staticmethod
+    def items(f, stream=False):
+        text = io.TextIOWrapper(f, encoding="utf-8")
+        if stream:
+            return JSONCodec.stream(text)
+        obj_dict = json.load(text)
+        text.detach()
+        return obj_dict.items()
+
+    @staticmethod
+    def stream(text):
+        try:
+            yield from iter_items(text)
+        finally:
+            text.detach()
+
+
+class PickleCodec:
+    """pickle protocol 5"""
+    name = "pickle"
+
+    @staticmethod
+    def dump(obj_dict, f):
+        pickle.dump(obj_dict, f, protocol=5)
+
+    @staticmethod
+    def items(f, stream=False):
+        return pickle.load(f).items()
+
+
+class MarshalCodec:
+    """marshal, the fastest for the plain types records are made of"""
+    name = "marshal"
+
+    @staticmethod
+    def dump(obj_dict, f):
+        marshal.dump(obj_dict, f)
+
+    @staticmethod
+    def items(f, stream=False):
+        return marshal.load(f).items()
+
+
+class MmapCodec:
+    """JSON records indexed by key, see models.engine.snapshot"""
+    name = "mmap"
+
+    @staticmethod
+    def dump(obj_dict, f):
+        snapshot.write(obj_dict, f)
+
+    @staticmethod
+    def items(f, stream=False):
+        mapped = snapshot.Snapshot.open(f)
+        try:
+            yield from mapped.items()
+        finally:
+            mapped.close()
+
+
+CODECS = {codec.name: codec for codec in (JSONCodec, PickleCodec,
+                                          MarshalCodec, MmapCodec)}
+
+
+def get(name):
+    """Returns the codec registered under name"""
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"unknown storage codec '{name}'") from None
+
+
+def dump(obj_dict, f, name="json"):
+    """Writes obj_dict to the binary file f, with a header unless JSON"""
+    codec = get(name)
+    if codec is not JSONCodec:
+        f.write(MAGIC + codec.name.encode() + b"\n")
+    codec.dump(obj_dict, f)
+
+
+def detect(f):
+    """Returns the codec name of the binary file f, reading its header"""
+    if f.peek(len(MAGIC))[:len(MAGIC)] != MAGIC:
+        return JSONCodec.name
+    return f.readline()[len(MAGIC):].strip().decode()
+
+
+def load(f, stream=False):
+    """Returns the (key, record) pairs of the binary file f, detecting
+    its codec from the header; stream only applies to JSON"""
+    return get(detect(f)).items(f, stream)
@@ -0,0 +1,362 @@
+#!/usr/bin/python3
+"""Columnar mirror of model attributes, behind query() and aggregate()
+
+A ColumnStore keeps chosen attributes of the instances of one class in
+one array per attribute, a row per instance, so that filters and
+aggregates scan compact buffers instead of Python objects. NumPy is used
+to scan them when it is installed; otherwise the stdlib arrays are
+scanned in Python, which is slower but gives the same results.
+"""
+import array
+import math
+
+from models.engine.query import MISSING, OPERATORS, attribute
+
+try:
+    import numpy
+except ImportError:  # the arrays are scanned in Python instead
+    numpy = None
+
+NAN = math.nan
+# code of a missing or unhashable value, and of a free row
+NO_CODE = -1
+
+if numpy is not None:
+    UFUNCS = {
+        "eq": numpy.equal,
+        "ne": numpy.not_equal,
+        "lt": numpy.less,
+        "lte": numpy.less_equal,
+        "gt": numpy.greater,
+        "gte": numpy.greater_equal,
+    }
+
+
+def is_number(value):
+    return type(value) is int or type(value) is float
+
+
+def summable(value):
+    """Tells whether value is a number summarize() adds up: not a bool,
+    NaN nor an infinity"""
+    return type(value) is int or \
+        type(value) is float and math.isfinite(value)
+
+
+def hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def pairs(objects, attr, by, model):
+    """Yields the (value of by, value of attr) pairs of the instances or
+    records for summarize(), skipping those that cannot be summarized"""
+    for obj in objects:
+        value = attribute(obj, attr, model)
+        group = None if by is None else attribute(obj, by, model)
+        if summable(value) and group is not MISSING and hashable(group):
+            yield group, value
+
+
+def summarize(pairs, integral=False):
+    """Returns the count, sum, min, max and mean of the (group, number)
+    pairs by group; integral figures are returned as int"""
+    groups = {}
+    for group, value in pairs:
+        figures = groups.get(group)
+        if figures is None:
+            groups[group] = [1, value, value, value]
+        else:
+            figures[0] += 1
+            figures[1] += value
+            if value < figures[2]:
+                figures[2] = value
+            elif value > figures[3]:
+                figures[3] = value
+    return {group: figures_of(*figures, integral)
+            for group, figures in groups.items()}
+
+
+def figures_of(count, total, low, high, integral):
+    if integral:
+        total, low, high = int(total), int(low), int(high)
+    return {"count": count, "sum": total, "min": low, "max": high,
+            "mean": total / count}
+
+
+class ColumnStore:
+    """Keeps attrs of the instances of model in one array each.
+
+    Attributes whose class default is an int or a float are stored as
+    doubles, NaN standing for a value that is not a number and a bool
+    for 0 or 1, which filters compare like matches() does but figures
+    leave out, as they leave out NaN and infinities; the others as codes
+    into a table of their distinct values. Rows of deleted instances are
+    reused. A row satisfies a condition exactly when query.matches()
+    would hold for the value of its instance.
+    """
+
+    def __init__(self, attrs, model):
+        self.attrs = tuple(attrs)
+        self.numeric = {attr for attr in self.attrs
+                        if is_number(getattr(model, attr, None))}
+        self.integral = {attr for attr in self.numeric
+                         if type(getattr(model, attr)) is int}
+        self.model = model
+        self.clear()
+
+    def clear(self):
+        self.keys = []
+        self.live = array.array("b")
+        self.rows = {}
+        self.free = []
+        self.columns = {attr: array.array("d" if attr in self.numeric
+                                          else "q")
+                        for attr in self.attrs}
+        self.values = {attr: [] for attr in self.attrs
+                       if attr not in self.numeric}
+        self.codes = {attr: {} for attr in self.values}
+        # rows of the numeric columns holding a bool
+        self.bools = {attr: set() for attr in self.numeric}
+        # what add() stores each attribute with, and its class default
+        self.layout = [(attr, self.columns[attr], attr in self.numeric,
+                        self.codes.get(attr), self.bools.get(attr),
+                        getattr(self.model, attr, MISSING))
+                       for attr in self.attrs]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, key, obj):
+        """Stores the attributes of an instance or decoded record under
+        key, replacing what was stored"""
+        row = self.rows.get(key)
+        if row is None:
+            if self.free:
+                row = self.free.pop()
+                self.keys[row] = key
+                self.live[row] = 1
+            else:
+                row = len(self.keys)
+                self.keys.append(key)
+                self.live.append(1)
+                for column in self.columns.values():
+                    column.append(0)
+            self.rows[key] = row
+        record = obj if type(obj) is dict else obj._attributes()
+        for attr, column, numeric, codes, bools, default in self.layout:
+            value = record.get(attr, default)
+            if numeric:
+                if bools:
+                    bools.discard(row)
+                if type(value) is not float and type(value) is not int:
+                    if type(value) is bool:
+                        bools.add(row)
+                    else:
+                        value = NAN
+                try:
+                    column[row] = value
+                except OverflowError:
+                    column[row] = NAN
+            else:
+                try:
+                    column[row] = codes[value]
+                except (KeyError, TypeError):
+                    column[row] = self.code(attr, value)
+
+    def discard(self, key):
+        """Removes key from the store"""
+        row = self.rows.pop(key, None)
+        if row is not None:
+            self.keys[row] = None
+            self.live[row] = 0
+            for attr, column in self.columns.items():
+                column[row] = NAN if attr in self.numeric else NO_CODE
+            for bools in self.bools.values():
+                bools.discard(row)
+            self.free.append(row)
+
+    def code(self, attr, value, add=True):
+        """Returns the code of value in the table of attr, or NO_CODE"""
+        if value is MISSING:
+            return NO_CODE
+        codes = self.codes[attr]
+        try:
+            code = codes.get(value)
+            if code is None and add:
+                code = codes[value] = len(self.values[attr])
+                self.values[attr].append(value)
+        except TypeError:
+            return NO_CODE
+        return NO_CODE if code is None else code
+
+    def covers(self, conditions):
+        """Tells whether select() evaluates every condition"""
+        return all(self.evaluates(*condition) for condition in conditions)
+
+    def evaluates(self, attr, op, value):
+        if attr not in self.columns:
+            return False
+        if attr in self.numeric:
+            if op == "in":
+                try:
+                    return all(is_number(item) for item in value)
+                except TypeError:
+                    return False
+            return op in OPERATORS and op not in ("contains", "all") \
+                and is_number(value)
+        if op == "in":
+            if isinstance(value, str):
+                # tests for a substring
+                return False
+            try:
+                return all(hashable(item) for item in value)
+            except TypeError:
+                return False
+        return op in ("eq", "ne") and hashable(value)
+
+    def select(self, conditions):
+        """Returns the keys of the rows satisfying the conditions this
+        store evaluates, or None if it evaluates none of them"""
+        rows = self.matching(conditions)
+        if rows is None:
+            return None
+        keys = self.keys
+        return [keys[row] for row in rows if keys[row] is not None]
+
+    def matching(self, conditions):
+        conditions = [condition for condition in conditions
+                      if self.evaluates(*condition)]
+        if not conditions:
+            return None
+        if numpy is not None:
+            return numpy.flatnonzero(self.mask(conditions)).tolist()
+        rows = [row for row, live in enumerate(self.live) if live]
+        for attr, op, value in conditions:
+            test = self.test(attr, op, value)
+            column = self.columns[attr]
+            rows = [row for row in rows if test(column[row])]
+        return rows
+
+    def test(self, attr, op, value):
+        """Returns the test of a condition on the items of a column"""
+        if attr in self.numeric:
+            compare = OPERATORS[op]
+            if op == "ne":
+                # a value that is not a number differs from any number
+                return lambda item: item != item or item != value
+            return lambda item: item == item and compare(item, value)
+        if op == "in":
+            codes = {self.code(attr, item, add=False) for item in value}
+            codes.discard(NO_CODE)
+            return codes.__contains__
+        code = self.code(attr, value, add=False)
+        if op == "ne":
+            return lambda item: item != code or code == NO_CODE
+        return lambda item: item == code and code != NO_CODE
+
+    def mask(self, conditions):
+        """Returns the boolean array of the live rows satisfying the
+        conditions this store evaluates"""
+        selected = self.view("live") != 0
+        for attr, op, value in conditions:
+            if not self.evaluates(attr, op, value):
+                continue
+            column = self.view(attr)
+            if attr in self.numeric:
+                if op == "in":
+                    selected &= numpy.isin(column, list(value))
+                else:
+                    selected &= UFUNCS[op](column, value)
+                continue
+            if op == "in":
+                codes = [self.code(attr, item, add=False) for item in value]
+                codes = [code for code in codes if code != NO_CODE]
+                selected &= numpy.isin(column, codes)
+                continue
+            code = self.code(attr, value, add=False)
+            if op == "ne":
+                if code != NO_CODE:
+                    selected &= column != code
+            elif code == NO_CODE:
+                selected[:] = False
+            else:
+                selected &= column == code
+        return selected
+
+    def view(self, attr):
+        """Returns a NumPy view of the column of attr, or of live"""
+        if attr == "live":
+            column, dtype = self.live, numpy.int8
+        else:
+            column = self.columns[attr]
+            dtype = numpy.float64 if attr in self.numeric else numpy.int64
+        if not len(column):
+            return numpy.zeros(0, dtype)
+        return numpy.frombuffer(column, dtype)
+
+    def aggregates(self, attr, by=None):
+        """Tells whether aggregate() can summarize attr by by"""
+        return attr in self.numeric and (
+            by is None or (by in self.columns and by not in self.numeric))
+
+    def aggregate(self, attr, by=None, conditions=()):
+        """Returns the figures of summarize() for the numbers in the
+        column of attr, over the rows satisfying the conditions, by value
+        of by or for all of them"""
+        integral = attr in self.integral
+        if numpy is not None:
+            groups = self.aggregate_arrays(attr, by, conditions, integral)
+        else:
+            rows = self.matching(conditions)
+            if rows is None:
+                # free rows only hold NaN and NO_CODE
+                rows = range(len(self.keys))
+            bools = self.bools[attr]
+            if bools:
+                rows = [row for row in rows if row not in bools]
+            column = self.columns[attr]
+            if by is None:
+                pairs = ((None, column[row]) for row in rows)
+            else:
+                codes = self.columns[by]
+                pairs = ((codes[row], column[row]) for row in rows
+                         if codes[row] != NO_CODE)
+            groups = summarize(((group, value) for group, value in pairs
+                                if math.isfinite(value)), integral)
+        if by is None:
+            return groups.get(None)
+        values = self.values[by]
+        return {values[code]: figures for code, figures in groups.items()}
+
+    def aggregate_arrays(self, attr, by, conditions, integral):
+        column = self.view(attr)
+        selected = numpy.isfinite(column)
+        if self.bools[attr]:
+            selected[list(self.bools[attr])] = False
+        if conditions:
+            selected &= self.mask(conditions)
+        if by is None:
+            column = column[selected]
+            if not len(column):
+                return {}
+            return {None: figures_of(len(column), float(column.sum()),
+                                     float(column.min()),
+                                     float(column.max()), integral)}
+        codes = self.view(by)
+        selected &= codes != NO_CODE
+        codes, column = codes[selected], column[selected]
+        size = len(self.values[by])
+        counts = numpy.bincount(codes, minlength=size)
+        sums = numpy.bincount(codes, weights=column, minlength=size)
+        lows = numpy.full(size, numpy.inf)
+        numpy.minimum.at(lows, codes, column)
+        highs = numpy.full(size, -numpy.inf)
+        numpy.maximum.at(highs, codes, column)
+        return {code: figures_of(int(counts[code]), float(sums[code]),
+                                 float(lows[code]), float(highs[code]),
+                                 integral)
+                for code in numpy.flatnonzero(counts).tolist()}
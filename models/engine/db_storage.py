@@ -0,0 +1,398 @@
+#!/usr/bin/python3
+"""DBStorage module: keeps instances in a local SQLite database"""
+import functools
+import json
+import sqlite3
+import threading
+
+from models.engine import stats
+from models.engine.file_storage import model_classes
+from models.engine.columns import pairs, summarize
+from models.engine.geo import GridIndex
+from models.engine.ranges import is_number
+from models.engine.text import TextIndex
+from models.engine.query import attribute, matches, parse
+
+# methods run one at a time, holding the lock of the storage
+LOCKED = ("all", "get", "count", "query", "ordered", "aggregate", "within",
+          "nearby", "nearest", "search", "add_index", "new", "touch",
+          "delete", "begin", "commit", "save", "flush", "reload", "refresh",
+          "clear", "classes", "close")
+# rows iterate() reads at a time
+BATCH = 1000
+
+
+class DBStorage:
+    """SQLite storage engine with the same interface as FileStorage.
+
+    Every model class has its own table of (id, data) rows, id being the
+    primary key and data the to_dict() of the instance as JSON. new() and
+    delete() write the affected row inside the current transaction and
+    save() commits it, so a change only ever touches its own row. Loaded
+    instances are kept in an identity map so that a row is built at most
+    once per reload().
+
+    refresh() drops the identity map when another process has committed
+    since the last call, which SQLite tells through PRAGMA data_version.
+
+    query() pushes equality predicates down to SQL on json_extract() of
+    the data column; add_index() creates an expression index for them,
+    as it does for the attributes each model lists in _references.
+
+    ordered(), within(), nearby(), nearest() and search() read the table
+    of the class for each call; only FileStorage keeps range, grid and
+    text indexes up to date.
+
+    The connection is shared by every thread using the storage, such as
+    the worker of an AsyncStorage, and the public methods run one at a
+    time; iterate() holds the lock while it reads each batch of rows.
+    """
+    __db_path = "file.db"
+
+    def __init__(self, db_path=None, slots=False):
+        if db_path is not None:
+            self.__db_path = db_path
+        self.slots = slots
+        self.__connection = None
+        self.__tables = None
+        self.__objects = {}
+        # key -> instance changed by attribute assignment since new()
+        self.__dirty = {}
+        self.__models = None
+        self.__batch = False
+        self.__version = None
+        self.__lock = threading.RLock()
+        for name in LOCKED:
+            setattr(self, name, self.__locked(getattr(self, name)))
+
+    def all(self, cls=None):
+        """Returns the stored instances, optionally only those of cls"""
+        return {f"{obj.__class__.__name__}.{obj.id}": obj
+                for obj in self.iterate(cls)}
+
+    def iterate(self, cls=None, offset=0, limit=None):
+        """Yields the instances, optionally of cls only, from the
+        offset-th on and at most limit of them, as rows are read"""
+        names = [self.__class_name(cls)] if cls is not None else \
+            list(self.classes())
+        for name in names:
+            if limit is not None and limit <= 0:
+                return
+            with self.__lock:
+                if name not in self.__existing():
+                    continue
+                db = self.__db()
+                if offset:
+                    size = db.execute(
+                        f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+                    if size <= offset:
+                        offset -= size
+                        continue
+                # LIMIT -1 reads every row
+                rows = db.execute(
+                    f'SELECT data FROM "{name}" LIMIT ? OFFSET ?',
+                    (-1 if limit is None else limit, offset))
+                offset = 0
+            while True:
+                with self.__lock:
+                    batch = rows.fetchmany(BATCH)
+                    objects = []
+                    for (data,) in batch:
+                        record = json.loads(data)
+                        objects.append(self.__build(
+                            f"{name}.{record['id']}", record))
+                if not batch:
+                    break
+                if limit is not None:
+                    limit -= len(objects)
+                yield from objects
+
+    def get(self, cls, id):
+        """Returns the instance of cls with this id, or None"""
+        name = self.__class_name(cls)
+        key = f"{name}.{id}"
+        if key in self.__objects:
+            return self.__objects[key]
+        if name not in self.__existing():
+            return None
+        row = self.__db().execute(
+            f'SELECT data FROM "{name}" WHERE id = ?', (id,)).fetchone()
+        return self.__build(key, json.loads(row[0])) if row else None
+
+    def count(self, cls=None):
+        """Returns the number of objects, optionally of a single class"""
+        names = [self.__class_name(cls)] if cls is not None else \
+            list(self.classes())
+        return sum(
+            self.__db().execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+            for name in names if name in self.__existing())
+
+    def query(self, cls, **predicates):
+        """Returns the instances of cls matching the predicates, by key,
+        e.g. query(Place, city_id=city.id, max_guest__gte=4)"""
+        name = self.__class_name(cls)
+        conditions = parse(predicates)
+        if name not in self.__existing():
+            return {}
+        # the SQL conditions read the rows
+        self.__write_dirty()
+        model = self.classes().get(name)
+        where, params = [], []
+        for attr, op, value in conditions:
+            if op != "eq" or not attr.isidentifier() or \
+                    type(value) not in (str, int, float):
+                continue
+            expr = self.__extract(attr)
+            if attribute({}, attr, model) == value:
+                # rows without the attribute hold the class default
+                where.append(f"({expr} = ? OR {expr} IS NULL)")
+            else:
+                where.append(f"{expr} = ?")
+            params.append(value)
+        sql = f'SELECT data FROM "{name}"'
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        found = {}
+        for (data,) in self.__db().execute(sql, params):
+            record = json.loads(data)
+            key = f"{name}.{record['id']}"
+            obj = self.__build(key, record)
+            if matches(obj, conditions):
+                found[key] = obj
+        return found
+
+    def ordered(self, cls, attr, offset=0, limit=None, reverse=False,
+                **predicates):
+        """Returns the instances of cls matching the predicates whose attr
+        is a number, by attr then key, from the offset-th on"""
+        model = self.classes().get(self.__class_name(cls))
+        found = []
+        for key, obj in self.query(cls, **predicates).items():
+            value = attribute(obj, attr, model)
+            if is_number(value):
+                found.append((value, key, obj))
+        found.sort(key=lambda item: item[:2], reverse=reverse)
+        stop = None if limit is None else offset + limit
+        return [obj for _, _, obj in found[offset:stop]]
+
+    def aggregate(self, cls, attr, by=None, **predicates):
+        """Returns the count, sum, min, max and mean of the numbers attr
+        holds in the instances of cls matching the predicates, or None if
+        there are none; by value of the attribute by if given"""
+        model = self.classes().get(self.__class_name(cls))
+        groups = summarize(
+            pairs(self.query(cls, **predicates).values(), attr, by, model),
+            type(getattr(model, attr, None)) is int)
+        return groups.get(None) if by is None else groups
+
+    def within(self, cls, south, west, north, east):
+        """Returns the instances of cls located in the box, by key; west >
+        east for a box crossing the antimeridian"""
+        grid, objects = self.__grid(cls)
+        return {key: objects[key]
+                for key, _ in grid.within(south, west, north, east)}
+
+    def nearby(self, cls, latitude, longitude, radius):
+        """Returns the (distance, instance) pairs of the instances of cls
+        within radius kilometres of the point, nearest first"""
+        grid, objects = self.__grid(cls)
+        return [(km, objects[key])
+                for km, key in grid.nearby(latitude, longitude, radius)]
+
+    def nearest(self, cls, latitude, longitude, k=1):
+        """Returns the (distance, instance) pairs of the k instances of
+        cls nearest to the point, nearest first"""
+        grid, objects = self.__grid(cls)
+        return [(km, objects[key])
+                for km, key in grid.nearest(latitude, longitude, k)]
+
+    def search(self, cls, text, limit=10):
+        """Returns the (score, instance) pairs of the limit instances of
+        cls whose _text attributes best match the words of text, best
+        first"""
+        model = self.classes().get(self.__class_name(cls))
+        if not hasattr(model, "_text"):
+            return []
+        index = TextIndex(model._text, model)
+        objects = self.all(cls)
+        for key, obj in objects.items():
+            index.add(key, obj)
+        return [(score, objects[key])
+                for score, key in index.search(text, limit)]
+
+    def add_index(self, cls, attr):
+        """Creates an index on attr for the table of cls"""
+        name = self.__class_name(cls)
+        if not attr.isidentifier():
+            raise ValueError(f"invalid attribute name {attr!r}")
+        self.__table(name)
+        self.__db().execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}.{attr}" '
+            f'ON "{name}" ({self.__extract(attr)})')
+
+    def new(self, obj):
+        """Adds obj to the current transaction, or updates its row"""
+        name = obj.__class__.__name__
+        self.__table(name)
+        data = json.dumps(obj.to_dict())
+        self.__db().execute(
+            f'INSERT OR REPLACE INTO "{name}" (id, data) VALUES (?, ?)',
+            (obj.id, data))
+        if stats.enabled:
+            stats.count("bytes_written", len(data))
+            stats.count("objects_serialized")
+        key = f"{name}.{obj.id}"
+        self.__objects[key] = obj
+        self.__dirty.pop(key, None)
+
+    def touch(self, obj, attr):
+        """Marks a stored instance as changed after attr was set, so that
+        the next flush() rewrites its row"""
+        key = f"{obj.__class__.__name__}.{getattr(obj, 'id', None)}"
+        if self.__objects.get(key) is obj:
+            self.__dirty[key] = obj
+
+    def delete(self, obj=None):
+        """Deletes the row of obj in the current transaction"""
+        if obj is None:
+            return
+        name = obj.__class__.__name__
+        self.__objects.pop(f"{name}.{obj.id}", None)
+        self.__dirty.pop(f"{name}.{obj.id}", None)
+        if name in self.__existing():
+            self.__db().execute(f'DELETE FROM "{name}" WHERE id = ?',
+                                (obj.id,))
+
+    def begin(self):
+        """Starts a batch: save() keeps the transaction open until
+        commit()"""
+        self.__batch = True
+
+    def commit(self):
+        """Ends the batch and commits the transaction"""
+        self.__batch = False
+        self.flush()
+
+    def save(self):
+        """Commits the current transaction, unless inside a batch"""
+        if not self.__batch:
+            self.flush()
+
+    def flush(self):
+        """Writes the instances changed since new() and commits the
+        current transaction now"""
+        self.__write_dirty()
+        if self.__connection is not None:
+            self.__connection.commit()
+
+    def reload(self, classes=None):
+        """Opens the database and forgets the instances built so far;
+        tables are only read when used, whatever classes is"""
+        self.__db()
+        self.__objects = {}
+        self.__dirty = {}
+
+    def refresh(self):
+        """Forgets the instances built so far if another connection has
+        committed since, and tells whether it had"""
+        version = self.__db().execute("PRAGMA data_version").fetchone()[0]
+        if version == self.__version:
+            return False
+        changed = self.__version is not None
+        self.__version = version
+        if changed:
+            # changed instances stay, to be written on the next flush()
+            self.__objects = dict(self.__dirty)
+        return changed
+
+    def clear(self):
+        """Deletes every row of every table"""
+        for name in self.__existing():
+            self.__db().execute(f'DELETE FROM "{name}"')
+        self.__dirty = {}
+        self.flush()
+        self.__objects = {}
+
+    def classes(self):
+        """Returns the model classes to build instances from, by name"""
+        if self.__models is None:
+            self.__models = model_classes(self.slots)
+            for name, model in self.__models.items():
+                for attr in getattr(model, "_references", ()):
+                    self.add_index(name, attr)
+        return self.__models
+
+    def close(self):
+        """Commits and closes the connection"""
+        if self.__connection is not None:
+            self.flush()
+            self.__connection.close()
+            self.__connection = None
+
+    def __grid(self, cls):
+        """Returns a grid index of the instances of cls, which are read
+        for each query, and the instances by key"""
+        model = self.classes().get(self.__class_name(cls))
+        grid = GridIndex(*getattr(model, "_location", ()), model=model)
+        if not hasattr(model, "_location"):
+            return grid, {}
+        objects = self.all(cls)
+        for key, obj in objects.items():
+            grid.add(key, obj)
+        return grid, objects
+
+    def __build(self, key, record):
+        """Returns the identity map instance for key, built from record"""
+        if key not in self.__objects:
+            self.__objects[key] = self.classes()[record["__class__"]](
+                **record)
+        return self.__objects[key]
+
+    def __write_dirty(self):
+        """Writes the rows of the instances changed since new(), in the
+        current transaction"""
+        for obj in list(self.__dirty.values()):
+            self.new(obj)
+
+    def __locked(self, method):
+        """Wraps method with the lock of the storage"""
+        @functools.wraps(method)
+        def locked(*args, **kwargs):
+            with self.__lock:
+                return method(*args, **kwargs)
+        return locked
+
+    def __db(self):
+        if self.__connection is None:
+            self.__connection = sqlite3.connect(
+                self.__db_path, check_same_thread=False)
+            self.__tables = None
+        return self.__connection
+
+    def __existing(self):
+        """Returns the names of the model tables present in the database"""
+        if self.__tables is None:
+            rows = self.__db().execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'")
+            self.__tables = {name for (name,) in rows}
+        return self.__tables
+
+    def __table(self, name):
+        if name not in self.__existing():
+            if name not in self.classes():
+                raise KeyError(f"unknown model class {name}")
+            self.__db().execute(
+                f'CREATE TABLE IF NOT EXISTS "{name}" '
+                "(id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+            self.__tables.add(name)
+
+    @staticmethod
+    def __extract(attr):
+        return f"json_extract(data, '$.{attr}')"
+
+    @staticmethod
+    def __class_name(cls):
+        return cls if isinstance(cls, str) else cls.__name__
+
+
+stats.instrument(DBStorage, "new", "save", "reload")
@@ -1,52 +1,1226 @@
+#!/usr/bin/python3
+"""FileStorage module: serializes instances to a JSON file and back"""
+import contextlib
+import functools
+import itertools
 import json
+import marshal
+import os
+
+try:
+    import fcntl
+except ImportError:  # no advisory locks on this platform
+    fcntl = None
+
+from models.engine import codecs, stats
+from models.engine.bitmaps import BitmapIndex
+from models.engine.columns import ColumnStore, pairs, summarize
+from models.engine.geo import GridIndex
+from models.engine.ranges import RangeIndex, is_number
+from models.engine.text import TextIndex
+from models.engine.locks import NOLOCK, RWLock
+from models.engine.snapshot import Snapshot
+from models.engine.query import (
+    MISSING, HashIndex, attribute, candidates, matches, parse)
 
 
 class FileStorage:
+    """Keeps every object in memory and persists them to a JSON file.
+
+    In journal mode save() does not rewrite the whole file: it appends one
+    JSON line per created, updated or deleted object to a log next to the
+    snapshot. reload() replays that log on top of the snapshot, and the log
+    is folded back into a fresh snapshot once it holds `compact_after`
+    records.
+
+    A per-class index of keys is kept alongside __objects so that
+    all(cls) and count(cls) cost time proportional to the result.
+
+    In lazy mode reload() only keeps the decoded records; an instance is
+    built the first time it is reached through all() or get().
+
+    query() filters the instances of a class with attribute predicates.
+    Hash indexes added with add_index() are kept up to date by new(),
+    delete(), reload() and touch(), which BaseModel calls whenever an
+    attribute is set, and answer equality lookups directly. The
+    attributes a model lists in _references are indexed this way, which
+    backs the relationship accessors such as State.cities.
+
+    add_columns() mirrors attributes of a class into a ColumnStore of
+    models.engine.columns, kept up to date the same way, which query()
+    filters with and aggregate() summarizes, e.g. the price per city of
+    the Places. In columnar mode the attributes a model lists in
+    _columns are mirrored this way.
+
+    add_grid() maintains a GridIndex of models.engine.geo on the
+    coordinates of a class, the way add_columns() does, for within(),
+    nearby() and nearest(). Models listing their coordinates in
+    _location, such as Place, always have one.
+
+    add_text_index() maintains a TextIndex of models.engine.text on text
+    attributes of a class for search(), which ranks matches with BM25;
+    models listing them in _text, such as Review and Place, get one on
+    their first search(), or at once in threadsafe mode. Text indexes are
+    written next to the snapshot (file.json.search) with a full snapshot
+    once a tenth of their documents changed, so that the first search()
+    of a new process only tokenizes the instances whose text changed
+    since.
+
+    add_range_index() keeps numeric attributes of a class sorted in a
+    RangeIndex of models.engine.ranges, which answers range predicates
+    of query() and walks the pages of ordered() in order, and
+    add_bitmap_index() keeps a BitmapIndex of models.engine.bitmaps of
+    the elements of list attributes, which intersects contains and all
+    predicates. Models list them in _ranges and _bitmaps, such as the
+    prices and amenities of Place; outside of thread-safe mode those are
+    built the first time the class is queried, so that processes that
+    never filter it do not maintain them. query() reads the smallest set
+    of candidates the indexes give.
+
+    The snapshot is JSON unless another codec of models.engine.codecs,
+    such as "marshal" or "pickle", is configured; export() can always
+    write a JSON copy.
+
+    In sharded mode every class has its own snapshot file next to the
+    main one (file.State.json for State), and a write only rewrites the
+    files of the classes that changed since the last one. reload() can
+    be given the classes to load; the files of the others are only read
+    when their class is first used, and journal records of unloaded
+    classes are kept until then.
+
+    A snapshot written with the "mmap" codec is not loaded by reload():
+    it is mapped into memory and get() decodes the record it asks for
+    through the index of the file, which suits processes that only look
+    up a few objects (best with journal mode, whose saves do not rewrite
+    the snapshot). The rest of the file is loaded the first time all(),
+    iterate(), count() or query() need it.
+
+    A JSON snapshot is written from the encoded text of each object.
+    The text of records not built into instances yet is kept from one
+    write to the next; in cached mode that of instances too, until
+    touch(), new() or delete() drops it, so that a save only encodes the
+    objects changed since. Changes must then go through attribute
+    assignment or new(), as BaseModel.save() does: an in-place change,
+    such as appending to a list attribute, is not written until then.
+
+    In slots mode objects are built from the BaseModel.compact() variant
+    of their class, which keeps declared attributes in __slots__; it
+    only saves memory on objects that set most of them.
+
+    Several processes can share the files: writes hold an advisory lock
+    (file.json.lock) and first pick up what other processes wrote, so
+    that none of their changes is overwritten. refresh() does the same
+    on demand: it compares the size, mtime and inode of the files read
+    with what they were, re-reads the snapshot only if it was replaced
+    and otherwise applies the journal records added since, keeping the
+    changes this process has not written yet.
+
+    In thread-safe mode the public methods are wrapped with a
+    readers-writer lock: all(), get(), count(), query() and iterate() run
+    in parallel while changes and writes run one at a time. Reads that
+    still have to build objects (lazy records, a mapped snapshot, unread
+    class files) take the write lock, and all() returns a copy of the
+    objects, which other threads cannot change while it is iterated.
+    """
     __file_path = "file.json"
     __objects = {}
 
+    def __init__(self, journal=False, compact_after=10000, lazy=False,
+                 stream=False, slots=False, codec="json", sharded=False,
+                 threadsafe=False, columnar=False, cached=False):
+        self.journal = journal
+        self.compact_after = compact_after
+        self.lazy = lazy
+        self.stream = stream
+        self.slots = slots
+        self.codec = codecs.get(codec).name
+        self.sharded = sharded
+        self.columnar = columnar
+        self.cached = cached
+        self.__raw = {}
+        self.__models = None
+        self.__pending = {}
+        self.__log_size = 0
+        self.__by_class = {}
+        self.__indexed = None
+        self.__attr_indexes = {}
+        self.__columns = {}
+        self.__grids = {}
+        self.__texts = {}
+        self.__ranges = {}
+        self.__bitmaps = {}
+        # classes whose _ranges and _bitmaps are not indexed yet
+        self.__unbuilt = set()
+        # classes whose _text is not indexed yet
+        self.__untexted = set()
+        # while loading, classes whose hash indexes are to be filled
+        self.__unfilled = None
+        # stores of add_columns(), add_grid() and the like, by class name
+        self.__stores = {}
+        # attributes that indexes or stores hold, by class name
+        self.__watched = {}
+        self.__batch = False
+        self.__dirty = False
+        self.__loaded = set()
+        self.__changed = set()
+        self.__deferred = {}
+        self.__mapped = None
+        self.__unmapped = set()
+        self.__fragments = {}
+        self.__encoded = 0
+        self.__seen = {}
+        self.__log_at = (None, 0)
+        self.__flocked = False
+        self.threadsafe = threadsafe
+        self.__lock = NOLOCK
+        if threadsafe:
+            self.__lock = RWLock()
+            for name in READS:
+                setattr(self, name, self.__reader(getattr(self, name)))
+            for name in WRITES:
+                setattr(self, name, self.__writer(getattr(self, name)))
+            self.iterate = self.__locked_iterate
+
+    @property
+    def log_path(self):
+        """Path of the journal written next to the snapshot"""
+        return self.__file_path + ".log"
+
+    @property
+    def search_path(self):
+        """Path of the text indexes written next to the snapshot"""
+        return self.__file_path + ".search"
+
+    def shard_path(self, cls):
+        """Path of the snapshot file of cls in sharded mode"""
+        root, ext = os.path.splitext(self.__file_path)
+        return f"{root}.{self.__class_name(cls)}{ext}"
+
     def clear(self):
+        with self.__flock(exclusive=True):
+            self.__clear()
+
+    def __clear(self):
+        self.__unmap()
         self.__objects = {}
+        self.__raw = {}
+        self.__pending = {}
+        self.__changed = set()
+        self.__deferred = {}
+        self.__remove_log()
+        try:
+            os.remove(self.search_path)
+        except FileNotFoundError:
+            pass
+        if self.sharded:
+            self.__loaded = set(self.classes())
+            for name in self.__loaded:
+                try:
+                    os.remove(self.shard_path(name))
+                except FileNotFoundError:
+                    pass
+                self.__seen[self.shard_path(name)] = None
+            return
         with open(self.__file_path, "w") as f:
             json.dump({}, f)
+        self.__seen[self.__file_path] = self.__signature(self.__file_path)
+
+    def all(self, cls=None):
+        """Returns __objects, or only the instances of cls (class or name)"""
+        if cls is None:
+            self.__need()
+            for key in list(self.__raw):
+                self.__hydrate(key)
+            if self.threadsafe:
+                return dict(self.__objects)
+            return self.__objects
+        objects = self.__objects
+        name = self.__class_name(cls)
+        self.__need(name)
+        keys = self.__synced().get(name, {})
+        for key in keys:
+            if key in self.__raw:
+                self.__hydrate(key)
+        return {key: objects[key] for key in keys if key in objects}
+
+    def iterate(self, cls=None, offset=0, limit=None):
+        """Yields the instances, optionally of cls only, from the
+        offset-th on and at most limit of them, one at a time and building
+        each only when it is reached"""
+        for key in self.__keys(cls, offset, limit):
+            if key in self.__raw:
+                yield self.__hydrate(key)
+            elif key in self.__objects:
+                yield self.__objects[key]
+
+    def __keys(self, cls=None, offset=0, limit=None):
+        """Returns the keys of every object, or of those of cls, from the
+        offset-th on and at most limit of them"""
+        if cls is None:
+            self.__need()
+            keys = itertools.chain(self.__objects, self.__raw)
+        else:
+            name = self.__class_name(cls)
+            self.__need(name)
+            keys = self.__synced().get(name, ())
+        # a copy, as building instances moves their keys
+        stop = None if limit is None else offset + limit
+        return list(itertools.islice(keys, offset, stop))
+
+    def __locked_iterate(self, cls=None, offset=0, limit=None):
+        """iterate() in thread-safe mode, holding a lock at each step
+        rather than while the caller runs"""
+        for key in self.__reader(self.__keys)(cls, offset, limit):
+            obj = self.get(*key.split(".", 1))
+            if obj is not None:
+                yield obj
 
-    def all(self):
-        return self.__objects
+    def get(self, cls, id):
+        """Returns the instance of cls with this id, or None"""
+        name = self.__class_name(cls)
+        self.__load_shard(name)
+        key = f"{name}.{id}"
+        self.__fetch(key)
+        if key in self.__raw:
+            return self.__hydrate(key)
+        return self.__objects.get(key)
+
+    def count(self, cls=None):
+        """Returns the number of objects, optionally of a single class"""
+        if cls is None:
+            self.__need()
+            return len(self.__objects) + len(self.__raw)
+        name = self.__class_name(cls)
+        self.__need(name)
+        return len(self.__synced().get(name, ()))
+
+    def query(self, cls, **predicates):
+        """Returns the instances of cls matching the predicates, by key,
+        e.g. query(Place, city_id=city.id, max_guest__gte=4)"""
+        name = self.__class_name(cls)
+        conditions = parse(predicates)
+        self.__need(name)
+        by_class = self.__synced()
+        keys = self.__candidates(name, conditions)
+        if keys is None:
+            keys = by_class.get(name, {})
+        return dict(self.__matching(name, keys, conditions))
+
+    def ordered(self, cls, attr, offset=0, limit=None, reverse=False,
+                **predicates):
+        """Returns the instances of cls matching the predicates whose attr
+        is a number, by attr then key, from the offset-th on, e.g.
+        ordered(Place, "price_by_night", offset=20, limit=10,
+        price_by_night__lte=150, amenity_ids__all=[wifi.id])"""
+        name = self.__class_name(cls)
+        conditions = parse(predicates)
+        self.__need(name)
+        by_class = self.__synced()
+        keys = self.__candidates(name, conditions)
+        ranges = self.__ranges.get(name)
+        if ranges is not None and attr in ranges.lists:
+            # walking the index reads about (offset + limit) / share of
+            # the keys, share being that of the candidates, where sorting
+            # the candidates reads them all
+            if keys is None or limit is not None and \
+                    len(keys) ** 2 > (offset + limit) * len(ranges):
+                allowed = None if keys is None else set(keys)
+                walk = (key for key in ranges.ordered(
+                    attr, conditions, reverse)
+                    if allowed is None or key in allowed)
+                page = itertools.islice(
+                    self.__matching(name, walk, conditions), offset,
+                    None if limit is None else offset + limit)
+                return [obj for _, obj in page]
+        if keys is None:
+            keys = by_class.get(name, {})
+        model = self.classes().get(name)
+        found = []
+        for key, obj in self.__matching(name, keys, conditions):
+            value = attribute(obj, attr, model)
+            if is_number(value):
+                found.append((value, key, obj))
+        found.sort(key=lambda item: item[:2], reverse=reverse)
+        stop = None if limit is None else offset + limit
+        return [obj for _, _, obj in found[offset:stop]]
+
+    def add_index(self, cls, attr):
+        """Maintains a hash index on attr for the instances of cls"""
+        name = self.__class_name(cls)
+        indexes = self.__attr_indexes.setdefault(name, {})
+        if attr not in indexes:
+            indexes[attr] = HashIndex(attr)
+            self.__watched.setdefault(name, set()).add(attr)
+            self.__fill(name, indexes[attr])
+
+    def add_columns(self, cls, attrs):
+        """Mirrors attrs of the instances of cls into a ColumnStore"""
+        name = self.__class_name(cls)
+        store = self.__columns.get(name)
+        known = store.attrs if store is not None else ()
+        if not set(attrs) <= set(known):
+            self.__mirror(name, self.__columns, ColumnStore(
+                dict.fromkeys(known + tuple(attrs)),
+                self.classes().get(name)))
+
+    def add_range_index(self, cls, attrs):
+        """Keeps the numbers attrs hold in the instances of cls sorted"""
+        name = self.__class_name(cls)
+        index = self.__ranges.get(name)
+        known = index.attrs if index is not None else ()
+        if not set(attrs) <= set(known):
+            self.__mirror(name, self.__ranges, RangeIndex(
+                dict.fromkeys(known + tuple(attrs)),
+                self.classes().get(name)))
+
+    def add_bitmap_index(self, cls, attrs):
+        """Keeps bitmaps of the elements of the list attrs of the
+        instances of cls"""
+        name = self.__class_name(cls)
+        index = self.__bitmaps.get(name)
+        known = index.attrs if index is not None else ()
+        if not set(attrs) <= set(known):
+            self.__mirror(name, self.__bitmaps, BitmapIndex(
+                dict.fromkeys(known + tuple(attrs)),
+                self.classes().get(name)))
+
+    def add_grid(self, cls, lat="latitude", lon="longitude", size=1.0):
+        """Maintains a grid index of the points (lat, lon) of the
+        instances of cls, in cells of size degrees"""
+        name = self.__class_name(cls)
+        self.__mirror(name, self.__grids,
+                      GridIndex(lat, lon, size, self.classes().get(name)))
+
+    def within(self, cls, south, west, north, east):
+        """Returns the instances of cls located in the box, by key; west >
+        east for a box crossing the antimeridian"""
+        grid = self.__grid(cls)
+        if grid is None:
+            return {}
+        return {key: self.__instance(key)
+                for key, _ in grid.within(south, west, north, east)}
+
+    def nearby(self, cls, latitude, longitude, radius):
+        """Returns the (distance, instance) pairs of the instances of cls
+        within radius kilometres of the point, nearest first"""
+        grid = self.__grid(cls)
+        if grid is None:
+            return []
+        return [(km, self.__instance(key))
+                for km, key in grid.nearby(latitude, longitude, radius)]
+
+    def nearest(self, cls, latitude, longitude, k=1):
+        """Returns the (distance, instance) pairs of the k instances of
+        cls nearest to the point, nearest first"""
+        grid = self.__grid(cls)
+        if grid is None:
+            return []
+        return [(km, self.__instance(key))
+                for km, key in grid.nearest(latitude, longitude, k)]
+
+    def add_text_index(self, cls, attrs, normalize=True):
+        """Maintains a text index on attrs for the instances of cls, see
+        models.engine.text"""
+        name = self.__class_name(cls)
+        self.__mirror(name, self.__texts, TextIndex(
+            attrs, self.classes().get(name), normalize))
+
+    def search(self, cls, text, limit=10):
+        """Returns the (score, instance) pairs of the limit instances of
+        cls whose text index best matches the words of text, best first"""
+        name = self.__class_name(cls)
+        self.__need(name)
+        self.__synced()
+        if name in self.__untexted:
+            self.__add_texts(name)
+            self.__settle_texts([name])
+        index = self.__texts.get(name)
+        if index is None:
+            return []
+        return [(score, self.__instance(key))
+                for score, key in index.search(text, limit)]
+
+    def aggregate(self, cls, attr, by=None, **predicates):
+        """Returns the count, sum, min, max and mean of the numbers attr
+        holds in the instances of cls matching the predicates, or None if
+        there are none; by value of the attribute by if given, e.g.
+        aggregate(Place, "price_by_night", by="city_id")"""
+        name = self.__class_name(cls)
+        conditions = parse(predicates)
+        self.__need(name)
+        self.__synced()
+        store = self.__columns.get(name)
+        if store is not None and store.aggregates(attr, by) \
+                and store.covers(conditions):
+            return store.aggregate(attr, by, conditions)
+        model = self.classes().get(name)
+        groups = summarize(
+            pairs(self.query(name, **predicates).values(), attr, by, model),
+            type(getattr(model, attr, None)) is int)
+        return groups.get(None) if by is None else groups
 
     def new(self, obj):
-        self.__objects[f"{obj.__class__.__name__}.{obj.id}"] = obj
+        """Adds obj to __objects and marks it as changed"""
+        name = obj.__class__.__name__
+        self.__load_shard(name)
+        key = f"{name}.{obj.id}"
+        self.__put(key, obj)
+        self.__fragments.pop(key, None)
+        self.__pending[key] = obj
+        self.__changed.add(name)
+
+    def touch(self, obj, attr):
+        """Marks a stored instance as changed after attr was set, so that
+        the next write includes it, refreshes its indexes and forgets its
+        encoded text"""
+        name = obj.__class__.__name__
+        key = f"{name}.{getattr(obj, 'id', None)}"
+        if self.__fragments:
+            self.__fragments.pop(key, None)
+        if self.__objects.get(key) is not obj:
+            return
+        if not self.threadsafe:
+            self.__touched(key, obj, name, attr)
+            return
+        with self.__lock.write():
+            if self.__objects.get(key) is obj:
+                self.__touched(key, obj, name, attr)
+
+    def __touched(self, key, obj, name, attr):
+        self.__pending[key] = obj
+        self.__changed.add(name)
+        watched = self.__watched.get(name)
+        if watched and attr in watched:
+            self.__reindex(key, obj, attr)
+
+    def delete(self, obj=None):
+        """Removes obj from __objects if it is there"""
+        if obj is None:
+            return
+        name = obj.__class__.__name__
+        self.__load_shard(name)
+        key = f"{name}.{obj.id}"
+        if key in self.__objects or key in self.__raw or (
+                self.__mapped is not None and key not in self.__unmapped
+                and self.__mapped.get(key) is not None):
+            self.__drop(key)
+            self.__pending[key] = None
+            self.__changed.add(name)
+
+    def begin(self):
+        """Starts a batch: save() only marks storage dirty until commit()"""
+        self.__batch = True
+
+    def commit(self):
+        """Ends the batch, writing once if anything was saved during it"""
+        self.__batch = False
+        if self.__dirty:
+            self.flush()
 
     def save(self):
-        obj_dict = {key: obj.to_dict() for key, obj in self.__objects.items()}
-        with open(self.__file_path, "w") as f:
-            json.dump(obj_dict, f)
-
-    def reload(self):
-        """Deserializes the JSON file to __objects"""
-        from models.base_model import BaseModel
-        from models.user import User
-        from models.amenity import Amenity
-        from models.city import City
-        from models.place import Place
-        from models.review import Review
-        from models.state import State
-
-        classes = {
-            'BaseModel': BaseModel,
-            'User': User,
-            'Amenity': Amenity,
-            'City': City,
-            'Place': Place,
-            'Review': Review,
-            'State': State,
-        }
+        """Persists the changes made since the last save, or defers it to
+        commit() inside a batch"""
+        if self.__batch:
+            self.__dirty = True
+        else:
+            self.flush()
+
+    def flush(self):
+        """Writes the changes made since the last write now"""
+        self.__dirty = False
+        self.__synced()
+        if not self.journal:
+            self.compact()
+            return
+        if not self.__pending:
+            return
+        with self.__flock(exclusive=True):
+            self.__catch_up()
+            with open(self.log_path, "ab") as f:
+                start = f.tell()
+                inode, offset = self.__log_at
+                if inode == os.fstat(f.fileno()).st_ino and start > offset:
+                    # a torn write that __replay() stopped at: records
+                    # appended after it would be skipped with it
+                    f.truncate(offset)
+                    f.seek(offset)
+                    start = offset
+                self.__encoded = 0
+                for key, obj in self.__pending.items():
+                    if obj is None:
+                        f.write((json.dumps([key, None]) + "\n").encode())
+                    else:
+                        # the text of json.dumps([key, obj.to_dict()])
+                        _, key_text, text = self.__fragment(key, obj)
+                        f.write(f"[{key_text}, {text}]\n".encode())
+                self.__log_at = (os.fstat(f.fileno()).st_ino, f.tell())
+            if stats.enabled:
+                stats.count("bytes_written", self.__log_at[1] - start)
+                stats.count("objects_serialized", self.__encoded)
+            self.__log_size += len(self.__pending)
+            self.__pending = {}
+            if self.__log_size >= self.compact_after:
+                self.compact()
+
+    def compact(self):
+        """Writes a full snapshot of __objects and drops the journal; in
+        sharded mode only the files of the classes that changed"""
+        self.__synced()
+        with self.__flock(exclusive=True):
+            self.__catch_up()
+            if not self.sharded:
+                self.export(self.__file_path, self.codec)
+                self.__seen[self.__file_path] = self.__signature(
+                    self.__file_path)
+                self.__remove_log()
+            else:
+                self.__index()
+                for name in self.__changed:
+                    path = self.shard_path(name)
+                    self.__dump(path, list(self.__index().get(name, ())),
+                                self.codec)
+                    self.__seen[path] = self.__signature(path)
+                self.__remove_log()
+                if self.__deferred:
+                    # records of classes not loaded yet stay in the journal
+                    with open(self.log_path, "wb") as f:
+                        for records in self.__deferred.values():
+                            for key, record in records.items():
+                                f.write((json.dumps([key, record]) +
+                                         "\n").encode())
+                                self.__log_size += 1
+                        self.__log_at = (os.fstat(f.fileno()).st_ino,
+                                         f.tell())
+            self.__save_texts()
+            self.__changed = set()
+            self.__pending = {}
+
+    def refresh(self):
+        """Picks up what other processes wrote since this one last read
+        or wrote the files, and tells whether there was anything"""
+        with self.__flock():
+            return self.__catch_up()
+
+    def export(self, path, codec="json"):
+        """Writes a full snapshot of the objects to path with codec"""
+        self.__need()
+        self.__dump(path, list(itertools.chain(self.__raw, self.__objects)),
+                    codec)
+
+    def reload(self, classes=None):
+        """Deserializes the JSON file to __objects and replays the journal
+
+        The codec of the file is detected from its header, so a store
+        written with any codec can be reloaded. In stream mode a JSON file
+        is decoded one record at a time, so only a chunk of text and the
+        record being loaded are held besides the objects, at the cost of
+        a slower decode.
+
+        In sharded mode only the files of classes (classes or names) are
+        read, or of every class if it is None.
+        """
+        with self.__flock(), self.__filling():
+            self.__pending = {}
+            self.__changed = set()
+            self.__deferred = {}
+            self.__loaded = set()
+            self.__seen = {}
+            self.__log_size = 0
+            self.__log_at = (None, 0)
+            self.__fragments = {}
+            self.__unmap()
+            self.__restore_texts()
+            if not self.sharded:
+                self.__read(self.__file_path, mappable=True)
+            self.__replay()
+            if not self.sharded and self.__mapped is None:
+                self.__settle_texts(self.__texts)
+            if self.sharded:
+                if classes is None:
+                    self.__load_all()
+                for cls in classes or ():
+                    self.__load_shard(self.__class_name(cls))
+
+    def classes(self):
+        """Returns the model classes to build instances from, by name"""
+        if self.__models is None:
+            with self.__lock.write():
+                if self.__models is None:
+                    self.__models = model_classes(self.slots)
+                    for name, model in self.__models.items():
+                        for attr in getattr(model, "_references", ()):
+                            self.add_index(name, attr)
+                        if self.columnar and hasattr(model, "_columns"):
+                            self.add_columns(name, model._columns)
+                        if hasattr(model, "_ranges") or \
+                                hasattr(model, "_bitmaps"):
+                            self.__unbuilt.add(name)
+                            if self.threadsafe:
+                                self.__build(name)
+                        if hasattr(model, "_location"):
+                            self.add_grid(name, *model._location)
+                        if hasattr(model, "_text"):
+                            self.__untexted.add(name)
+                            if self.threadsafe:
+                                self.__add_texts(name)
+        return self.__models
 
+    def __reader(self, method):
+        """Wraps method with the read lock, or with the write lock while
+        objects are left to build or index"""
+        lock = self.__lock
+
+        @functools.wraps(method)
+        def locked(*args, **kwargs):
+            lock.acquire_read()
+            try:
+                if self.__settled():
+                    return method(*args, **kwargs)
+            finally:
+                lock.release_read()
+            return self.__writer(method)(*args, **kwargs)
+        return locked
+
+    def __writer(self, method):
+        lock = self.__lock
+
+        @functools.wraps(method)
+        def locked(*args, **kwargs):
+            lock.acquire_write()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                lock.release_write()
+        return locked
+
+    def __settled(self):
+        """Tells whether every object is built and indexed"""
+        return (not self.__raw and self.__mapped is None
+                and self.__models is not None
+                and self.__indexed is self.__objects
+                and (not self.sharded
+                     or self.__loaded.issuperset(self.__models)))
+
+    def __catch_up(self):
+        """Reloads if a file read was replaced since, keeping the pending
+        changes, else replays the journal records added since"""
+        for path, signature in self.__seen.items():
+            if self.__signature(path) != signature:
+                # changes to objects since dropped from __objects are moot
+                pending = {key: obj for key, obj in self.__pending.items()
+                           if obj is None or self.__objects.get(key) is obj}
+                changed = set(self.__changed)
+                loaded = list(self.__loaded)
+                built = self.__objects
+                self.__objects = {}
+                self.__raw = {}
+                self.__index()
+                self.reload(loaded if self.sharded else None)
+                for key, obj in pending.items():
+                    if obj is None:
+                        self.__drop(key)
+                    else:
+                        self.__put(key, obj)
+                # callers may hold the instances built before
+                for key, obj in built.items():
+                    if key not in pending:
+                        self.__adopt(key, obj)
+                self.__pending = pending
+                self.__changed.update(changed)
+                return True
+        return self.__replay()
+
+    def __replay(self):
+        """Applies the journal records written past the last one read,
+        except to the keys changed since the last write"""
+        try:
+            f = open(self.log_path, "rb")
+        except FileNotFoundError:
+            return False
+        found = False
+        with f:
+            inode = os.fstat(f.fileno()).st_ino
+            offset = self.__log_at[1] if inode == self.__log_at[0] else 0
+            f.seek(offset)
+            for line in f:
+                try:
+                    key, value = json.loads(line)
+                except ValueError:
+                    # a torn write at the tail of the log, ignore it
+                    break
+                offset += len(line)
+                self.__log_size += 1
+                found = True
+                name = key.split(".", 1)[0]
+                if key in self.__pending:
+                    continue
+                if self.sharded and name not in self.__loaded:
+                    self.__deferred.setdefault(name, {})[key] = value
+                    continue
+                if value is None:
+                    self.__drop(key)
+                else:
+                    self.__load(key, value)
+                if self.sharded:
+                    self.__changed.add(name)
+            self.__log_at = (inode, offset)
+        return found
+
+    @contextlib.contextmanager
+    def __flock(self, exclusive=False):
+        """Holds the advisory lock of the files, shared with the other
+        processes using them"""
+        if fcntl is None or self.__flocked:
+            yield
+            return
+        with open(self.__file_path + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self.__flocked = True
+            try:
+                yield
+            finally:
+                self.__flocked = False
+
+    @staticmethod
+    def __signature(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def __read(self, path, mappable=False):
+        """Loads the records of the snapshot file at path, if any, or maps
+        it if it has the "mmap" format and mappable is true"""
+        try:
+            with open(path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                self.__seen[path] = (stat.st_ino, stat.st_size,
+                                     stat.st_mtime_ns)
+                name = codecs.detect(f)
+                if mappable and name == "mmap":
+                    self.__mapped = Snapshot.open(f)
+                    return
+                for key, value in codecs.get(name).items(f, self.stream):
+                    self.__load(key, value)
+        except FileNotFoundError:
+            self.__seen[path] = None
+
+    def __load_shard(self, name):
+        """Reads the file of class name, then its journal records, the
+        first time the class is used in sharded mode"""
+        if not self.sharded or name in self.__loaded:
+            return
+        self.__loaded.add(name)
+        if name not in self.classes():
+            return
+        with self.__filling():
+            self.__read(self.shard_path(name))
+            records = self.__deferred.pop(name, None)
+            if records:
+                for key, value in records.items():
+                    if value is None:
+                        self.__drop(key)
+                    else:
+                        self.__load(key, value)
+                # fold them into the file on the next compaction
+                self.__changed.add(name)
+        self.__settle_texts([name])
+
+    def __need(self, name=None):
+        """Loads what the objects of class name, or of every class, may
+        still be in: the mapped snapshot, then the file of the class"""
+        if self.__mapped is not None:
+            with self.__filling():
+                for key, record in self.__mapped.items():
+                    if key not in self.__unmapped and key not in self.__raw \
+                            and key not in self.__objects:
+                        self.__load(key, record)
+            self.__unmap()
+            self.__settle_texts(self.__texts)
+        if name is None:
+            self.__load_all()
+        else:
+            self.__load_shard(name)
+
+    def __unmap(self):
+        if self.__mapped is not None:
+            self.__mapped.close()
+            self.__mapped = None
+        self.__unmapped = set()
+
+    def __load_all(self):
+        if self.sharded:
+            for name in self.classes():
+                self.__load_shard(name)
+
+    def __fragment(self, key, source):
+        """Returns (source, key text, record text) for an instance or a
+        decoded record, encoding it only if it is not the cached one"""
+        fragment = self.__fragments.get(key)
+        if fragment is None or fragment[0] is not source:
+            record = source if type(source) is dict else source.to_dict()
+            fragment = (source, json.dumps(key), json.dumps(record))
+            # an instance may change in place, unseen
+            if self.cached or type(source) is dict:
+                self.__fragments[key] = fragment
+            self.__encoded += 1
+        return fragment
+
+    def __dump(self, path, keys, codec):
+        """Writes the objects and records of keys to path with codec"""
+        self.__encoded = 0
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            if codec == "json":
+                # the text json.dump() gives for the records by key
+                parts = []
+                for key in keys:
+                    source = self.__raw.get(key) or self.__objects.get(key)
+                    if source is not None:
+                        _, key_text, text = self.__fragment(key, source)
+                        parts.append(f"{key_text}: {text}")
+                f.write(("{" + ", ".join(parts) + "}").encode())
+            else:
+                obj_dict = {}
+                for key in keys:
+                    if key in self.__raw:
+                        obj_dict[key] = self.__raw[key]
+                    elif key in self.__objects:
+                        obj_dict[key] = self.__objects[key].to_dict()
+                        self.__encoded += 1
+                codecs.dump(obj_dict, f, codec)
+            if stats.enabled:
+                stats.count("bytes_written", f.tell())
+                stats.count("objects_serialized", self.__encoded)
+        os.replace(tmp_path, path)
+
+    def __load(self, key, record):
+        """Stores a decoded record, as an instance unless in lazy mode"""
+        if record['__class__'] not in self.classes():
+            return
+        if self.lazy:
+            self.__objects.pop(key, None)
+            self.__raw[key] = record
+            self.__index().setdefault(key.split(".", 1)[0], {})[key] = None
+            self.__reindex(key, record)
+        else:
+            self.__put(key, self.classes()[record['__class__']](**record))
+
+    def __hydrate(self, key):
+        record = self.__raw.pop(key)
+        obj = self.classes()[record['__class__']](**record)
+        self.__objects[key] = obj
+        self.__hand_over(key, record, obj)
+        return obj
+
+    def __fetch(self, key):
+        """Loads the record of key from the mapped snapshot, if it is
+        there and was not loaded yet"""
+        if self.__mapped is not None and key not in self.__unmapped:
+            self.__unmapped.add(key)
+            if key not in self.__objects and key not in self.__raw:
+                record = self.__mapped.get(key)
+                if record is not None:
+                    self.__load(key, record)
+
+    def __adopt(self, key, obj):
+        """Stores obj, the instance of key before a reload, in place of
+        the one reloaded, with the attributes reloaded"""
+        self.__fetch(key)
+        source = self.__raw.get(key, self.__objects.get(key))
+        if source is None or \
+                type(obj) is not self.classes().get(obj.__class__.__name__):
+            return
+        record = source if type(source) is dict else source.to_dict()
+        obj.__dict__.clear()
+        for slot in getattr(type(obj), "__slots__", ()):
+            try:
+                object.__delattr__(obj, slot)
+            except AttributeError:
+                pass
+        type(obj).__init__(obj, **record)
+        self.__put(key, obj)
+        self.__hand_over(key, source, obj)
+
+    def __hand_over(self, key, source, obj):
+        """Ties the cached text of source to obj, built from it, in
+        cached mode, or drops it"""
+        fragment = self.__fragments.get(key)
+        if fragment is not None and fragment[0] is source:
+            if self.cached:
+                self.__fragments[key] = (obj,) + fragment[1:]
+            else:
+                del self.__fragments[key]
+
+    def __put(self, key, obj):
+        self.__raw.pop(key, None)
+        self.__objects[key] = obj
+        self.__index().setdefault(key.split(".", 1)[0], {})[key] = None
+        self.__reindex(key, obj)
+
+    def __drop(self, key):
+        self.__fragments.pop(key, None)
+        if self.__mapped is not None:
+            self.__unmapped.add(key)
+        found = self.__objects.pop(key, None) is not None
+        if self.__raw.pop(key, None) is not None or found:
+            self.__unindex(key)
+
+    def __unindex(self, key):
+        name = key.split(".", 1)[0]
+        self.__index().get(name, {}).pop(key, None)
+        for index in self.__attr_indexes.get(name, {}).values():
+            index.discard(key)
+        for store in self.__stores.get(name, ()):
+            store.discard(key)
+
+    def __reindex(self, key, obj, changed=None):
+        """Updates the attribute indexes of key from an instance or
+        a decoded record, only those holding attribute changed if given"""
+        name = key.split(".", 1)[0]
+        if self.__models is None:
+            self.classes()
+        indexes = self.__attr_indexes.get(name)
+        if indexes and self.__unfilled is not None and changed is None:
+            self.__unfilled.add(name)
+        elif indexes:
+            model = self.classes().get(name)
+            for attr in indexes if changed is None else (changed,):
+                index = indexes.get(attr)
+                if index is None:
+                    continue
+                value = attribute(obj, attr, model)
+                if value is MISSING:
+                    index.discard(key)
+                else:
+                    index.add(key, value)
+        for store in self.__stores.get(name, ()):
+            if changed is None or changed in store.attrs:
+                store.add(key, obj)
+
+    @contextlib.contextmanager
+    def __filling(self):
+        """Defers the hash index updates of the records loaded meanwhile
+        to one __fill() per index of their classes"""
+        if self.__unfilled is not None:
+            yield
+            return
+        self.__unfilled = set()
+        try:
+            yield
+        finally:
+            names, self.__unfilled = self.__unfilled, None
+            for name in names:
+                for index in self.__attr_indexes.get(name, {}).values():
+                    self.__fill(name, index)
+
+    def __fill(self, name, index):
+        """Indexes every instance and record of class name"""
+        index.clear()
+        model = self.classes().get(name)
+        objects, raw, attr = self.__objects, self.__raw, index.attr
+        found = []
+        for key in self.__index().get(name, {}):
+            value = attribute(raw.get(key) or objects.get(key, MISSING),
+                              attr, model)
+            if value is not MISSING:
+                found.append((key, value))
+        index.extend(found)
+
+    def __mirror(self, name, stores, store, saved=None):
+        """Keeps store up to date with the instances of class name, in
+        place of the one stores held for it, from the dump saved if
+        given"""
+        mirrors = self.__stores.setdefault(name, [])
+        if name in stores:
+            mirrors.remove(stores[name])
+        stores[name] = store
+        mirrors.append(store)
+        self.__watched.setdefault(name, set()).update(store.attrs)
+        self.__fill_store(name, store, saved)
+
+    def __fill_store(self, name, store, saved=None):
+        """Stores every instance and record of class name, after loading
+        the dump saved if given"""
+        store.clear()
+        if saved is not None:
+            store.load(saved)
+        for key in self.__index().get(name, {}):
+            obj = self.__raw.get(key, self.__objects.get(key))
+            if obj is not None:
+                store.add(key, obj)
+
+    def __add_texts(self, name):
+        """Adds the text index model name lists in _text, from the one
+        written by __save_texts() if it is there"""
+        self.__untexted.discard(name)
+        model = self.classes()[name]
+        self.__mirror(name, self.__texts, TextIndex(model._text, model),
+                      self.__saved_texts().get(name))
+
+    def __saved_texts(self):
+        """Returns the text indexes written by __save_texts(), by class
+        name"""
+        try:
+            # marshal.load() reads a file in small pieces
+            with open(self.search_path, "rb") as f:
+                data = marshal.loads(f.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def __restore_texts(self):
+        """Loads the text indexes written by __save_texts(), unless they
+        already hold documents"""
+        self.classes()
+        if not self.__texts or any(self.__texts.values()):
+            return
+        data = self.__saved_texts()
+        for name, index in self.__texts.items():
+            index.load(data.get(name))
+
+    def __settle_texts(self, names):
+        """Drops what __restore_texts() loaded for instances that are no
+        longer stored, once every instance of the classes is loaded"""
+        for name in names:
+            if name in self.__texts:
+                self.__texts[name].settle()
+
+    def __save_texts(self):
+        """Writes the text indexes next to the snapshot once a tenth of
+        the documents of one changed since the last time"""
+        if not any(index.changes > len(index) // 10
+                   for index in self.__texts.values()):
+            return
+        # those of the indexes no search() built yet stay as they were
+        data = self.__saved_texts() if self.__untexted else {}
+        data.update((name, index.dump())
+                    for name, index in self.__texts.items())
+        tmp_path = self.search_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            marshal.dump(data, f)
+        os.replace(tmp_path, self.search_path)
+
+    def __candidates(self, name, conditions):
+        """Returns the fewest keys the indexes of class name narrow the
+        conditions down to, or None"""
+        if name in self.__unbuilt:
+            self.__build(name)
+        keys = candidates(self.__attr_indexes.get(name, {}), conditions)
+        for index in (self.__ranges.get(name), self.__bitmaps.get(name)):
+            if index is not None:
+                found = index.candidates(conditions)
+                if found is not None and (keys is None or
+                                          len(found) < len(keys)):
+                    keys = found
+        if keys is None and name in self.__columns:
+            keys = self.__columns[name].select(conditions)
+        return keys
+
+    def __build(self, name):
+        """Adds the range and bitmap indexes model name lists"""
+        self.__unbuilt.discard(name)
+        model = self.classes()[name]
+        self.add_range_index(name, getattr(model, "_ranges", ()))
+        self.add_bitmap_index(name, getattr(model, "_bitmaps", ()))
+
+    def __matching(self, name, keys, conditions):
+        """Yields the (key, instance) pairs of the keys whose instance or
+        record satisfies the conditions"""
+        model = self.classes().get(name)
+        for key in keys:
+            if key in self.__raw:
+                if matches(self.__raw[key], conditions, model):
+                    yield key, self.__hydrate(key)
+            elif key in self.__objects:
+                if matches(self.__objects[key], conditions):
+                    yield key, self.__objects[key]
+
+    def __grid(self, cls):
+        name = self.__class_name(cls)
+        self.__need(name)
+        self.__synced()
+        return self.__grids.get(name)
+
+    def __instance(self, key):
+        if key in self.__raw:
+            return self.__hydrate(key)
+        return self.__objects[key]
+
+    def __synced(self):
+        """Returns __index(), once it follows the keys added to or
+        deleted from the dict all() returns, when they changed the number
+        of objects"""
+        by_class = self.__index()
+        objects, raw = self.__objects, self.__raw
+        if sum(map(len, by_class.values())) == len(objects) + len(raw):
+            return by_class
+        for keys in list(by_class.values()):
+            for key in [key for key in keys
+                        if key not in objects and key not in raw]:
+                self.__fragments.pop(key, None)
+                self.__unindex(key)
+                self.__pending[key] = None
+                self.__changed.add(key.split(".", 1)[0])
+        for key, obj in objects.items():
+            name = key.split(".", 1)[0]
+            if key not in by_class.get(name, ()):
+                self.__index().setdefault(name, {})[key] = None
+                self.__reindex(key, obj)
+                self.__pending[key] = obj
+                self.__changed.add(name)
+        return by_class
+
+    def __index(self):
+        """Returns the class name -> keys index, rebuilt whenever
+        __objects has been replaced from outside"""
+        if self.__indexed is not self.__objects:
+            self.__by_class = {}
+            for key in itertools.chain(self.__raw, self.__objects):
+                self.__by_class.setdefault(
+                    key.split(".", 1)[0], {})[key] = None
+            self.__indexed = self.__objects
+            self.__fragments = {}
+            if self.sharded:
+                # changes made to a replaced dict cannot be told apart
+                self.__changed.update(self.__by_class, self.__loaded)
+            for name, indexes in self.__attr_indexes.items():
+                for index in indexes.values():
+                    self.__fill(name, index)
+            for name, stores in self.__stores.items():
+                for store in stores:
+                    self.__fill_store(name, store)
+        return self.__by_class
+
+    @staticmethod
+    def __class_name(cls):
+        return cls if isinstance(cls, str) else cls.__name__
+
+    def __remove_log(self):
         try:
-            with open(self.__file_path, "r") as f:
-                obj_dict = json.load(f)
-                for key, value in obj_dict.items():
-                    if value['__class__'] in classes:
-                        self.__objects[key] = classes[value['__class__']](
-                            **value)
+            os.remove(self.log_path)
         except FileNotFoundError:
             pass
+        self.__log_size = 0
+        self.__log_at = (None, 0)
+
+
+# the methods locked in thread-safe mode
+READS = ("all", "get", "count", "query", "ordered", "aggregate", "within",
+         "nearby", "nearest", "search")
+WRITES = ("clear", "add_index", "add_columns", "add_range_index",
+          "add_bitmap_index", "add_grid", "add_text_index", "new", "delete",
+          "begin", "commit", "save", "flush", "compact", "export", "reload",
+          "refresh")
+
+
+def model_classes(slots=False):
+    """Returns the model classes by name, or their compact variants"""
+    from models import classes
+    if slots:
+        return {name: classes[name].compact() for name in classes}
+    return {name: classes[name] for name in classes}
+
+
+stats.instrument(FileStorage, "new", "save", "reload")
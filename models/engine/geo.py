@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+"""Grid index of coordinates, behind within(), nearby() and nearest()
+
+Points are bucketed by cells of `size` degrees of latitude and
+longitude. A bounding box only reads the cells it overlaps, a radius
+query reads the cells of the box around the circle and measures the
+great circle distance of their points, and a k nearest neighbours query
+runs radius queries of growing radius until k points are in range.
+"""
+import math
+
+from models.engine.query import MISSING
+
+# mean Earth radius in kilometres
+RADIUS = 6371.0088
+HALF_CIRCUMFERENCE = math.pi * RADIUS
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """Returns the great circle distance in kilometres between two points
+    given in degrees (haversine formula)"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) \
+        * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def coordinates(latitude, longitude):
+    """Returns the point as floats, or None if it is not one"""
+    if type(latitude) is not float and type(latitude) is not int or \
+            type(longitude) is not float and type(longitude) is not int:
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return float(latitude), float(longitude)
+
+
+def bounds(latitude, longitude, radius):
+    """Returns the (south, west, north, east) box holding every point
+    within radius kilometres of the point; west > east when the box
+    crosses the antimeridian"""
+    angle = radius / RADIUS
+    south = latitude - math.degrees(angle)
+    north = latitude + math.degrees(angle)
+    if south <= -90 or north >= 90:
+        # the circle holds a pole, so every meridian crosses it
+        return max(south, -90.0), -180.0, min(north, 90.0), 180.0
+    spread = math.degrees(
+        math.asin(min(1.0, math.sin(angle) / math.cos(
+            math.radians(latitude)))))
+    if spread >= 180:
+        return south, -180.0, north, 180.0
+    west, east = longitude - spread, longitude + spread
+    if west < -180:
+        west += 360
+    if east > 180:
+        east -= 360
+    return south, west, north, east
+
+
+class GridIndex:
+    """Maps cells of the grid to the keys of the points they hold.
+
+    Values of the lat and lon attributes that are not numbers or out of
+    range leave the key out of the index.
+    """
+
+    def __init__(self, lat="latitude", lon="longitude", size=1.0,
+                 model=None):
+        self.attrs = (lat, lon)
+        self.defaults = (getattr(model, lat, MISSING),
+                         getattr(model, lon, MISSING))
+        self.size = size
+        self.clear()
+
+    def clear(self):
+        self.cells = {}
+        # the cell of each key
+        self.points = {}
+
+    def __len__(self):
+        return len(self.points)
+
+    def cell(self, latitude, longitude):
+        return (math.floor(latitude / self.size),
+                math.floor(longitude / self.size))
+
+    def add(self, key, obj):
+        """Indexes key at the point of an instance or decoded record"""
+        record = obj if type(obj) is dict else obj._attributes()
+        point = coordinates(record.get(self.attrs[0], self.defaults[0]),
+                            record.get(self.attrs[1], self.defaults[1]))
+        cell = self.points.get(key)
+        if cell is not None:
+            if self.cells[cell][key] == point:
+                return
+            self.discard(key)
+        if point is not None:
+            cell = (math.floor(point[0] / self.size),
+                    math.floor(point[1] / self.size))
+            bucket = self.cells.get(cell)
+            if bucket is None:
+                bucket = self.cells[cell] = {}
+            bucket[key] = point
+            self.points[key] = cell
+
+    def discard(self, key):
+        """Removes key from the index"""
+        cell = self.points.pop(key, None)
+        if cell is not None:
+            bucket = self.cells[cell]
+            del bucket[key]
+            if not bucket:
+                del self.cells[cell]
+
+    def within(self, south, west, north, east):
+        """Yields the (key, (latitude, longitude)) pairs of the points in
+        the box; west > east selects a box crossing the antimeridian"""
+        if west > east:
+            yield from self.within(south, west, north, 180.0)
+            yield from self.within(south, -180.0, north, east)
+            return
+        low, left = self.cell(south, west)
+        high, right = self.cell(north, east)
+        if (high - low + 1) * (right - left + 1) > len(self.cells):
+            cells = [cell for cell in self.cells
+                     if low <= cell[0] <= high and left <= cell[1] <= right]
+        else:
+            cells = [(row, column) for row in range(low, high + 1)
+                     for column in range(left, right + 1)]
+        for cell in cells:
+            for key, point in self.cells.get(cell, {}).items():
+                if south <= point[0] <= north and west <= point[1] <= east:
+                    yield key, point
+
+    def nearby(self, latitude, longitude, radius):
+        """Returns the (distance, key) pairs of the points within radius
+        kilometres of the point, nearest first"""
+        found = []
+        for key, point in self.within(*bounds(latitude, longitude, radius)):
+            km = distance(latitude, longitude, *point)
+            if km <= radius:
+                found.append((km, key))
+        found.sort()
+        return found
+
+    def nearest(self, latitude, longitude, k=1):
+        """Returns the (distance, key) pairs of the k points nearest to
+        the point, nearest first"""
+        if k <= 0 or not self.points:
+            return []
+        # about the distance from the point to the edge of its cell
+        radius = self.size * HALF_CIRCUMFERENCE / 180
+        while True:
+            found = self.nearby(latitude, longitude, radius)
+            # past half the circumference, every point is in range
+            if len(found) >= k or len(found) == len(self.points) or \
+                    radius > HALF_CIRCUMFERENCE:
+                return found[:k]
+            radius *= 2
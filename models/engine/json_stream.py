@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+"""Incremental reader for the top-level JSON object of a storage file"""
+import json
+import re
+from json.decoder import scanstring
+
+_scan = json.JSONDecoder().scan_once
+# what may come before a value: the opening brace or a comma, then a key
+_FIRST = re.compile(r'\s*\{\s*(?:"((?:[^"\\]|\\.)*)"\s*:\s*|(\}))',
+                    re.DOTALL)
+_NEXT = re.compile(r'\s*(?:,\s*"((?:[^"\\]|\\.)*)"\s*:\s*|(\}))',
+                   re.DOTALL)
+
+
+def iter_items(f, chunk_size=1 << 16):
+    """Yields the (key, value) pairs of the JSON object read from f
+    one at a time, keeping about one chunk of text in memory"""
+    buf = ""
+    pos = 0
+    eof = False
+    pattern = _FIRST
+    while True:
+        match = pattern.match(buf, pos)
+        if match is not None and match.group(2):
+            return
+        value_end = None
+        if match is not None:
+            try:
+                value, value_end = _scan(buf, match.end())
+            except (StopIteration, json.JSONDecodeError):
+                pass
+        # a value ending the buffer may be a truncated number
+        if value_end is None or value_end == len(buf):
+            if not eof:
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            if match is None:
+                raise json.JSONDecodeError(
+                    "Expecting property name enclosed in double quotes"
+                    if pattern is _NEXT or buf.strip().startswith("{")
+                    else "Expecting '{'", buf, pos)
+            if value_end is None:
+                raise json.JSONDecodeError("Expecting value", buf,
+                                           match.end())
+        key = match.group(1)
+        if "\\" in key:
+            key = scanstring(buf, match.start(1))[0]
+        yield key, value
+        pos = value_end
+        pattern = _NEXT
@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+"""Readers-writer lock used by FileStorage in thread-safe mode"""
+import contextlib
+import threading
+
+
+class RWLock:
+    """Lets any number of threads read, or a single thread write.
+
+    Waiting writers go before new readers. Both sides are reentrant, and
+    the writing thread may also read, but a thread that only reads
+    cannot start writing: two such threads would wait for each other.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._depth = 0
+        self._waiting = 0
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+    def acquire_read(self):
+        local = self._local
+        if self._writer == threading.get_ident():
+            local.nested = getattr(local, "nested", 0) + 1
+            return
+        reads = getattr(local, "reads", 0)
+        with self._cond:
+            if not reads:
+                while self._writer is not None or self._waiting:
+                    self._cond.wait()
+            self._readers += 1
+        local.reads = reads + 1
+
+    def release_read(self):
+        local = self._local
+        if getattr(local, "nested", 0):
+            local.nested -= 1
+            return
+        local.reads -= 1
+        with self._cond:
+            self._readers -= 1
+            if not self._readers and self._waiting:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            self._depth += 1
+            return
+        if getattr(self._local, "reads", 0):
+            raise RuntimeError("cannot write while holding a read lock")
+        with self._cond:
+            self._waiting += 1
+            while self._writer is not None or self._readers:
+                self._cond.wait()
+            self._waiting -= 1
+            self._writer = me
+            self._depth = 1
+
+    def release_write(self):
+        self._depth -= 1
+        if not self._depth:
+            with self._cond:
+                self._writer = None
+                self._cond.notify_all()
+
+
+class NoLock:
+    """Stands in for RWLock when storage is not shared between threads"""
+    _unlocked = contextlib.nullcontext()
+
+    def read(self):
+        return self._unlocked
+
+    def write(self):
+        return self._unlocked
+
+
+NOLOCK = NoLock()
@@ -0,0 +1,173 @@
+#!/usr/bin/python3
+"""Predicates and indexes behind the storage engines' query() method
+
+A predicate is a keyword argument of query(): `attr=value` tests for
+equality and `attr__op=value` applies one of OPERATORS, for example
+`max_guest__gte=4`, `amenity_ids__contains=amenity.id` or
+`amenity_ids__all=[wifi.id, pool.id]`.
+"""
+import operator
+
+MISSING = object()
+
+OPERATORS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "in": lambda value, choices: value in choices,
+    "contains": lambda value, item: item in value,
+    "all": lambda value, items: all(item in value for item in items),
+}
+
+# operators whose matches can be found from a HashIndex
+HASHABLE = ("eq", "in", "contains")
+
+
+def parse(predicates):
+    """Returns the (attr, op, value) conditions of query() keywords"""
+    conditions = []
+    for name, value in predicates.items():
+        attr, _, op = name.partition("__")
+        op = op or "eq"
+        if op not in OPERATORS:
+            raise ValueError(f"unknown query operator '{op}' in {name}")
+        conditions.append((attr, op, value))
+    return conditions
+
+
+def attribute(obj, attr, cls=None):
+    """Returns attr of an instance, or of a decoded record of class cls
+    (falling back to the class default), or MISSING"""
+    if isinstance(obj, dict):
+        if attr in obj:
+            return obj[attr]
+        obj = cls
+    return getattr(obj, attr, MISSING)
+
+
+def matches(obj, conditions, cls=None):
+    """Tells whether an instance or record satisfies every condition"""
+    for attr, op, expected in conditions:
+        value = attribute(obj, attr, cls)
+        if value is MISSING:
+            return False
+        try:
+            if not OPERATORS[op](value, expected):
+                return False
+        except TypeError:
+            return False
+    return True
+
+
+class HashIndex:
+    """Maps the values of one attribute to the keys holding them.
+
+    List values, such as Place.amenity_ids, are indexed by element, and
+    values that cannot be hashed are kept aside as always-candidates, so
+    lookups return a superset of the matches: callers check conditions
+    on the candidates.
+    """
+
+    def __init__(self, attr):
+        self.attr = attr
+        self.buckets = {}
+        self.entries = {}
+        self.unhashable = {}
+
+    def add(self, key, value):
+        """Indexes key under value, replacing what it was indexed under"""
+        if key in self.entries or key in self.unhashable:
+            self.discard(key)
+        values = tuple(value) if isinstance(value, (list, tuple)) \
+            else (value,)
+        try:
+            for item in values:
+                self.buckets.setdefault(item, {})[key] = None
+        except TypeError:
+            self.discard_from(key, values)
+            self.unhashable[key] = None
+            return
+        self.entries[key] = values
+
+    def extend(self, pairs):
+        """Indexes the keys of (key, value) pairs, which it does not hold
+        yet, as add() does"""
+        buckets, entries = self.buckets, self.entries
+        for key, value in pairs:
+            values = tuple(value) if isinstance(value, (list, tuple)) \
+                else (value,)
+            try:
+                for item in values:
+                    bucket = buckets.get(item)
+                    if bucket is None:
+                        buckets[item] = {key: None}
+                    else:
+                        bucket[key] = None
+            except TypeError:
+                self.discard_from(key, values)
+                self.unhashable[key] = None
+                continue
+            entries[key] = values
+
+    def discard(self, key):
+        """Removes key from the index"""
+        self.unhashable.pop(key, None)
+        values = self.entries.pop(key, None)
+        if values is not None:
+            self.discard_from(key, values)
+
+    def discard_from(self, key, values):
+        for item in values:
+            try:
+                bucket = self.buckets.get(item)
+            except TypeError:
+                continue
+            if bucket is not None:
+                bucket.pop(key, None)
+                if not bucket:
+                    del self.buckets[item]
+
+    def lookup(self, value):
+        """Returns the keys that may hold value (or contain it)"""
+        try:
+            found = list(self.buckets.get(value, ()))
+        except TypeError:
+            return None
+        return found + list(self.unhashable)
+
+    def clear(self):
+        self.buckets = {}
+        self.entries = {}
+        self.unhashable = {}
+
+
+def candidates(indexes, conditions):
+    """Returns the keys an index narrows the conditions down to, or None
+    when no condition can use one of the indexes (by attribute name)"""
+    for attr, op, value in conditions:
+        index = indexes.get(attr)
+        if index is None or op not in HASHABLE:
+            continue
+        if op == "in":
+            if isinstance(value, (str, bytes)):
+                # tests for a substring
+                continue
+            keys = {}
+            try:
+                for item in value:
+                    found = index.lookup(item)
+                    if found is None:
+                        break
+                    keys.update(dict.fromkeys(found))
+                else:
+                    return list(keys)
+            except TypeError:
+                pass
+            continue
+        found = index.lookup(value)
+        if found is not None:
+            return found
+    return None
@@ -0,0 +1,269 @@
+#!/usr/bin/python3
+"""Sorted indexes of numeric attributes, behind range predicates of
+query() and ordered()
+
+Each attribute keeps its (value, key) pairs in order, split in chunks of
+at most 2 * LOAD pairs with the largest value of each chunk on the side,
+like the leaves of a B-tree: an insertion or a removal bisects the
+maxima and then one chunk, and a range is the run of chunks between two
+bisections. Pairs of equal values are ordered by key, so that the pages
+of ordered() do not depend on the order instances were added in. The
+pairs added before the first lookup are sorted at once.
+"""
+from bisect import bisect_left, bisect_right
+
+from models.engine.query import MISSING
+
+LOAD = 1000
+
+# operators whose matches are a range of the sorted values
+RANGES = ("eq", "lt", "lte", "gt", "gte", "in")
+
+
+def is_number(value):
+    """Tells whether value can be sorted with the other numbers"""
+    return (type(value) is int or type(value) is float) and value == value
+
+
+class SortedList:
+    """Keeps (value, key) pairs sorted, in chunks"""
+
+    def __init__(self):
+        self.values = []
+        self.keys = []
+        # the largest value and its key in each chunk
+        self.maxima = []
+        self.last = []
+        self.size = 0
+        # pairs inserted before the first lookup, or None after it
+        self.pending = []
+
+    def __len__(self):
+        return self.size
+
+    def settle(self):
+        """Sorts the pending pairs into chunks"""
+        pairs = sorted(self.pending)
+        self.pending = None
+        for start in range(0, len(pairs), LOAD):
+            values, keys = zip(*pairs[start:start + LOAD])
+            self.values.append(list(values))
+            self.keys.append(list(keys))
+            self.maxima.append(values[-1])
+            self.last.append(keys[-1])
+
+    def chunk(self, value, key):
+        """Returns the first chunk whose largest pair is not below the
+        pair, or the last chunk"""
+        maxima, last = self.maxima, self.last
+        i = bisect_left(maxima, value)
+        while i < len(maxima) and maxima[i] == value and last[i] < key:
+            i += 1
+        return min(i, len(maxima) - 1)
+
+    def insert(self, value, key):
+        self.size += 1
+        if self.pending is not None:
+            self.pending.append((value, key))
+            return
+        if not self.maxima:
+            self.values.append([value])
+            self.keys.append([key])
+            self.maxima.append(value)
+            self.last.append(key)
+            return
+        i = self.chunk(value, key)
+        values, keys = self.values[i], self.keys[i]
+        j = bisect_left(keys, key, bisect_left(values, value),
+                        bisect_right(values, value))
+        values.insert(j, value)
+        keys.insert(j, key)
+        if j == len(values) - 1:
+            self.maxima[i], self.last[i] = value, key
+        if len(values) > 2 * LOAD:
+            self.values[i:i + 1] = [values[:LOAD], values[LOAD:]]
+            self.keys[i:i + 1] = [keys[:LOAD], keys[LOAD:]]
+            self.maxima[i:i + 1] = [values[LOAD - 1], values[-1]]
+            self.last[i:i + 1] = [keys[LOAD - 1], keys[-1]]
+
+    def remove(self, value, key):
+        if self.pending is not None:
+            self.settle()
+        i = self.chunk(value, key)
+        values, keys = self.values[i], self.keys[i]
+        j = bisect_left(keys, key, bisect_left(values, value),
+                        bisect_right(values, value))
+        self.size -= 1
+        del values[j]
+        del keys[j]
+        if not values:
+            del self.values[i], self.keys[i], self.maxima[i], self.last[i]
+        elif j == len(values):
+            self.maxima[i], self.last[i] = values[-1], keys[-1]
+
+    def position(self, value, after=False):
+        """Returns the (chunk, offset) of the first pair whose value is
+        not below value, or above it if after"""
+        if self.pending is not None:
+            self.settle()
+        find = bisect_right if after else bisect_left
+        i = find(self.maxima, value)
+        if i == len(self.maxima):
+            return i, 0
+        return i, find(self.values[i], value)
+
+    def between(self, start, stop):
+        """Returns the lists of keys from position start to stop"""
+        (i, j), (k, m) = start, stop
+        if (i, j) >= (k, m):
+            return []
+        if i == k:
+            return [self.keys[i][j:m]]
+        parts = [self.keys[i][j:]] + self.keys[i + 1:k]
+        if m:
+            parts.append(self.keys[k][:m])
+        return parts
+
+    def range(self, low=None, high=None, low_open=False, high_open=False):
+        """Returns the lists of keys of the values between low and high,
+        in order; a bound of None is no bound"""
+        if self.pending is not None:
+            self.settle()
+        start = (0, 0) if low is None else self.position(low, low_open)
+        stop = (len(self.maxima), 0) if high is None else \
+            self.position(high, not high_open)
+        return self.between(start, stop)
+
+
+class RangeIndex:
+    """Keeps the numbers the attrs of the instances of model hold sorted.
+
+    Values that are not numbers (including booleans and NaN) are kept
+    aside, and returned as candidates of every lookup: callers check
+    conditions on the candidates, as with HashIndex.
+    """
+
+    def __init__(self, attrs, model=None):
+        self.attrs = tuple(attrs)
+        self.model = model
+        self.clear()
+
+    def clear(self):
+        self.lists = {attr: SortedList() for attr in self.attrs}
+        self.aside = {attr: {} for attr in self.attrs}
+        # key -> the values of attrs it is stored with
+        self.entries = {}
+        # what add() reads each attribute with
+        self.layout = [(attr, getattr(self.model, attr, MISSING),
+                        self.lists[attr], self.aside[attr])
+                       for attr in self.attrs]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, key, obj):
+        """Stores the values of an instance or decoded record under key,
+        replacing those stored"""
+        record = obj if type(obj) is dict else obj._attributes()
+        old = self.entries.get(key)
+        values = []
+        for attr, default, sorted_list, aside in self.layout:
+            value = record.get(attr, default)
+            if old is not None:
+                previous = old[len(values)]
+                if type(previous) is type(value) and previous == value:
+                    values.append(value)
+                    continue
+                self.unstore(attr, key, previous)
+            values.append(value)
+            if (type(value) is int or type(value) is float) and \
+                    value == value:
+                sorted_list.insert(value, key)
+            elif value is not MISSING:
+                aside[key] = None
+        self.entries[key] = values
+
+    def discard(self, key):
+        """Removes key from the index"""
+        values = self.entries.pop(key, None)
+        if values is not None:
+            for attr, value in zip(self.attrs, values):
+                self.unstore(attr, key, value)
+
+    def unstore(self, attr, key, value):
+        if is_number(value):
+            self.lists[attr].remove(value, key)
+        else:
+            self.aside[attr].pop(key, None)
+
+    def bounds(self, attr, conditions):
+        """Returns the lists of keys of the values of attr satisfying the
+        range conditions on it, in order, or None if there are none"""
+        low = high = None
+        low_open = high_open = False
+        points = None
+        ranged = False
+        for name, op, value in conditions:
+            if name != attr or op not in RANGES:
+                continue
+            if op == "in":
+                try:
+                    items = {item for item in value if is_number(item)}
+                except TypeError:
+                    continue
+                points = items if points is None else points & items
+            elif not is_number(value):
+                continue
+            elif op == "eq":
+                points = {value} if points is None else points & {value}
+            elif op in ("gt", "gte"):
+                if low is None or value > low or \
+                        value == low and op == "gt":
+                    low, low_open = value, op == "gt"
+            elif high is None or value < high or \
+                    value == high and op == "lt":
+                high, high_open = value, op == "lt"
+            ranged = True
+        if not ranged:
+            return None
+        sorted_list = self.lists[attr]
+        if points is None:
+            return sorted_list.range(low, high, low_open, high_open)
+        parts = []
+        for point in sorted(points):
+            if (low is None or point > low or point == low and not low_open)\
+                    and (high is None or point < high or
+                         point == high and not high_open):
+                parts.extend(sorted_list.range(point, point))
+        return parts
+
+    def candidates(self, conditions):
+        """Returns the keys the range conditions narrow the conditions
+        down to, through the attribute with the fewest, or None"""
+        best = None
+        for attr in self.attrs:
+            parts = self.bounds(attr, conditions)
+            if parts is None:
+                continue
+            count = sum(map(len, parts)) + len(self.aside[attr])
+            if best is None or count < best[0]:
+                best = count, attr, parts
+        if best is None:
+            return None
+        _, attr, parts = best
+        keys = [key for part in parts for key in part]
+        keys.extend(self.aside[attr])
+        return keys
+
+    def ordered(self, attr, conditions=(), reverse=False):
+        """Yields the keys holding a number in attr by value, then key,
+        within the range conditions on attr"""
+        parts = self.bounds(attr, conditions)
+        if parts is None:
+            parts = self.lists[attr].range()
+        if reverse:
+            for part in reversed(parts):
+                yield from reversed(part)
+        else:
+            for part in parts:
+                yield from part
@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+"""Snapshot format with an on-disk hash index, read through mmap
+
+After the codec header come the records, one JSON document per line,
+then an open-addressing hash table with one slot per power of two, then
+a fixed size trailer:
+
+    slot:    8 bytes blake2b digest of the key, offset, length
+    trailer: records offset, table offset, slot count, record count,
+             b"HBNBSNAP"
+
+Opening a snapshot only reads the trailer, and get() hashes the key,
+probes the table from its slot and decodes that record alone, so the
+cost of both does not depend on the size of the store.
+"""
+import io
+import json
+import mmap
+import struct
+from hashlib import blake2b
+
+SLOT = struct.Struct("<8sQQ")
+TRAILER = struct.Struct("<QQQQ8s")
+MAGIC = b"HBNBSNAP"
+
+
+def digest(key):
+    return blake2b(key.encode(), digest_size=8).digest()
+
+
+def write(obj_dict, f):
+    """Writes the records of obj_dict and their index to the binary file
+    f, from its current position"""
+    records_offset = f.tell()
+    entries = []
+    for key, record in obj_dict.items():
+        data = json.dumps(record).encode()
+        entries.append((digest(key), f.tell(), len(data)))
+        f.write(data + b"\n")
+    slots = 8
+    while slots < 2 * len(entries):
+        slots *= 2
+    table = bytearray(slots * SLOT.size)
+    mask = slots - 1
+    for key_digest, offset, length in entries:
+        i = int.from_bytes(key_digest, "little") & mask
+        while SLOT.unpack_from(table, i * SLOT.size)[2]:
+            i = (i + 1) & mask
+        SLOT.pack_into(table, i * SLOT.size, key_digest, offset, length)
+    table_offset = f.tell()
+    f.write(table)
+    f.write(TRAILER.pack(records_offset, table_offset, slots, len(entries),
+                         MAGIC))
+
+
+class Snapshot:
+    """Read-only view of a snapshot file, decoding records on demand"""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        end = len(buffer) - TRAILER.size
+        if end < 0:
+            raise ValueError("truncated snapshot")
+        (self.records_offset, self.table_offset, self.slots, self.count,
+         magic) = TRAILER.unpack_from(buffer, end)
+        if magic != MAGIC:
+            raise ValueError("not a snapshot file")
+        self.mask = self.slots - 1
+
+    @classmethod
+    def open(cls, f):
+        """Maps the file f, or reads it if it is not backed by one"""
+        try:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, io.UnsupportedOperation):
+            f.seek(0)
+            return cls(f.read())
+
+    def __len__(self):
+        return self.count
+
+    def get(self, key):
+        """Returns the record stored under key, or None"""
+        key_digest = digest(key)
+        i = int.from_bytes(key_digest, "little") & self.mask
+        while True:
+            slot_digest, offset, length = SLOT.unpack_from(
+                self.buffer, self.table_offset + i * SLOT.size)
+            if not length:
+                return None
+            if slot_digest == key_digest:
+                record = json.loads(self.buffer[offset:offset + length])
+                if f"{record['__class__']}.{record['id']}" == key:
+                    return record
+            i = (i + 1) & self.mask
+
+    def items(self):
+        """Yields every (key, record) pair in file order"""
+        start = self.records_offset
+        while start < self.table_offset:
+            end = self.buffer.find(b"\n", start, self.table_offset)
+            record = json.loads(self.buffer[start:end])
+            yield f"{record['__class__']}.{record['id']}", record
+            start = end + 1
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
@@ -0,0 +1,147 @@
+#!/usr/bin/python3
+"""Optional instrumentation of the storage and model hot paths
+
+With HBNB_STATS=1 (or after enable()), the methods registered with
+instrument() are wrapped to time every call, and the storage engines
+count what they write. snapshot() returns the figures. When off, the
+methods are left unwrapped and the counters cost one test per file
+written.
+
+Durations go to histograms with four buckets per power of two, so the
+p50 and p99 they report are within about 20% of the exact values.
+"""
+import functools
+import os
+import threading
+import time
+
+enabled = os.getenv("HBNB_STATS") == "1"
+
+_lock = threading.Lock()
+_timers = {}
+_counters = {}
+# (class, method name) -> original function, for every instrumented one
+_targets = {}
+
+
+class Histogram:
+    """Call count, total and distribution of durations in nanoseconds"""
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0
+        self.max = 0
+        self.buckets = {}
+
+    @staticmethod
+    def bucket(ns):
+        bits = ns.bit_length()
+        if bits < 3:
+            return ns
+        return (bits << 2) | ((ns >> (bits - 3)) & 3)
+
+    @staticmethod
+    def upper(bucket):
+        """Returns the largest duration falling in bucket"""
+        if bucket < 12:
+            return bucket
+        bits, quarter = bucket >> 2, bucket & 3
+        return ((5 + quarter) << (bits - 3)) - 1
+
+    def add(self, ns):
+        bucket = self.bucket(ns)
+        with _lock:
+            self.calls += 1
+            self.total += ns
+            if ns > self.max:
+                self.max = ns
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def quantile(self, q):
+        """Returns about the duration under which a q fraction of the
+        calls ran"""
+        rank = q * self.calls
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.upper(bucket), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "calls": self.calls,
+            "total_ms": self.total / 1e6,
+            "mean_us": self.total / self.calls / 1e3 if self.calls else 0.0,
+            "p50_us": self.quantile(0.5) / 1e3,
+            "p99_us": self.quantile(0.99) / 1e3,
+            "max_us": self.max / 1e3,
+        }
+
+
+def timed(name, func):
+    """Returns func wrapped to record its durations under name"""
+    histogram = _timers.setdefault(name, Histogram())
+    clock = time.perf_counter_ns
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            histogram.add(clock() - start)
+    return wrapper
+
+
+def instrument(cls, *names):
+    """Registers methods of cls to be timed, wrapping them now if
+    instrumentation is on"""
+    for name in names:
+        _targets[(cls, name)] = cls.__dict__[name]
+        if enabled:
+            setattr(cls, name, timed(f"{cls.__name__}.{name}",
+                                     cls.__dict__[name]))
+
+
+def count(name, amount=1):
+    """Adds amount to the counter name; callers check `enabled` first"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def enable():
+    """Turns instrumentation on, wrapping the registered methods"""
+    global enabled
+    if not enabled:
+        enabled = True
+        for (cls, name), func in _targets.items():
+            setattr(cls, name, timed(f"{cls.__name__}.{name}", func))
+
+
+def disable():
+    """Turns instrumentation off, restoring the registered methods"""
+    global enabled
+    if enabled:
+        enabled = False
+        for (cls, name), func in _targets.items():
+            setattr(cls, name, func)
+
+
+def reset():
+    """Forgets every figure recorded so far"""
+    with _lock:
+        for histogram in _timers.values():
+            histogram.__init__()
+        _counters.clear()
+
+
+def snapshot():
+    """Returns the figures recorded so far: a summary per timed method
+    and the counters, by name"""
+    with _lock:
+        timers = {name: histogram.summary()
+                  for name, histogram in sorted(_timers.items())
+                  if histogram.calls}
+        counters = dict(sorted(_counters.items()))
+    return {"enabled": enabled, "timers": timers, "counters": counters}
@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+"""Inverted index of text attributes, behind search()
+
+Text is split into words (runs of letters, digits and underscores). The
+default normalizer also folds case and drops accents, so that "Café"
+and "cafe" are the same term; words are not stemmed. Matches are ranked
+with Okapi BM25.
+
+The index can be dumped to plain types and loaded back as is, which is
+several times faster than indexing the text again. Each document keeps
+a checksum of its text, so that adding an unchanged instance to a
+loaded index costs a checksum rather than tokenizing it again.
+"""
+import heapq
+import math
+import re
+import unicodedata
+import zlib
+from collections import Counter
+
+from models.engine.query import MISSING
+
+WORD = re.compile(r"\w+")
+ACCENTS = re.compile(r"[\u0300-\u036f]")
+
+
+def normalize(text):
+    """Folds case and drops accents"""
+    text = text.casefold()
+    if not text.isascii():
+        text = ACCENTS.sub("", unicodedata.normalize("NFKD", text))
+    return text
+
+
+class TextIndex:
+    """Maps the terms of the attrs of instances to the keys holding them.
+
+    Values that are not strings are not indexed. normalize=False only
+    lowers the case of the words.
+    """
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, attrs, model=None, normalize=True):
+        self.attrs = tuple(attrs)
+        self.defaults = tuple(getattr(model, attr, MISSING)
+                              for attr in self.attrs)
+        self.normalize = normalize
+        self.clear()
+
+    def clear(self):
+        # term -> {key: term frequency}
+        self.postings = {}
+        # key -> (checksum, length, terms)
+        self.docs = {}
+        self.total = 0
+        # keys loaded from a dump that no add() has confirmed yet
+        self.restored = set()
+        # documents added or removed since the last dump()
+        self.changes = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def terms(self, text):
+        """Returns the terms of text, in order"""
+        text = normalize(text) if self.normalize else text.lower()
+        return WORD.findall(text)
+
+    def add(self, key, obj):
+        """Indexes the text of an instance or decoded record under key"""
+        record = obj if type(obj) is dict else obj._attributes()
+        values = [record.get(attr, default)
+                  for attr, default in zip(self.attrs, self.defaults)]
+        text = "\n".join(value for value in values if type(value) is str)
+        checksum = zlib.crc32(text.encode(errors="surrogatepass"))
+        doc = self.docs.get(key)
+        if self.restored:
+            self.restored.discard(key)
+        if doc is not None:
+            if doc[0] == checksum:
+                return
+            self.discard(key)
+        terms = self.terms(text)
+        if not terms:
+            return
+        counts = Counter(terms)
+        self.docs[key] = (checksum, len(terms), tuple(counts))
+        self.total += len(terms)
+        self.changes += 1
+        postings = self.postings
+        for term, count in counts.items():
+            posting = postings.get(term)
+            if posting is None:
+                posting = postings[term] = {}
+            posting[key] = count
+
+    def discard(self, key):
+        """Removes key from the index"""
+        doc = self.docs.pop(key, None)
+        if doc is None:
+            return
+        self.total -= doc[1]
+        for term in doc[2]:
+            posting = self.postings[term]
+            del posting[key]
+            if not posting:
+                del self.postings[term]
+        self.changes += 1
+
+    def settle(self):
+        """Drops the loaded documents that no add() confirmed, once every
+        instance has been added"""
+        for key in self.restored:
+            self.discard(key)
+        self.restored = set()
+
+    def search(self, text, limit=None):
+        """Returns the (score, key) pairs of the documents holding any
+        term of text, best first"""
+        if not self.docs:
+            return []
+        count = len(self.docs)
+        average = self.total / count
+        k1, b = self.k1, self.b
+        docs = self.docs
+        scores = {}
+        for term in dict.fromkeys(self.terms(text)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) /
+                           (len(posting) + 0.5))
+            for key, frequency in posting.items():
+                norm = k1 * (1 - b + b * docs[key][1] / average)
+                scores[key] = scores.get(key, 0.0) + \
+                    idf * frequency * (k1 + 1) / (frequency + norm)
+        ranked = ((-score, key) for key, score in scores.items())
+        if limit is None:
+            ranked = sorted(ranked)
+        else:
+            ranked = heapq.nsmallest(limit, ranked)
+        return [(-score, key) for score, key in ranked]
+
+    def dump(self):
+        """Returns the index as plain types for load(), sharing its
+        containers"""
+        self.changes = 0
+        return {"attrs": list(self.attrs), "normalize": self.normalize,
+                "postings": self.postings, "docs": self.docs,
+                "total": self.total}
+
+    def load(self, data):
+        """Takes over the containers of a dump() of an index of the same
+        attributes, and tells whether it was one"""
+        if not isinstance(data, dict) or \
+                data.get("attrs") != list(self.attrs) or \
+                data.get("normalize") != self.normalize or \
+                type(data.get("postings")) is not dict or \
+                type(data.get("docs")) is not dict:
+            return False
+        self.clear()
+        self.postings, self.docs = data["postings"], data["docs"]
+        self.total = data.get("total", 0)
+        self.restored = set(self.docs)
+        return True
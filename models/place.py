@@ -14,3 +14,22 @@ class Place(BaseModel):
     latitude = 0.0
     longitude = 0.0
     amenity_ids = []
+    _references = ("city_id", "user_id", "amenity_ids")
+    _columns = ("city_id", "price_by_night", "number_rooms",
+                "number_bathrooms", "max_guest", "latitude", "longitude")
+    _ranges = ("price_by_night", "number_rooms", "max_guest")
+    _bitmaps = ("amenity_ids",)
+    _location = ("latitude", "longitude")
+    _text = ("name", "description")
+
+    @property
+    def reviews(self):
+        """The reviews of this place"""
+        return self._referrers("Review", "place_id")
+
+    @property
+    def amenities(self):
+        """The amenities listed in amenity_ids"""
+        from models import storage
+        amenities = (storage.get("Amenity", id) for id in self.amenity_ids)
+        return [amenity for amenity in amenities if amenity is not None]
@@ -6,3 +6,5 @@ class Review(BaseModel):
     place_id = ""
     user_id = ""
     text = ""
+    _references = ("place_id", "user_id")
+    _text = ("text",)
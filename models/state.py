@@ -4,3 +4,8 @@ from models.base_model import BaseModel
 class State(BaseModel):
     """State class that inherits from BaseModel"""
     name = ""
+
+    @property
+    def cities(self):
+        """The cities of this state"""
+        return self._referrers("City", "state_id")
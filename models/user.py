@@ -7,3 +7,13 @@ class User(BaseModel):
     password = ""
     first_name = ""
     last_name = ""
+
+    @property
+    def places(self):
+        """The places this user owns"""
+        return self._referrers("Place", "user_id")
+
+    @property
+    def reviews(self):
+        """The reviews this user wrote"""
+        return self._referrers("Review", "user_id")
@@ -0,0 +1,256 @@
+#!/usr/bin/python3
+"""Unit tests for the console."""
+import json
+import os
+import unittest
+from io import StringIO
+from unittest.mock import patch
+from console import HBNBCommand
+from models import storage
+from models.base_model import BaseModel
+from models.engine import stats
+
+
+class TestHBNBCommandBatch(unittest.TestCase):
+    """Test cases for the begin, commit and flush commands."""
+
+    def setUp(self):
+        """Start from an empty storage and no file."""
+        storage._FileStorage__objects = {}
+        self.tearDown()
+
+    def tearDown(self):
+        """Remove the file and end any batch."""
+        storage._FileStorage__batch = False
+        storage._FileStorage__dirty = False
+        try:
+            os.remove("file.json")
+        except FileNotFoundError:
+            pass
+
+    def run_cmd(self, line):
+        """Run one console command and return what it printed"""
+        with patch("sys.stdout", new=StringIO()) as output:
+            HBNBCommand().onecmd(line)
+        return output.getvalue().strip()
+
+    def stored_ids(self):
+        """Return the ids written to file.json"""
+        storage._FileStorage__objects = {}
+        storage.reload()
+        return {obj.id for obj in storage.all().values()}
+
+    def test_batch_writes_once_on_commit(self):
+        """Inside a batch nothing is written until commit"""
+        self.run_cmd("begin")
+        first = self.run_cmd("create User")
+        second = self.run_cmd("create State")
+        self.run_cmd(f'update User {first} first_name "Betty"')
+        self.assertFalse(os.path.exists("file.json"))
+        self.run_cmd("commit")
+        self.assertEqual(self.stored_ids(), {first, second})
+        self.assertIn("Betty", self.run_cmd(f"show User {first}"))
+
+    def test_flush_inside_batch(self):
+        """flush writes immediately and the batch goes on"""
+        self.run_cmd("begin")
+        user = self.run_cmd("create User")
+        self.run_cmd("flush")
+        self.assertEqual(self.stored_ids(), {user})
+        self.run_cmd(f"destroy User {user}")
+        self.assertEqual(self.stored_ids(), {user})
+
+    def test_exit_commits(self):
+        """Ending the session writes what the batch saved"""
+        console = HBNBCommand()
+        storage.begin()
+        with patch("sys.stdout", new=StringIO()):
+            with patch("builtins.input",
+                       side_effect=["create City", EOFError]):
+                console.cmdloop()
+        self.assertEqual(len(self.stored_ids()), 1)
+
+    def test_without_batch(self):
+        """Outside a batch every command writes"""
+        user = self.run_cmd("create User")
+        self.assertTrue(os.path.exists("file.json"))
+        self.assertEqual(self.stored_ids(), {user})
+
+
+class TestHBNBCommandAll(unittest.TestCase):
+    """Test cases for the all command."""
+
+    def setUp(self):
+        """Create three users and a state."""
+        storage._FileStorage__objects = {}
+        from models.state import State
+        from models.user import User
+        self.users = [User() for _ in range(3)]
+        self.state = State()
+
+    def tearDown(self):
+        """Tear down test environment."""
+        storage._FileStorage__objects = {}
+
+    def run_cmd(self, line):
+        """Run one console command and return what it printed"""
+        with patch("sys.stdout", new=StringIO()) as output:
+            HBNBCommand().onecmd(line)
+        return output.getvalue()
+
+    def test_list_output(self):
+        """The default output is the printed list of strings"""
+        expected = [str(user) for user in self.users]
+        self.assertEqual(self.run_cmd("all User"), f"{expected}\n")
+        expected.append(str(self.state))
+        self.assertEqual(self.run_cmd("all"), f"{expected}\n")
+        self.assertEqual(self.run_cmd("all Place"), "[]\n")
+
+    def test_paging(self):
+        """limit and offset select a slice of the instances"""
+        expected = [str(user) for user in self.users[1:2]]
+        self.assertEqual(self.run_cmd("all User limit=1 offset=1"),
+                         f"{expected}\n")
+        self.assertEqual(self.run_cmd("all User offset=3"), "[]\n")
+        self.assertEqual(self.run_cmd("all limit=0"), "[]\n")
+
+    def test_lines(self):
+        """lines prints one instance per line"""
+        output = self.run_cmd("all User lines limit=2")
+        self.assertEqual(output.splitlines(),
+                         [str(user) for user in self.users[:2]])
+
+    def test_errors(self):
+        """Unknown classes and options are reported"""
+        self.assertEqual(self.run_cmd("all Foo"),
+                         "** class doesn't exist **\n")
+        self.assertEqual(self.run_cmd("all User limit=x"),
+                         "** invalid option: limit=x **\n")
+
+
+class TestHBNBCommandStats(unittest.TestCase):
+    """Test cases for the stats command."""
+
+    def run_cmd(self, line):
+        """Run one console command and return what it printed"""
+        with patch("sys.stdout", new=StringIO()) as output:
+            HBNBCommand().onecmd(line)
+        return output.getvalue().strip()
+
+    def test_stats(self):
+        """stats prints the figures, as a table or as JSON"""
+        was_enabled = stats.enabled
+        stats.enable()
+        self.addCleanup(lambda: was_enabled or stats.disable())
+        stats.reset()
+        BaseModel()
+        self.assertIn("FileStorage.new", self.run_cmd("stats"))
+        figures = json.loads(self.run_cmd("stats json"))
+        self.assertEqual(figures["timers"]["FileStorage.new"]["calls"], 1)
+        self.run_cmd("stats reset")
+        self.assertEqual(self.run_cmd("stats"), "")
+        self.assertIn("invalid option", self.run_cmd("stats foo"))
+        storage._FileStorage__objects = {}
+
+
+class TestHBNBCommandNear(unittest.TestCase):
+    """Test cases for the near and within commands."""
+
+    def setUp(self):
+        """Store two places in Paris and one in London."""
+        from models.place import Place
+        storage._FileStorage__objects = {}
+        self.places = []
+        for point in ((48.86, 2.35), (48.85, 2.29), (51.51, -0.13)):
+            place = Place()
+            place.latitude, place.longitude = point
+            self.places.append(place)
+
+    def tearDown(self):
+        storage._FileStorage__objects = {}
+
+    def run_cmd(self, line):
+        """Run one console command and return its lines"""
+        with patch("sys.stdout", new=StringIO()) as output:
+            HBNBCommand().onecmd(line)
+        return output.getvalue().splitlines()
+
+    def test_near(self):
+        """near prints the nearest places first, with their distance"""
+        lines = self.run_cmd("near Place 48.8584 2.2945 radius=10")
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith("0.990 km [Place]"))
+        self.assertIn(self.places[1].id, lines[0])
+        lines = self.run_cmd("near Place 51.5 0 k=1")
+        self.assertEqual(len(lines), 1)
+        self.assertIn(self.places[2].id, lines[0])
+        self.assertEqual(len(self.run_cmd("near Place 0 0")), 3)
+        self.assertEqual(self.run_cmd("near Place 0 0 k=0"), [])
+
+    def test_within(self):
+        """within prints the places in a box"""
+        lines = self.run_cmd("within Place 48 2 49 3")
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(self.run_cmd("within Place 0 0 1 1"), [])
+
+    def test_errors(self):
+        """Missing or invalid arguments are reported"""
+        self.assertEqual(self.run_cmd("near"), ["** class name missing **"])
+        self.assertEqual(self.run_cmd("near Foo 1 2"),
+                         ["** class doesn't exist **"])
+        self.assertEqual(self.run_cmd("near Place 1"),
+                         ["** latitude and longitude missing **"])
+        self.assertEqual(self.run_cmd("near Place 95 0"),
+                         ["** invalid coordinates **"])
+        self.assertEqual(self.run_cmd("near Place 1 2 r=3"),
+                         ["** invalid option: r=3 **"])
+        self.assertEqual(self.run_cmd("within Place 1 2 3"),
+                         ["** south, west, north and east needed **"])
+        self.assertEqual(self.run_cmd("near Place 0 0 radius=nan"),
+                         ["** invalid option: radius=nan **"])
+        self.assertEqual(self.run_cmd("near Place inf 0"),
+                         ["** latitude and longitude missing **"])
+        for box in ("nan 0 1 1", "0 0 inf inf"):
+            self.assertEqual(self.run_cmd(f"within Place {box}"),
+                             ["** south, west, north and east needed **"])
+
+
+class TestHBNBCommandSearch(unittest.TestCase):
+    """Test cases for the search command."""
+
+    def setUp(self):
+        """Store two reviews."""
+        from models.review import Review
+        storage._FileStorage__objects = {}
+        self.reviews = [Review(), Review()]
+        self.reviews[0].text = "Great view"
+        self.reviews[1].text = "Great host, great view"
+
+    def tearDown(self):
+        storage._FileStorage__objects = {}
+
+    def run_cmd(self, line):
+        """Run one console command and return its lines"""
+        with patch("sys.stdout", new=StringIO()) as output:
+            HBNBCommand().onecmd(line)
+        return output.getvalue().splitlines()
+
+    def test_search(self):
+        """search prints the best matches first, with their score"""
+        lines = self.run_cmd("search Review great host")
+        self.assertEqual(len(lines), 2)
+        self.assertIn(self.reviews[1].id, lines[0])
+        self.assertIn("[Review]", lines[1])
+        self.assertEqual(self.run_cmd("search Review pool"), [])
+
+    def test_errors(self):
+        """Missing arguments are reported"""
+        self.assertEqual(self.run_cmd("search"), ["** class name missing **"])
+        self.assertEqual(self.run_cmd("search Foo x"),
+                         ["** class doesn't exist **"])
+        self.assertEqual(self.run_cmd("search Review"),
+                         ["** words missing **"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+"""Unit tests for the asyncio storage facade."""
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from models.base_model import BaseModel
+from models.engine.async_storage import AsyncStorage
+from models.engine.db_storage import DBStorage
+from models.engine.file_storage import FileStorage
+
+
+class SlowStorage:
+    """Storage stub whose save() takes a while and records its thread"""
+
+    def __init__(self, fail=False):
+        self.saves = 0
+        self.threads = set()
+        self.fail = fail
+
+    def save(self):
+        self.threads.add(threading.get_ident())
+        time.sleep(0.05)
+        self.saves += 1
+        if self.fail:
+            raise OSError("disk full")
+
+
+class TestAsyncStorage(unittest.IsolatedAsyncioTestCase):
+    """Test cases for AsyncStorage."""
+
+    async def asyncSetUp(self):
+        """Wrap a thread-safe storage on an empty file."""
+        self.fs = FileStorage(threadsafe=True)
+        self.fs._FileStorage__objects = {}
+        self.fs.clear()
+        self.storage = AsyncStorage(self.fs, batch_size=3)
+
+    async def asyncTearDown(self):
+        """Stop the worker and remove the file."""
+        await self.storage.aclose()
+        try:
+            os.remove("file.json")
+        except FileNotFoundError:
+            pass
+
+    def add(self, count):
+        now = datetime.now().isoformat()
+        for i in range(count):
+            self.fs.new(BaseModel(id=str(i), created_at=now,
+                                  updated_at=now))
+
+    async def test_save_and_reload(self):
+        """asave() writes and areload() reads back in the worker"""
+        self.add(5)
+        await self.storage.asave()
+        fs = FileStorage()
+        fs._FileStorage__objects = {}
+        other = AsyncStorage(fs)
+        await other.areload()
+        self.assertEqual(await other.acount(), 5)
+        self.assertEqual((await other.aget(BaseModel, "3")).id, "3")
+        await other.aclose()
+
+    async def test_async_iteration(self):
+        """async for reads every instance, in batches"""
+        self.add(7)
+        ids = [obj.id async for obj in self.storage]
+        self.assertEqual(sorted(ids), [str(i) for i in range(7)])
+        found = await self.storage.aquery(BaseModel, id="4")
+        self.assertEqual(list(found), ["BaseModel.4"])
+
+    async def test_db_storage(self):
+        """A DBStorage reloaded on this thread is used in the worker"""
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        db = DBStorage(path)
+        db.reload()
+        storage = AsyncStorage(db, batch_size=2)
+        now = datetime.now().isoformat()
+        for i in range(3):
+            db.new(BaseModel(id=str(i), created_at=now, updated_at=now))
+        await storage.asave()
+        self.assertEqual(await storage.acount(BaseModel), 3)
+        self.assertEqual((await storage.aget(BaseModel, "1")).id, "1")
+        self.assertEqual(sorted([obj.id async for obj in storage]),
+                         ["0", "1", "2"])
+        await storage.aclose()
+        db.close()
+
+    async def test_saves_are_coalesced(self):
+        """Saves requested during a save share the next one"""
+        slow = SlowStorage()
+        storage = AsyncStorage(slow)
+        await asyncio.gather(*(storage.asave() for _ in range(10)))
+        self.assertLessEqual(slow.saves, 2)
+        await storage.asave()
+        self.assertLessEqual(slow.saves, 3)
+        self.assertNotIn(threading.get_ident(), slow.threads)
+        await storage.aclose()
+
+    async def test_save_error(self):
+        """A failed save raises in every caller waiting for it"""
+        storage = AsyncStorage(SlowStorage(fail=True))
+        results = await asyncio.gather(
+            storage.asave(), storage.asave(), return_exceptions=True)
+        self.assertTrue(all(isinstance(r, OSError) for r in results))
+        await storage.aclose()
+
+    async def test_loop_not_blocked(self):
+        """The event loop keeps running while a save is written"""
+        storage = AsyncStorage(SlowStorage())
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        ticker = asyncio.ensure_future(tick())
+        await storage.asave()
+        ticker.cancel()
+        self.assertGreater(ticks, 3)
+        await storage.aclose()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+"""Unit tests for the BitmapIndex."""
+import random
+import unittest
+from models.engine.bitmaps import BitmapIndex
+from models.engine.query import matches, parse
+from models.place import Place
+
+
+class TestBitmapIndex(unittest.TestCase):
+    """Test cases for BitmapIndex, checked against a full scan."""
+
+    def setUp(self):
+        rand = random.Random(0)
+        self.records = {}
+        self.index = BitmapIndex(Place._bitmaps, Place)
+        for i in range(200):
+            record = {"amenity_ids": rand.sample("abcdefgh",
+                                                 rand.randrange(5))}
+            if i % 40 == 0:
+                record["amenity_ids"] = "abc"
+            self.add(f"Place.{i:03}", record)
+
+    def add(self, key, record):
+        self.records[key] = record
+        self.index.add(key, record)
+
+    def check(self, **predicates):
+        """candidates() gives every match, and only matches of the lists
+        that are not kept aside"""
+        conditions = parse(predicates)
+        candidates = self.index.candidates(conditions)
+        aside = self.index.aside["amenity_ids"]
+        expected = sorted(key for key, record in self.records.items()
+                          if matches(record, conditions, Place))
+        self.assertEqual(
+            sorted(key for key in candidates if key not in aside),
+            [key for key in expected if key not in aside])
+        self.assertLessEqual(set(expected), set(candidates))
+
+    def test_candidates(self):
+        """contains and all conditions intersect the bitmaps"""
+        self.check(amenity_ids__contains="a")
+        self.check(amenity_ids__all=["a", "b"])
+        self.check(amenity_ids__all=("b", "c", "z"))
+        self.check(amenity_ids__all=["c"], amenity_ids__contains="d")
+        self.assertIsNone(self.index.candidates(parse({"name": "a"})))
+        self.assertIsNone(self.index.candidates(
+            parse({"amenity_ids__all": []})))
+
+    def test_updates(self):
+        """Rows are updated, freed and reused"""
+        keys = list(self.records)
+        for key in keys[::2]:
+            self.index.discard(key)
+            del self.records[key]
+        for key in keys[1::4]:
+            self.add(key, {"amenity_ids": ["h"]})
+        self.add("Place.new", {"amenity_ids": [["unhashable"], "a"]})
+        self.add("Place.old", {})
+        self.check(amenity_ids__all=["a", "b"])
+        self.check(amenity_ids__contains="h")
+        self.assertEqual(len(self.index.keys), 200)
+        self.assertEqual(self.index.candidates(
+            parse({"amenity_ids__contains": "z"})), ["Place.new"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+#!/usr/bin/python3
+"""Unit tests for the snapshot codecs."""
+import io
+import unittest
+from models.engine import codecs
+
+
+class TestCodecs(unittest.TestCase):
+    """Test cases for codecs.dump() and codecs.load()."""
+
+    data = {
+        "Place.1": {"__class__": "Place", "id": "1", "max_guest": 4,
+                    "latitude": 1.5, "amenity_ids": ["a", "b"]},
+        "User.2": {"__class__": "User", "id": "2", "email": "é@x"},
+    }
+
+    def round_trip(self, name, stream=False):
+        f = io.BytesIO()
+        codecs.dump(self.data, f, name)
+        f.seek(0)
+        return f.getvalue(), dict(codecs.load(io.BufferedReader(f), stream))
+
+    def test_round_trip(self):
+        """Every codec reads back what it wrote"""
+        for name in codecs.CODECS:
+            self.assertEqual(self.round_trip(name)[1], self.data)
+
+    def test_json_has_no_header(self):
+        """JSON snapshots stay plain JSON, streamable"""
+        raw, loaded = self.round_trip("json", stream=True)
+        self.assertTrue(raw.startswith(b"{"))
+        self.assertEqual(loaded, self.data)
+
+    def test_binary_header(self):
+        """Binary snapshots name their codec in a header line"""
+        raw = self.round_trip("marshal")[0]
+        self.assertTrue(raw.startswith(b"HBNB marshal\n"))
+
+    def test_unknown_codec(self):
+        """Unknown codec names raise ValueError"""
+        with self.assertRaises(ValueError):
+            codecs.get("yaml")
+        f = io.BufferedReader(io.BytesIO(b"HBNB yaml\n..."))
+        with self.assertRaises(ValueError):
+            codecs.load(f)
+
+
+if __name__ == "__main__":
+    unittest.main()
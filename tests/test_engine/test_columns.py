@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+"""Unit tests for the ColumnStore."""
+import unittest
+from unittest import mock
+from models.engine import columns
+from models.engine.columns import ColumnStore, pairs, summarize
+from models.engine.query import matches, parse
+from models.place import Place
+
+PLACES = {
+    "Place.1": {"city_id": "a", "price_by_night": 100, "max_guest": 2},
+    "Place.2": {"city_id": "a", "price_by_night": 50, "max_guest": 4},
+    "Place.3": {"city_id": "b", "price_by_night": 80, "max_guest": 6},
+    "Place.4": {"city_id": "b", "price_by_night": "free"},
+    "Place.5": {"city_id": ["b"], "price_by_night": 10},
+}
+
+
+class TestColumnStore(unittest.TestCase):
+    """Test cases for ColumnStore, scanned with NumPy when installed."""
+
+    def setUp(self):
+        self.store = ColumnStore(Place._columns, Place)
+        for key, record in PLACES.items():
+            self.store.add(key, record)
+
+    def check(self, **predicates):
+        """select() finds what matches() does"""
+        conditions = parse(predicates)
+        self.assertTrue(self.store.covers(conditions))
+        self.assertEqual(
+            sorted(self.store.select(conditions)),
+            [key for key, record in PLACES.items()
+             if matches(record, conditions, Place)])
+
+    def test_select(self):
+        """Numeric and coded columns are filtered like matches()"""
+        self.check(price_by_night__gte=80)
+        self.check(price_by_night__ne=100)
+        self.check(price_by_night__in=[10, 50])
+        self.check(city_id="b", max_guest__lt=5)
+        self.check(city_id__ne="a")
+        self.check(city_id__in=["a", "c"])
+        self.check(city_id="c")
+
+    def test_conditions_left_out(self):
+        """Conditions a column cannot evaluate are left to the caller"""
+        self.assertFalse(self.store.covers(parse({"name": "loft"})))
+        self.assertFalse(self.store.covers(parse({"max_guest": True})))
+        self.assertFalse(self.store.covers(parse({"city_id__in": "ab"})))
+        self.assertIsNone(self.store.select(parse({"name": "loft"})))
+
+    def test_add_replaces_and_discard_frees(self):
+        """Rows are updated in place and reused once discarded"""
+        self.store.add("Place.1", {"city_id": "b", "price_by_night": 1})
+        self.store.discard("Place.2")
+        self.assertEqual(self.store.select(parse({"city_id__ne": "b"})),
+                         ["Place.5"])
+        self.store.add("Place.6", {"city_id": "c"})
+        self.assertEqual(len(self.store), 5)
+        self.assertEqual(len(self.store.keys), 5)
+        self.assertEqual(self.store.select(parse({"city_id": "c"})),
+                         ["Place.6"])
+
+    def test_aggregate(self):
+        """Figures skip values that are not numbers"""
+        figures = self.store.aggregate("price_by_night", by="city_id")
+        self.assertEqual(figures, {
+            "a": {"count": 2, "sum": 150, "min": 50, "max": 100,
+                  "mean": 75.0},
+            "b": {"count": 1, "sum": 80, "min": 80, "max": 80,
+                  "mean": 80.0},
+        })
+        self.assertIs(type(figures["a"]["min"]), int)
+        self.assertEqual(self.store.aggregate(
+            "price_by_night", conditions=parse({"max_guest__gte": 4})),
+            {"count": 2, "sum": 130, "min": 50, "max": 80, "mean": 65.0})
+        self.assertIsNone(self.store.aggregate(
+            "price_by_night", conditions=parse({"city_id": "c"})))
+        self.assertEqual(self.store.aggregate("latitude")["sum"], 0.0)
+
+    def test_bools(self):
+        """A bool is filtered as 0 or 1, like matches() does, but left
+        out of the figures, like values that are not numbers"""
+        records = dict(PLACES)
+        records["Place.6"] = {"city_id": "a", "price_by_night": True,
+                              "max_guest": 3}
+        self.store.add("Place.6", records["Place.6"])
+        for predicates in ({"price_by_night__lte": 20},
+                           {"price_by_night": 1},
+                           {"price_by_night__in": [1, 50]},
+                           {"price_by_night__ne": 1}):
+            conditions = parse(predicates)
+            self.assertEqual(sorted(self.store.select(conditions)), [
+                key for key, record in records.items()
+                if matches(record, conditions, Place)])
+        conditions = parse({"price_by_night__lte": 20})
+        self.assertEqual(
+            self.store.aggregate("max_guest", conditions=conditions),
+            {"count": 2, "sum": 3, "min": 0, "max": 3, "mean": 1.5})
+        self.assertEqual(
+            self.store.aggregate("price_by_night", conditions=conditions),
+            {"count": 1, "sum": 10, "min": 10, "max": 10, "mean": 10.0})
+        self.store.add("Place.6", {"price_by_night": 5})
+        self.assertEqual(
+            self.store.aggregate("price_by_night", conditions=conditions),
+            {"count": 2, "sum": 15, "min": 5, "max": 10, "mean": 7.5})
+
+    def test_aggregate_non_finite(self):
+        """NaN and infinities are left out of the figures, as they are
+        by summarize() of pairs() over the records"""
+        records = dict(PLACES)
+        records["Place.6"] = {"city_id": "a", "price_by_night": float("nan"),
+                              "latitude": float("inf")}
+        records["Place.7"] = {"city_id": "b",
+                              "price_by_night": float("-inf"),
+                              "latitude": 1.5}
+        for key in ("Place.6", "Place.7"):
+            self.store.add(key, records[key])
+        for attr, integral in (("price_by_night", True),
+                               ("latitude", False)):
+            for by in (None, "city_id"):
+                expected = summarize(pairs(records.values(), attr, by, Place),
+                                     integral)
+                if by is None:
+                    expected = expected.get(None)
+                self.assertEqual(self.store.aggregate(attr, by), expected)
+
+    def test_summarize(self):
+        """summarize() computes the figures of each group"""
+        self.assertEqual(summarize([("x", 2), ("x", 4), ("y", 1)]), {
+            "x": {"count": 2, "sum": 6, "min": 2, "max": 4, "mean": 3.0},
+            "y": {"count": 1, "sum": 1, "min": 1, "max": 1, "mean": 1.0},
+        })
+
+
+@unittest.skipIf(columns.numpy is None, "NumPy is not installed")
+class TestColumnStoreWithoutNumPy(TestColumnStore):
+    """The same cases, scanned in Python."""
+
+    def setUp(self):
+        patcher = mock.patch.object(columns, "numpy", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp()
+
+
+if __name__ == "__main__":
+    unittest.main()
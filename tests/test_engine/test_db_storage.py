@@ -0,0 +1,191 @@
+#!/usr/bin/python3
+"""Unit tests for DBStorage."""
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+from models import storage
+from models.base_model import BaseModel
+from models.engine.db_storage import DBStorage
+from models.state import State
+from models.user import User
+
+
+class TestDBStorage(unittest.TestCase):
+    """Test cases for the SQLite storage engine."""
+
+    def setUp(self):
+        """Open a storage on a fresh database file."""
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.db = DBStorage(self.db_path)
+        self.db.reload()
+
+    def tearDown(self):
+        """Close and remove the database."""
+        self.db.close()
+        os.remove(self.db_path)
+        storage._FileStorage__objects = {}
+
+    def reopened(self):
+        """Return a second storage on the same database"""
+        db = DBStorage(self.db_path)
+        db.reload()
+        self.addCleanup(db.close)
+        return db
+
+    def test_new_save_get(self):
+        """Saved instances can be read back by id"""
+        user = User()
+        user.email = "a@b.c"
+        self.db.new(user)
+        self.db.save()
+        self.assertIs(self.db.get(User, user.id), user)
+        other = self.reopened().get("User", user.id)
+        self.assertEqual(other.email, "a@b.c")
+        self.assertEqual(other.to_dict(), user.to_dict())
+        self.assertIsNone(self.db.get(User, "missing"))
+        self.assertIsNone(self.db.get(State, user.id))
+
+    def test_refresh(self):
+        """refresh() drops stale instances once another connection
+        commits"""
+        user = User()
+        self.db.new(user)
+        self.db.save()
+        other = self.reopened()
+        self.assertFalse(other.refresh())
+        stale = other.get(User, user.id)
+        user.email = "new@b.c"
+        self.db.new(user)
+        self.db.save()
+        self.assertTrue(other.refresh())
+        self.assertFalse(other.refresh())
+        self.assertIsNot(other.get(User, user.id), stale)
+        self.assertEqual(other.get(User, user.id).email, "new@b.c")
+
+    def test_unsaved_changes_not_visible(self):
+        """Rows are only visible to others after save()"""
+        user = User()
+        self.db.new(user)
+        self.assertIsNone(self.reopened().get(User, user.id))
+
+    def test_all_and_count(self):
+        """all() and count() can be filtered by class"""
+        user, state = User(), State()
+        for obj in (user, state, BaseModel()):
+            self.db.new(obj)
+        self.db.save()
+        db = self.reopened()
+        self.assertEqual(len(db.all()), 3)
+        self.assertEqual(list(db.all(State)), [f"State.{state.id}"])
+        self.assertEqual(db.count(), 3)
+        self.assertEqual(db.count("User"), 1)
+        self.assertEqual(db.count("Place"), 0)
+        self.assertEqual(db.all("Place"), {})
+
+    def test_iterate_slice(self):
+        """iterate() skips offset rows and yields at most limit, across
+        tables"""
+        for obj in (User(), User(), State(), State(), State()):
+            self.db.new(obj)
+        self.db.save()
+        db = self.reopened()
+        ids = [obj.id for obj in db.iterate()]
+        self.assertEqual(len(ids), 5)
+        for offset, limit in ((0, 2), (1, 3), (2, 2), (4, None), (5, 1)):
+            self.assertEqual(
+                [obj.id for obj in db.iterate(offset=offset, limit=limit)],
+                ids[offset:None if limit is None else offset + limit])
+        self.assertEqual(
+            len(list(db.iterate(State, offset=1, limit=5))), 2)
+        self.assertEqual(list(db.iterate(User, limit=0)), [])
+
+    def test_update_rewrites_row(self):
+        """new() on a stored instance replaces its row"""
+        state = State()
+        self.db.new(state)
+        self.db.save()
+        state.name = "California"
+        self.db.new(state)
+        self.db.save()
+        self.assertEqual(self.reopened().get(State, state.id).name,
+                         "California")
+        self.assertEqual(self.db.count(State), 1)
+
+    def test_attribute_change_is_saved(self):
+        """save() writes the attributes set on a stored instance"""
+        state = State()
+        self.db.new(state)
+        self.db.save()
+        with patch("models.storage", self.db):
+            state.name = "Nevada"
+        self.assertNotEqual(self.reopened().get(State, state.id).name,
+                            "Nevada")
+        self.db.save()
+        self.assertEqual(self.reopened().get(State, state.id).name,
+                         "Nevada")
+
+    def test_query_sees_attribute_changes(self):
+        """query() finds instances by attributes set since new()"""
+        state = State()
+        self.db.new(state)
+        with patch("models.storage", self.db):
+            state.name = "Ohio"
+        self.assertEqual(self.db.query(State, name="Ohio"),
+                         {f"State.{state.id}": state})
+
+    def test_delete(self):
+        """delete() removes the row"""
+        state = State()
+        self.db.new(state)
+        self.db.save()
+        self.db.delete(state)
+        self.db.save()
+        self.assertIsNone(self.reopened().get(State, state.id))
+        self.assertEqual(self.db.count(), 0)
+
+    def test_per_class_tables(self):
+        """Each class has its own table indexed by id"""
+        self.db.new(User())
+        self.db.new(State())
+        self.db.save()
+        with sqlite3.connect(self.db_path) as con:
+            tables = {name for (name,) in con.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertEqual(tables & {"User", "State"}, {"User", "State"})
+
+    def test_query(self):
+        """query() pushes equality down to SQL and checks the rest"""
+        from models.place import Place
+        self.db.add_index(Place, "city_id")
+        places = []
+        for city_id, guests in (("a", 2), ("a", 4), ("b", 0)):
+            place = Place()
+            place.city_id = city_id
+            if guests:
+                place.max_guest = guests
+            self.db.new(place)
+            places.append(place)
+        self.db.save()
+        db = self.reopened()
+        self.assertEqual(sorted(db.query(Place, city_id="a")),
+                         sorted(f"Place.{p.id}" for p in places[:2]))
+        self.assertEqual(list(db.query(Place, city_id="a",
+                                       max_guest__gte=4)),
+                         [f"Place.{places[1].id}"])
+        self.assertEqual(list(db.query(Place, max_guest=0)),
+                         [f"Place.{places[2].id}"])
+        self.assertEqual(db.query(State, name="x"), {})
+
+    def test_clear(self):
+        """clear() empties every table"""
+        self.db.new(User())
+        self.db.save()
+        self.db.clear()
+        self.assertEqual(self.reopened().count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
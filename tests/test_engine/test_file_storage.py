@@ -3,10 +3,19 @@
 import unittest
 import os
 import json
+import subprocess
+import sys
+import threading
 from datetime import datetime
+from unittest.mock import patch
 from models import storage
 from models.base_model import BaseModel
 from models.engine.file_storage import FileStorage
+from models.engine.geo import distance
+from models.engine.text import TextIndex
+from models.review import Review
+from models.state import State
+from models.user import User
 
 
 class TestFileStorage(unittest.TestCase):
@@ -95,6 +104,19 @@ class TestFileStorage(unittest.TestCase):
         self.assertEqual(model.created_at, obj.created_at)
         self.assertEqual(model.updated_at, obj.updated_at)
 
+    def test_reloaded_timestamps_parsed_on_read(self):
+        """Reloaded timestamps stay ISO strings until they are read"""
+        model = BaseModel()
+        storage.save()
+        storage._FileStorage__objects = {}
+        storage.reload()
+        obj = storage.all()[f"BaseModel.{model.id}"]
+        self.assertIsInstance(obj.__dict__["updated_at"], str)
+        self.assertEqual(obj.to_dict(), model.to_dict())
+        self.assertEqual(obj.updated_at, model.updated_at)
+        self.assertIsInstance(obj.__dict__["updated_at"], datetime)
+        self.assertIn(repr(model.created_at), str(obj))
+
     def test_basemodel_created_from_dict(self):
         """Correct output - BaseModel created with dictionary"""
         model = BaseModel()
@@ -144,6 +166,995 @@ class TestFileStorage(unittest.TestCase):
         key = f"{model.__class__.__name__}.{model.id}"
         self.assertIn(key, storage.all())
 
+    def test_all_filtered_by_class(self):
+        """all(cls) accepts a class or a class name"""
+        from models.user import User
+        user = User()
+        model = BaseModel()
+        self.assertEqual(list(storage.all(User)), [f"User.{user.id}"])
+        self.assertEqual(list(storage.all("BaseModel")),
+                         [f"BaseModel.{model.id}"])
+        self.assertEqual(storage.all("State"), {})
+
+    def test_count(self):
+        """count() follows new() and delete()"""
+        first = BaseModel()
+        BaseModel()
+        self.assertEqual(storage.count(), 2)
+        self.assertEqual(storage.count(BaseModel), 2)
+        storage.delete(first)
+        self.assertEqual(storage.count("BaseModel"), 1)
+        self.assertNotIn(f"BaseModel.{first.id}", storage.all(BaseModel))
+
+    def test_count_after_change_through_all(self):
+        """count(cls) and all(cls) follow keys deleted from or added to
+        the dict all() returns"""
+        first, second = State(), State()
+        storage.save()
+        del storage.all()[f"State.{first.id}"]
+        self.assertEqual(storage.count(State), 1)
+        self.assertEqual(list(storage.all(State).values()), [second])
+        storage.all()[f"State.{first.id}"] = first
+        self.assertEqual(storage.count(State), 2)
+        del storage.all()[f"State.{second.id}"]
+        storage.save()
+        storage.reload()
+        self.assertEqual(list(storage.all(State)), [f"State.{first.id}"])
+
+    def test_class_index_after_reload(self):
+        """The class index is rebuilt by reload()"""
+        model = BaseModel()
+        storage.save()
+        storage._FileStorage__objects = {}
+        self.assertEqual(storage.count(BaseModel), 0)
+        storage.reload()
+        self.assertIn(f"BaseModel.{model.id}", storage.all(BaseModel))
+
+    def test_reload_stream(self):
+        """reload() in stream mode loads the same objects"""
+        model = BaseModel()
+        model.name = "stream"
+        storage.save()
+        fs = FileStorage(stream=True)
+        fs._FileStorage__objects = {}
+        fs.reload()
+        obj = fs.all()[f"BaseModel.{model.id}"]
+        self.assertEqual(obj.name, "stream")
+        self.assertEqual(obj.updated_at, model.updated_at)
+
+    def test_reload_slots(self):
+        """reload() in slots mode builds the compact classes"""
+        from models.place import Place
+        place = Place()
+        place.name = "slots"
+        storage.save()
+        fs = FileStorage(slots=True)
+        fs._FileStorage__objects = {}
+        fs.reload()
+        obj = fs.all()[f"Place.{place.id}"]
+        self.assertIs(type(obj), Place.compact())
+        self.assertIs(fs.classes()["Place"], Place.compact())
+        self.assertEqual(obj.to_dict(), place.to_dict())
+
+    def encoded_by_save(self):
+        """Returns how many objects the next storage.save() encodes"""
+        from models.engine import stats
+        was_enabled = stats.enabled
+        stats.enable()
+        stats.reset()
+        try:
+            storage.save()
+            return stats.snapshot()["counters"].get("objects_serialized", 0)
+        finally:
+            if not was_enabled:
+                stats.disable()
+
+    def cache(self):
+        """Turn cached mode on for the test"""
+        storage.cached = True
+        self.addCleanup(setattr, storage, "cached", False)
+
+    def test_save_encodes_changed_objects_only(self):
+        """save() in cached mode reuses the text of the objects left
+        unchanged"""
+        self.cache()
+        models = [BaseModel() for _ in range(5)]
+        self.assertEqual(self.encoded_by_save(), 5)
+        self.assertEqual(self.encoded_by_save(), 0)
+        models[0].name = "changed"
+        storage.new(models[1])
+        BaseModel()
+        storage.delete(models[2])
+        self.assertEqual(self.encoded_by_save(), 3)
+        with open(self.file_path) as f:
+            text = f.read()
+        expected = {key: obj.to_dict() for key, obj in storage.all().items()}
+        self.assertEqual(text, json.dumps(expected))
+
+    def test_save_after_reload_encodes_again(self):
+        """reload() and a replaced __objects drop the cached text"""
+        self.cache()
+        model = BaseModel()
+        storage.save()
+        storage.reload()
+        self.assertEqual(self.encoded_by_save(), 1)
+        storage._FileStorage__objects = {f"BaseModel.{model.id}": model}
+        self.assertEqual(self.encoded_by_save(), 1)
+        with open(self.file_path) as f:
+            self.assertEqual(json.load(f)[f"BaseModel.{model.id}"]["id"],
+                             model.id)
+
+    def test_save_writes_in_place_changes(self):
+        """save() writes a list changed in place, unless in cached mode"""
+        from models.place import Place
+        place = Place()
+        place.amenity_ids = ["a"]
+        storage.save()
+        place.amenity_ids.append("b")
+        self.assertEqual(self.encoded_by_save(), 1)
+        with open(self.file_path) as f:
+            self.assertEqual(
+                json.load(f)[f"Place.{place.id}"]["amenity_ids"], ["a", "b"])
+
+
+class TestFileStorageQuery(unittest.TestCase):
+    """Test cases for query() and add_index()."""
+
+    def setUp(self):
+        """Create a few places in two cities."""
+        from models.place import Place
+        storage._FileStorage__objects = {}
+        self.Place = Place
+        self.places = []
+        for city_id, guests in (("a", 2), ("a", 4), ("b", 6)):
+            place = Place()
+            place.city_id = city_id
+            place.max_guest = guests
+            self.places.append(place)
+
+    def tearDown(self):
+        """Tear down test environment."""
+        storage._FileStorage__objects = {}
+        try:
+            os.remove("file.json")
+        except FileNotFoundError:
+            pass
+
+    def keys(self, *places):
+        return sorted(f"Place.{place.id}" for place in places)
+
+    def test_query_without_index(self):
+        """query() filters the instances of a class"""
+        first, second, third = self.places
+        self.assertEqual(sorted(storage.query(self.Place, city_id="a")),
+                         self.keys(first, second))
+        self.assertEqual(
+            sorted(storage.query("Place", city_id="a", max_guest__gte=4)),
+            self.keys(second))
+        self.assertEqual(storage.query("User", city_id="a"), {})
+
+    def test_query_with_index(self):
+        """An index answers equality and follows updates and deletes"""
+        first, second, third = self.places
+        storage.add_index(self.Place, "max_guest")
+        self.assertEqual(list(storage.query(self.Place, max_guest=6)),
+                         self.keys(third))
+        index = storage._FileStorage__attr_indexes["Place"]["city_id"]
+        self.assertEqual(sorted(index.lookup("a")), self.keys(first, second))
+        third.city_id = "a"
+        third.save()
+        storage.delete(first)
+        self.assertEqual(sorted(storage.query(self.Place, city_id="a")),
+                         self.keys(second, third))
+        self.assertEqual(storage.query(self.Place, city_id="b"), {})
+
+    def test_index_rebuilt_on_reload(self):
+        """reload() indexes the loaded records, also in lazy mode"""
+        storage.save()
+        for lazy in (False, True):
+            fs = FileStorage(lazy=lazy)
+            fs._FileStorage__objects = {}
+            fs.add_index(self.Place, "city_id")
+            fs.reload()
+            found = fs.query(self.Place, city_id="b", max_guest=6)
+            self.assertEqual(list(found), self.keys(self.places[2]))
+            self.assertEqual(found[self.keys(self.places[2])[0]].max_guest,
+                             6)
+
+    def test_query_in_string(self):
+        """An indexed attribute in a string is a substring, as in a scan"""
+        first, second, third = self.places
+        third.city_id = "ab"
+        self.assertEqual(sorted(storage.query(self.Place, city_id__in="ab")),
+                         self.keys(first, second, third))
+        self.assertEqual(sorted(storage.query(self.Place, city_id__in="a")),
+                         self.keys(first, second))
+
+    def test_reload_fills_indexes_at_once(self):
+        """reload() fills the indexes after loading, not record by record"""
+        storage.save()
+        for lazy in (False, True):
+            fs = FileStorage(lazy=lazy)
+            fs._FileStorage__objects = {}
+            fs.classes()
+            with patch("models.engine.query.HashIndex.add") as add:
+                fs.reload()
+            add.assert_not_called()
+            self.assertEqual(sorted(fs.query(self.Place, city_id="a")),
+                             self.keys(*self.places[:2]))
+
+    def test_columns(self):
+        """A column store answers query() and aggregate() and follows
+        updates and deletes"""
+        first, second, third = self.places
+        first.price_by_night, second.price_by_night = 100, 60
+        third.price_by_night = 80
+        fs = FileStorage(columnar=True)
+        fs._FileStorage__objects = {}
+        for place in self.places:
+            fs.new(place)
+        store = fs._FileStorage__columns["Place"]
+        self.assertEqual(len(store), 3)
+        self.assertEqual(sorted(fs.query(self.Place, max_guest__gte=4)),
+                         self.keys(second, third))
+        self.assertEqual(fs.aggregate(self.Place, "price_by_night",
+                                      by="city_id"),
+                         storage.aggregate(self.Place, "price_by_night",
+                                           by="city_id"))
+        self.assertEqual(
+            fs.aggregate(self.Place, "price_by_night", city_id="a"),
+            {"count": 2, "sum": 160, "min": 60, "max": 100, "mean": 80.0})
+        first.max_guest = 8
+        fs.touch(first, "max_guest")
+        fs.delete(third)
+        self.assertEqual(sorted(fs.query(self.Place, max_guest__gte=4)),
+                         self.keys(first, second))
+        self.assertEqual(fs.aggregate(self.Place, "price_by_night",
+                                      by="city_id", max_guest__gt=5),
+                         {"a": {"count": 1, "sum": 100, "min": 100,
+                                "max": 100, "mean": 100.0}})
+        self.assertIsNone(fs.aggregate(self.Place, "price_by_night",
+                                       city_id="b"))
+
+    def test_columns_aggregate_non_finite(self):
+        """Columnar aggregates equal the others with NaN and infinities"""
+        first, second, third = self.places
+        first.price_by_night, second.price_by_night = float("nan"), 60
+        third.price_by_night = 80
+        first.latitude, second.latitude = float("inf"), 1.5
+        fs = FileStorage(columnar=True)
+        fs._FileStorage__objects = {}
+        for place in self.places:
+            fs.new(place)
+        for attr in ("price_by_night", "latitude"):
+            for by in (None, "city_id"):
+                self.assertEqual(fs.aggregate(self.Place, attr, by=by),
+                                 storage.aggregate(self.Place, attr, by=by))
+        self.assertEqual(storage.aggregate(self.Place, "price_by_night"),
+                         {"count": 2, "sum": 140, "min": 60, "max": 80,
+                          "mean": 70.0})
+
+    def test_columns_rebuilt_on_reload(self):
+        """reload() stores the loaded records, also in lazy mode"""
+        self.places[2].price_by_night = 80
+        storage.save()
+        for lazy in (False, True):
+            fs = FileStorage(lazy=lazy, columnar=True)
+            fs._FileStorage__objects = {}
+            fs.reload()
+            self.assertEqual(
+                list(fs.query(self.Place, price_by_night__gt=50)),
+                self.keys(self.places[2]))
+            self.assertEqual(fs.aggregate(self.Place, "max_guest")["sum"],
+                             12)
+
+    def test_locations(self):
+        """The grid index follows the coordinates of the places"""
+        first, second, third = self.places
+        for place, point in zip(self.places, ((48.86, 2.35), (48.85, 2.29),
+                                              (51.51, -0.13))):
+            place.latitude, place.longitude = point
+        found = storage.nearby(self.Place, 48.8584, 2.2945, 10)
+        self.assertEqual([obj for _, obj in found], [second, first])
+        self.assertLess(found[0][0], 1)
+        self.assertEqual(storage.nearest("Place", 51.5, 0, k=1)[0][1], third)
+        self.assertEqual(sorted(storage.within(self.Place, 48, 2, 49, 3)),
+                         self.keys(first, second))
+        second.latitude = 40.0
+        storage.delete(first)
+        self.assertEqual(storage.nearby(self.Place, 48.8584, 2.2945, 10), [])
+        self.assertEqual(storage.nearby("User", 0, 0, 100), [])
+
+    def test_locations_rebuilt_on_reload(self):
+        """reload() indexes the loaded coordinates, also in lazy mode"""
+        self.places[0].latitude = 10.0
+        storage.save()
+        for lazy in (False, True):
+            fs = FileStorage(lazy=lazy)
+            fs._FileStorage__objects = {}
+            fs.reload()
+            found = fs.nearest(self.Place, 10, 0, k=2)
+            self.assertEqual([obj.id for _, obj in found],
+                             [self.places[0].id, found[1][1].id])
+            self.assertEqual(found[1][0], distance(10, 0, 0, 0))
+
+    def test_ranges_and_amenities(self):
+        """Range and amenity predicates follow updates, and ordered()
+        pages through the matches by price"""
+        first, second, third = self.places
+        for place, price, amenities in zip(
+                self.places, (120, 80, 80), (["wifi"], ["wifi", "pool"],
+                                             ["pool"])):
+            place.price_by_night = price
+            place.amenity_ids = amenities
+        self.assertEqual(
+            sorted(storage.query(self.Place, price_by_night__lt=100,
+                                 amenity_ids__all=["pool", "wifi"])),
+            self.keys(second))
+        by_price = sorted([second, third], key=lambda place: place.id)
+        self.assertEqual(
+            storage.ordered(self.Place, "price_by_night", limit=2),
+            by_price)
+        self.assertEqual(
+            storage.ordered(self.Place, "price_by_night", offset=1,
+                            reverse=True, amenity_ids__contains="pool"),
+            by_price[::-1][1:])
+        self.assertEqual(storage.ordered(
+            self.Place, "price_by_night", max_guest__gte=4, limit=1),
+            [by_price[0]])
+        first.price_by_night = 60
+        first.amenity_ids = ["pool", "wifi"]
+        storage.delete(second)
+        self.assertEqual(storage.ordered(
+            self.Place, "price_by_night", amenity_ids__all=["pool"]),
+            [first, third])
+        third.price_by_night = "on request"
+        self.assertEqual(storage.ordered(self.Place, "price_by_night"),
+                         [first])
+        self.assertEqual(list(storage.query(
+            self.Place, price_by_night__in=[60, 80])), self.keys(first))
+        self.assertEqual(storage.ordered(self.Place, "name"), [])
+
+    def test_ranges_rebuilt_on_reload(self):
+        """reload() indexes the loaded prices and amenities"""
+        for price, place in enumerate(self.places):
+            place.price_by_night = 3 - price
+            place.amenity_ids = ["wifi"]
+        storage.save()
+        fs = FileStorage(lazy=True)
+        fs._FileStorage__objects = {}
+        fs.reload()
+        self.assertEqual(
+            [place.id for place in fs.ordered(
+                self.Place, "price_by_night", amenity_ids__all=["wifi"])],
+            [place.id for place in self.places[::-1]])
+
+    def test_ranges_built_after_change_through_all(self):
+        """Building the range index skips the keys no longer stored"""
+        now = datetime.now().isoformat()
+        objects = storage.all()
+        del objects[f"Place.{self.places[0].id}"]
+        # the same number of objects, so the class index is not updated
+        objects["BaseModel.x"] = BaseModel(id="x", created_at=now,
+                                           updated_at=now)
+        self.assertEqual(
+            list(storage.query(self.Place, max_guest__gte=0).values()),
+            self.places[1:])
+
+
+class TestFileStorageSearch(unittest.TestCase):
+    """Test cases for search() and the text indexes."""
+
+    def setUp(self):
+        """Store a few reviews."""
+        self.tearDown()
+        self.reviews = []
+        for text in ("Lovely quiet flat", "Noisy street, lovely host",
+                     "Quiet, quiet, quiet"):
+            review = Review()
+            review.text = text
+            self.reviews.append(review)
+
+    def tearDown(self):
+        storage._FileStorage__objects = {}
+        for path in ("file.json", storage.search_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def found(self, fs, text):
+        return [obj for _, obj in fs.search(Review, text)]
+
+    def test_search(self):
+        """search() ranks matches and follows updates and deletes"""
+        first, second, third = self.reviews
+        self.assertEqual(self.found(storage, "quiet"), [third, first])
+        self.assertEqual(self.found(storage, "LOVELY host"), [second, first])
+        first.text = "Dirty flat"
+        storage.delete(third)
+        self.assertEqual(self.found(storage, "quiet"), [])
+        self.assertEqual(self.found(storage, "dirty"), [first])
+        self.assertEqual(storage.search("User", "quiet"), [])
+
+    def test_index_written_next_to_snapshot(self):
+        """The first search() of a new process loads the index instead of
+        tokenizing again, and forgets what is no longer stored"""
+        self.found(storage, "quiet")
+        storage.save()
+        self.assertTrue(os.path.exists(storage.search_path))
+        with open("file.json") as f:
+            records = json.load(f)
+        del records[f"Review.{self.reviews[0].id}"]
+        with open("file.json", "w") as f:
+            json.dump(records, f)
+        fs = FileStorage()
+        fs._FileStorage__objects = {}
+        tokenized = []
+        terms = TextIndex.terms
+        with patch.object(TextIndex, "terms", lambda index, text: (
+                tokenized.append(text), terms(index, text))[1]):
+            fs.reload()
+            self.assertEqual(fs._FileStorage__texts, {})
+            found = fs.search(Review, "quiet")
+        self.assertEqual(tokenized, ["quiet"])
+        self.assertEqual([obj.id for _, obj in found], [self.reviews[2].id])
+
+
+class TestFileStorageLazy(unittest.TestCase):
+    """Test cases for lazy hydration on reload()."""
+
+    def setUp(self):
+        """Save two models and reload them into a lazy storage."""
+        storage._FileStorage__objects = {}
+        self.first = BaseModel()
+        self.second = BaseModel()
+        storage.save()
+        self.fs = FileStorage(lazy=True)
+        self.fs._FileStorage__objects = {}
+        self.fs.reload()
+
+    def tearDown(self):
+        """Tear down test environment."""
+        try:
+            os.remove("file.json")
+        except FileNotFoundError:
+            pass
+        storage._FileStorage__objects = {}
+
+    def test_reload_builds_nothing(self):
+        """reload() keeps records and builds no instance"""
+        self.assertEqual(self.fs._FileStorage__objects, {})
+        self.assertEqual(self.fs.count(), 2)
+        self.assertEqual(self.fs.count(BaseModel), 2)
+
+    def test_get_builds_one_instance(self):
+        """get() hydrates only the requested object"""
+        obj = self.fs.get(BaseModel, self.first.id)
+        self.assertIsInstance(obj, BaseModel)
+        self.assertEqual(obj.created_at, self.first.created_at)
+        self.assertEqual(len(self.fs._FileStorage__objects), 1)
+        self.assertIs(self.fs.get("BaseModel", self.first.id), obj)
+        self.assertIsNone(self.fs.get(BaseModel, "missing"))
+
+    def test_all_builds_everything(self):
+        """all() hydrates every pending record"""
+        objects = self.fs.all()
+        self.assertEqual(len(objects), 2)
+        self.assertIsInstance(
+            objects[f"BaseModel.{self.second.id}"], BaseModel)
+
+    def test_iterate_builds_as_it_goes(self):
+        """iterate() hydrates one record per instance yielded"""
+        objects = self.fs.iterate(BaseModel)
+        first = next(objects)
+        self.assertEqual(len(self.fs._FileStorage__objects), 1)
+        self.assertEqual({first.id, next(objects).id},
+                         {self.first.id, self.second.id})
+        self.assertEqual(len(list(self.fs.iterate())), 2)
+
+    def test_iterate_slice_builds_only_the_slice(self):
+        """iterate() with offset and limit hydrates only what it yields"""
+        objects = list(self.fs.iterate(BaseModel, offset=1))
+        self.assertEqual(len(objects), 1)
+        self.assertEqual(list(self.fs._FileStorage__objects.values()),
+                         objects)
+        self.assertEqual(list(self.fs.iterate(offset=0, limit=0)), [])
+        self.assertEqual(list(self.fs.iterate(BaseModel, offset=2)), [])
+        self.assertEqual(len(self.fs._FileStorage__objects), 1)
+        self.assertEqual(len(list(self.fs.iterate(limit=5))), 2)
+
+    def test_save_keeps_unbuilt_records(self):
+        """save() writes records that were never hydrated"""
+        self.fs.get(BaseModel, self.first.id)
+        self.fs.save()
+        with open("file.json") as f:
+            self.assertEqual(len(json.load(f)), 2)
+
+    def test_delete_hydrated(self):
+        """delete() removes the object from storage"""
+        self.fs.delete(self.fs.get(BaseModel, self.first.id))
+        self.assertEqual(self.fs.count(BaseModel), 1)
+        self.assertIsNone(self.fs.get(BaseModel, self.first.id))
+
+    def test_codecs(self):
+        """Snapshots written with any codec are detected on reload()"""
+        model = BaseModel()
+        model.name = "codec"
+        for codec in ("marshal", "pickle", "json"):
+            fs = FileStorage(codec=codec)
+            fs._FileStorage__objects = {f"BaseModel.{model.id}": model}
+            fs.save()
+            fs = FileStorage()
+            fs._FileStorage__objects = {}
+            fs.reload()
+            obj = fs.all()[f"BaseModel.{model.id}"]
+            self.assertEqual(obj.to_dict(), model.to_dict())
+        with open("file.json") as f:
+            self.assertIn(f"BaseModel.{model.id}", json.load(f))
+
+    def test_export(self):
+        """export() writes a JSON copy whatever the codec"""
+        model = BaseModel()
+        fs = FileStorage(codec="pickle")
+        fs._FileStorage__objects = {f"BaseModel.{model.id}": model}
+        fs.export("export.json")
+        self.addCleanup(os.remove, "export.json")
+        with open("export.json") as f:
+            self.assertEqual(json.load(f)[f"BaseModel.{model.id}"],
+                             model.to_dict())
+
+
+class TestFileStorageJournal(unittest.TestCase):
+    """Test cases for the journal (append-only log) mode."""
+
+    def setUp(self):
+        """Set up a journaling storage on an empty file."""
+        self.fs = FileStorage(journal=True, compact_after=5)
+        self.fs._FileStorage__objects = {}
+        self.tearDown()
+
+    def tearDown(self):
+        """Remove the snapshot, its log and its lock."""
+        for path in ("file.json", "file.json.log", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def reloaded(self):
+        """Return the objects seen by a fresh storage after reload()"""
+        fs = FileStorage(journal=True)
+        fs._FileStorage__objects = {}
+        fs.reload()
+        return fs.all()
+
+    def test_save_appends_to_log(self):
+        """save() appends one line per change and leaves the snapshot"""
+        model = BaseModel()
+        self.fs.new(model)
+        self.fs.save()
+        self.assertFalse(os.path.exists("file.json"))
+        with open("file.json.log") as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])[0], f"BaseModel.{model.id}")
+
+    def test_save_without_changes_writes_nothing(self):
+        """save() with nothing pending does not touch the log"""
+        self.fs.save()
+        self.assertFalse(os.path.exists("file.json.log"))
+
+    def test_reload_replays_updates_and_deletes(self):
+        """reload() applies the log on top of the snapshot"""
+        kept = BaseModel()
+        gone = BaseModel()
+        self.fs.new(kept)
+        self.fs.new(gone)
+        self.fs.save()
+        kept.name = "updated"
+        self.fs.new(kept)
+        self.fs.delete(gone)
+        self.fs.save()
+        objects = self.reloaded()
+        self.assertEqual(objects[f"BaseModel.{kept.id}"].name, "updated")
+        self.assertNotIn(f"BaseModel.{gone.id}", objects)
+
+    def test_compaction(self):
+        """The log is folded into the snapshot past the threshold"""
+        models = [BaseModel() for _ in range(5)]
+        for model in models:
+            self.fs.new(model)
+        self.fs.save()
+        self.assertFalse(os.path.exists("file.json.log"))
+        with open("file.json") as f:
+            self.assertEqual(len(json.load(f)), 5)
+        self.assertEqual(len(self.reloaded()), 5)
+
+    def test_torn_tail_is_ignored(self):
+        """A partially written last line does not break reload()"""
+        model = BaseModel()
+        self.fs.new(model)
+        self.fs.save()
+        with open("file.json.log", "a") as f:
+            f.write('["BaseModel.x", {"id"')
+        self.assertIn(f"BaseModel.{model.id}", self.reloaded())
+
+    def test_torn_tail_is_truncated_before_appending(self):
+        """Records saved after a torn write are not lost with it"""
+        first = BaseModel()
+        self.fs.new(first)
+        self.fs.save()
+        with open("file.json.log", "a") as f:
+            f.write('["BaseModel.torn", {"id": "to')
+        fs = FileStorage(journal=True)
+        fs._FileStorage__objects = {}
+        fs.reload()
+        second = BaseModel()
+        fs.new(second)
+        fs.save()
+        self.assertEqual(set(self.reloaded()), {f"BaseModel.{first.id}",
+                                                f"BaseModel.{second.id}"})
+
+    def test_attribute_change_is_saved(self):
+        """Setting an attribute of a stored object is enough for save()"""
+        env = dict(os.environ, HBNB_STORAGE_JOURNAL="1")
+        script = (
+            "import sys\n"
+            "from models import storage\n"
+            "from models.state import State\n"
+            "if len(sys.argv) == 1:\n"
+            "    state = State(); state.name = 'A'; storage.save()\n"
+            "    print(state.id)\n"
+            "else:\n"
+            "    storage.get(State, sys.argv[1]).name = 'B'\n"
+            "    storage.save()\n")
+        id = subprocess.run([sys.executable, "-c", script], env=env,
+                            check=True, capture_output=True,
+                            text=True).stdout.strip()
+        subprocess.run([sys.executable, "-c", script, id], env=env,
+                       check=True)
+        self.assertEqual(self.reloaded()[f"State.{id}"].name, "B")
+
+    def test_full_save_drops_log(self):
+        """A regular save() writes the snapshot and removes the log"""
+        model = BaseModel()
+        self.fs.new(model)
+        self.fs.save()
+        self.fs.journal = False
+        self.fs.save()
+        self.assertFalse(os.path.exists("file.json.log"))
+        self.assertIn(f"BaseModel.{model.id}", self.reloaded())
+
+
+class TestFileStorageSharded(unittest.TestCase):
+    """Test cases for the per-class files of sharded mode."""
+
+    def setUp(self):
+        """Set up a sharded storage on empty files."""
+        self.fs = FileStorage(sharded=True)
+        self.fs._FileStorage__objects = {}
+        self.fs.clear()
+
+    def tearDown(self):
+        """Remove the per-class files, the log and the lock."""
+        self.fs.clear()
+        for path in ("file.json", "file.json.log", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def reloaded(self, classes=None, journal=False):
+        """Return a fresh sharded storage after reload(classes)"""
+        fs = FileStorage(sharded=True, journal=journal)
+        fs._FileStorage__objects = {}
+        fs.reload(classes)
+        return fs
+
+    def test_one_file_per_class(self):
+        """Each class is written to its own file"""
+        state = State()
+        user = User()
+        self.fs.new(state)
+        self.fs.new(user)
+        self.fs.save()
+        self.assertFalse(os.path.exists("file.json"))
+        with open(self.fs.shard_path(State)) as f:
+            self.assertEqual(list(json.load(f)), [f"State.{state.id}"])
+        with open(self.fs.shard_path("User")) as f:
+            self.assertEqual(list(json.load(f)), [f"User.{user.id}"])
+
+    def test_save_writes_changed_classes_only(self):
+        """save() leaves the files of unchanged classes alone"""
+        self.fs.new(State())
+        self.fs.new(User())
+        self.fs.save()
+        os.remove(self.fs.shard_path(User))
+        self.fs.new(State())
+        self.fs.save()
+        self.assertFalse(os.path.exists(self.fs.shard_path(User)))
+        self.assertEqual(self.reloaded().count(State), 2)
+
+    def test_reload_subset(self):
+        """Only the requested classes are read by reload()"""
+        state = State()
+        review = Review()
+        self.fs.new(state)
+        self.fs.new(review)
+        self.fs.save()
+        fs = self.reloaded([State, "City"])
+        self.assertEqual(list(fs._FileStorage__objects),
+                         [f"State.{state.id}"])
+        self.assertEqual(list(fs.all(Review)), [f"Review.{review.id}"])
+
+    def test_unloaded_class_is_read_before_changes(self):
+        """Saving a class that was not loaded keeps its stored objects"""
+        old = Review()
+        self.fs.new(old)
+        self.fs.save()
+        fs = self.reloaded([State])
+        fs.new(Review())
+        fs.save()
+        self.assertIn(f"Review.{old.id}", self.reloaded().all(Review))
+
+    def test_attribute_change_is_saved(self):
+        """Setting an attribute marks the class file to be rewritten"""
+        state = State()
+        state.name = "A"
+        self.fs.new(state)
+        self.fs.save()
+        with patch("models.storage", self.fs):
+            state.name = "B"
+        self.fs.save()
+        self.assertEqual(self.reloaded().get(State, state.id).name, "B")
+
+    def test_journal_of_unloaded_class_is_kept(self):
+        """Compacting keeps the log records of classes not loaded"""
+        fs = self.reloaded(journal=True)
+        review = Review()
+        fs.new(review)
+        fs.save()
+        fs = self.reloaded([State], journal=True)
+        fs.new(State())
+        fs.compact()
+        self.assertTrue(os.path.exists(fs.log_path))
+        self.assertIn(f"Review.{review.id}", self.reloaded().all(Review))
+
+
+class TestFileStorageMapped(unittest.TestCase):
+    """Test cases for snapshots written with the mmap codec."""
+
+    def setUp(self):
+        """Write a mapped snapshot of a few objects."""
+        self.tearDown()
+        fs = FileStorage(codec="mmap")
+        fs._FileStorage__objects = {}
+        now = datetime.now().isoformat()
+        self.states = [State(id=str(i), name=f"s{i}", created_at=now,
+                             updated_at=now) for i in range(50)]
+        for state in self.states:
+            fs.new(state)
+        fs.save()
+
+    def tearDown(self):
+        """Remove the snapshot, its log and its lock."""
+        for path in ("file.json", "file.json.log", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def reloaded(self, journal=False):
+        """Return a fresh storage after reload()"""
+        fs = FileStorage(codec="mmap", journal=journal)
+        fs._FileStorage__objects = {}
+        fs.reload()
+        return fs
+
+    def test_reload_maps_the_snapshot(self):
+        """reload() decodes nothing until an object is asked for"""
+        fs = self.reloaded()
+        self.assertEqual(fs._FileStorage__objects, {})
+        self.assertEqual(fs.get(State, "7").name, "s7")
+        self.assertEqual(list(fs._FileStorage__objects), ["State.7"])
+        self.assertIsNone(fs.get(State, "missing"))
+        self.assertIsNone(fs.get("City", "7"))
+
+    def test_all_loads_the_rest(self):
+        """all() and count() see every object of the snapshot"""
+        fs = self.reloaded()
+        fs.get(State, "3").name = "changed"
+        self.assertEqual(fs.count(State), 50)
+        self.assertEqual(len(fs.all()), 50)
+        self.assertEqual(fs.get(State, "3").name, "changed")
+
+    def test_journal_over_mapped_snapshot(self):
+        """Logged updates and deletes take precedence over the snapshot"""
+        fs = self.reloaded(journal=True)
+        state = fs.get(State, "1")
+        state.name = "updated"
+        fs.new(state)
+        fs.delete(State(**self.states[2].to_dict()))
+        fs.save()
+        fs = self.reloaded(journal=True)
+        self.assertEqual(fs.get(State, "1").name, "updated")
+        self.assertIsNone(fs.get(State, "2"))
+        self.assertEqual(fs.count(State), 49)
+
+
+class TestFileStorageThreads(unittest.TestCase):
+    """Stress test of thread-safe mode with mixed readers and writers."""
+
+    def setUp(self):
+        """Set up a thread-safe storage on an empty file."""
+        self.fs = FileStorage(threadsafe=True, lazy=True)
+        self.fs._FileStorage__objects = {}
+        self.fs.clear()
+
+    def tearDown(self):
+        """Remove the snapshot."""
+        try:
+            os.remove("file.json")
+        except FileNotFoundError:
+            pass
+
+    def test_mixed_threads(self):
+        """Readers never see a torn state while writers change storage"""
+        now = datetime.now().isoformat()
+        errors = []
+        done = threading.Event()
+
+        def write(n):
+            try:
+                for i in range(100):
+                    model = BaseModel(id=f"{n}-{i}", created_at=now,
+                                      updated_at=now)
+                    self.fs.new(model)
+                    if i % 3 == 0:
+                        self.fs.delete(model)
+                    if i % 25 == 0:
+                        self.fs.save()
+                        self.fs.reload()
+            except Exception as e:
+                errors.append(e)
+
+        def read():
+            try:
+                while not done.is_set():
+                    for key, obj in self.fs.all().items():
+                        self.assertEqual(key, f"BaseModel.{obj.id}")
+                    for key, obj in self.fs.all(BaseModel).items():
+                        found = self.fs.get(BaseModel, obj.id)
+                        self.assertEqual((found or obj).id, obj.id)
+                    self.fs.count(BaseModel)
+                    for obj in self.fs.iterate(BaseModel):
+                        self.fs.get(BaseModel, obj.id)
+                    self.fs.query(BaseModel, id="0-1")
+            except Exception as e:
+                errors.append(e)
+
+        writers = [threading.Thread(target=write, args=(n,))
+                   for n in range(4)]
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        done.set()
+        for thread in readers:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.fs.count(), 4 * 66)
+        self.fs.save()
+        with open("file.json") as f:
+            self.assertEqual(len(json.load(f)), 4 * 66)
+
+
+class TestFileStorageShared(unittest.TestCase):
+    """Test cases for several processes sharing the files."""
+
+    def setUp(self):
+        """Start from no files."""
+        self.tearDown()
+        self.now = datetime.now().isoformat()
+
+    def tearDown(self):
+        """Remove the snapshot, its log and its lock."""
+        for path in ("file.json", "file.json.log", "file.json.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def opened(self, journal=False):
+        """Return a storage reloaded from the files"""
+        fs = FileStorage(journal=journal)
+        fs._FileStorage__objects = {}
+        fs.reload()
+        return fs
+
+    def model(self, id):
+        """Return a BaseModel that no storage knows about"""
+        return BaseModel(id=id, created_at=self.now, updated_at=self.now)
+
+    def test_save_keeps_other_writes(self):
+        """save() merges what another process saved in the meantime"""
+        first, second = self.opened(), self.opened()
+        first.new(self.model("a"))
+        first.save()
+        second.new(self.model("b"))
+        second.save()
+        self.assertEqual(set(self.opened().all()),
+                         {"BaseModel.a", "BaseModel.b"})
+
+    def test_refresh_snapshot(self):
+        """refresh() reloads a replaced snapshot, keeping pending changes"""
+        first, second = self.opened(), self.opened()
+        self.assertFalse(second.refresh())
+        second.new(self.model("mine"))
+        first.new(self.model("theirs"))
+        first.save()
+        self.assertTrue(second.refresh())
+        self.assertFalse(second.refresh())
+        self.assertIsNotNone(second.get(BaseModel, "theirs"))
+        self.assertIsNotNone(second.get(BaseModel, "mine"))
+
+    def test_reload_keeps_instances(self):
+        """Instances held before another process replaced the snapshot
+        stay the stored ones, with their changes or the reloaded ones"""
+        first, second = self.opened(), self.opened()
+        mine, other = self.model("mine"), self.model("other")
+        first.new(mine)
+        first.new(other)
+        first.save()
+        with patch("models.storage", first):
+            mine.name = "local"
+        second.reload()
+        with patch("models.storage", second):
+            second.get(BaseModel, "other").name = "remote"
+        second.save()
+        first.save()
+        self.assertIs(first.get(BaseModel, "mine"), mine)
+        self.assertIs(first.get(BaseModel, "other"), other)
+        self.assertEqual(other.name, "remote")
+        self.assertEqual(self.opened().get(BaseModel, "mine").name, "local")
+
+    def test_refresh_journal(self):
+        """refresh() applies only the journal records added since"""
+        first, second = self.opened(True), self.opened(True)
+        model = self.model("a")
+        first.new(model)
+        first.save()
+        self.assertTrue(second.refresh())
+        self.assertIsNotNone(second.get(BaseModel, "a"))
+        first.delete(model)
+        first.save()
+        self.assertTrue(second.refresh())
+        self.assertIsNone(second.get(BaseModel, "a"))
+        self.assertFalse(second.refresh())
+
+    def test_processes(self):
+        """Processes saving at the same time lose none of their objects"""
+        script = (
+            "import sys\n"
+            "from models.base_model import BaseModel\n"
+            "from models.engine.file_storage import FileStorage\n"
+            "fs = FileStorage()\n"
+            "fs._FileStorage__objects = {}\n"
+            "fs.reload()\n"
+            "for i in range(20):\n"
+            "    fs.new(BaseModel(id=f'{sys.argv[1]}-{i}',\n"
+            "                     created_at=sys.argv[2],\n"
+            "                     updated_at=sys.argv[2]))\n"
+            "    fs.save()\n")
+        processes = [subprocess.Popen(
+            [sys.executable, "-c", script, str(n), self.now])
+            for n in range(4)]
+        for process in processes:
+            self.assertEqual(process.wait(), 0)
+        self.assertEqual(self.opened().count(), 80)
+
 
 if __name__ == "__main__":
     unittest.main()
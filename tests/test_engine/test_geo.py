@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+"""Unit tests for the GridIndex."""
+import random
+import unittest
+from models.engine.geo import GridIndex, bounds, distance
+from models.place import Place
+
+
+class TestGeo(unittest.TestCase):
+    """Test cases for GridIndex, checked against a full scan."""
+
+    def setUp(self):
+        rand = random.Random(0)
+        self.points = {}
+        self.grid = GridIndex(size=5.0, model=Place)
+        for i in range(2000):
+            point = {"latitude": rand.uniform(-90, 90),
+                     "longitude": rand.uniform(-180, 180)}
+            self.points[f"Place.{i}"] = point
+            self.grid.add(f"Place.{i}", point)
+
+    def scan(self, latitude, longitude):
+        return sorted((distance(latitude, longitude, point["latitude"],
+                                point["longitude"]), key)
+                      for key, point in self.points.items())
+
+    def test_distance(self):
+        """Great circle distances in kilometres"""
+        self.assertAlmostEqual(distance(48.8566, 2.3522, 51.5074, -0.1278),
+                               343.6, delta=0.5)
+        self.assertAlmostEqual(distance(0, 179.5, 0, -179.5), 111.2,
+                               delta=0.1)
+
+    def test_bounds(self):
+        """Boxes cross the antimeridian or span every meridian"""
+        south, west, north, east = bounds(0, 179.9, 50)
+        self.assertGreater(west, east)
+        self.assertEqual(bounds(89.9, 0, 50)[1:4:2], (-180.0, 180.0))
+
+    def test_nearby(self):
+        """Radius queries find what a full scan does"""
+        for latitude, longitude, radius in ((0, 0, 1500), (10, 179, 2000),
+                                            (-88, 40, 900), (45, -90, 0)):
+            self.assertEqual(
+                self.grid.nearby(latitude, longitude, radius),
+                [(km, key) for km, key in self.scan(latitude, longitude)
+                 if km <= radius])
+
+    def test_nearest(self):
+        """The k nearest are those of a full scan"""
+        for latitude, longitude, k in ((0, 0, 5), (89, -170, 3),
+                                       (-30, 180, 1), (0, 0, 5000)):
+            self.assertEqual(self.grid.nearest(latitude, longitude, k),
+                             self.scan(latitude, longitude)[:k])
+        self.assertEqual(self.grid.nearest(0, 0, 0), [])
+
+    def test_within(self):
+        """Boxes, also across the antimeridian"""
+        for south, west, north, east in ((-10, -10, 10, 10),
+                                         (20, 170, 40, -170)):
+            found = sorted(key for key, _ in self.grid.within(
+                south, west, north, east))
+            self.assertEqual(found, sorted(
+                key for key, point in self.points.items()
+                if south <= point["latitude"] <= north and (
+                    west <= point["longitude"] <= east if west <= east else
+                    not east < point["longitude"] < west)))
+
+    def test_add_moves_and_discard(self):
+        """Keys follow their point and invalid points are left out"""
+        self.grid.add("Place.0", {"latitude": 1.0, "longitude": 1.0})
+        self.assertEqual(self.grid.nearest(1, 1), [(0.0, "Place.0")])
+        self.grid.add("Place.0", {"latitude": "north"})
+        self.grid.add("Place.1", {"latitude": 91, "longitude": 0})
+        self.grid.discard("Place.2")
+        self.assertEqual(len(self.grid), 1997)
+        self.assertNotIn("Place.0", dict(
+            (key, km) for km, key in self.grid.nearby(1, 1, 100)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+"""Unit tests for the incremental JSON reader."""
+import io
+import json
+import unittest
+from models.engine.json_stream import iter_items
+
+
+class TestIterItems(unittest.TestCase):
+    """Test cases for iter_items()."""
+
+    def items(self, text, chunk_size=1 << 16):
+        return list(iter_items(io.StringIO(text), chunk_size))
+
+    def test_empty_object(self):
+        """An empty object yields nothing"""
+        self.assertEqual(self.items("{}"), [])
+        self.assertEqual(self.items("  { \n } "), [])
+
+    def test_matches_json_load(self):
+        """Every chunk size gives the same pairs as json.load"""
+        data = {
+            "BaseModel.1": {"id": "1", "n": 12345, "f": -1.5e3},
+            "Place.2": {"amenity_ids": ["a", "b"], "name": "x \" y}"},
+            "User.3": {"ok": True, "none": None, "nested": {"k": []}},
+            "Amenity.4": 98765,
+        }
+        text = json.dumps(data, indent=1)
+        for chunk_size in (1, 2, 3, 7, 64, 1 << 16):
+            self.assertEqual(dict(self.items(text, chunk_size)), data)
+
+    def test_number_split_across_chunks(self):
+        """A number cut by a chunk boundary is read whole"""
+        self.assertEqual(self.items('{"a": 123456}', 9), [("a", 123456)])
+
+    def test_yields_incrementally(self):
+        """Pairs are produced before the whole file is read"""
+        f = io.StringIO('{"a": 1, "b": 2, "c": 3}' + " " * 1000)
+        pairs = iter_items(f, 8)
+        self.assertEqual(next(pairs), ("a", 1))
+        self.assertLess(f.tell(), 100)
+
+    def test_invalid_input(self):
+        """Malformed JSON raises JSONDecodeError"""
+        for text in ("", "[]", '{"a" 1}', '{"a": 1', '{1: 2}', '{"a": 1 "b"'):
+            with self.assertRaises(json.JSONDecodeError):
+                self.items(text, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+"""Unit tests for the readers-writer lock."""
+import threading
+import unittest
+from models.engine.locks import NOLOCK, RWLock
+
+
+class TestRWLock(unittest.TestCase):
+    """Test cases for RWLock."""
+
+    def test_readers_share(self):
+        """Several threads hold the read lock at once"""
+        lock = RWLock()
+        barrier = threading.Barrier(3, timeout=5)
+
+        def read():
+            with lock.read():
+                barrier.wait()
+
+        threads = [threading.Thread(target=read) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertFalse(barrier.broken)
+
+    def test_writer_excludes_readers(self):
+        """A reader waits for the writer to finish"""
+        lock = RWLock()
+        events = []
+
+        def read():
+            with lock.read():
+                events.append("read")
+
+        with lock.write():
+            reader = threading.Thread(target=read)
+            reader.start()
+            reader.join(0.1)
+            events.append("written")
+        reader.join()
+        self.assertEqual(events, ["written", "read"])
+
+    def test_reentrant(self):
+        """The writer can write and read again, readers can read again"""
+        lock = RWLock()
+        with lock.write():
+            with lock.write():
+                with lock.read():
+                    pass
+        with lock.read():
+            with lock.read():
+                pass
+        with lock.write():
+            pass
+
+    def test_no_upgrade(self):
+        """A reader cannot start writing"""
+        lock = RWLock()
+        with lock.read():
+            with self.assertRaises(RuntimeError):
+                lock.acquire_write()
+
+    def test_nolock(self):
+        """NOLOCK has the interface of RWLock and does nothing"""
+        with NOLOCK.read(), NOLOCK.write():
+            pass
+
+
+if __name__ == "__main__":
+    unittest.main()
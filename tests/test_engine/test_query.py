@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+"""Unit tests for the query predicates and HashIndex."""
+import unittest
+from models.engine.query import (
+    MISSING, HashIndex, attribute, candidates, matches, parse)
+from models.place import Place
+
+
+class TestPredicates(unittest.TestCase):
+    """Test cases for parse(), attribute() and matches()."""
+
+    def test_parse(self):
+        """Keywords become (attr, op, value) conditions"""
+        self.assertEqual(parse({"city_id": "c", "max_guest__gte": 4}),
+                         [("city_id", "eq", "c"), ("max_guest", "gte", 4)])
+        with self.assertRaises(ValueError):
+            parse({"max_guest__between": (1, 2)})
+
+    def test_attribute_of_record(self):
+        """Records fall back to the class defaults"""
+        self.assertEqual(attribute({"name": "x"}, "name", Place), "x")
+        self.assertEqual(attribute({}, "max_guest", Place), 0)
+        self.assertIs(attribute({}, "pool", Place), MISSING)
+
+    def test_matches(self):
+        """Every condition must hold"""
+        place = {"max_guest": 4, "amenity_ids": ["a"], "name": "loft"}
+        self.assertTrue(matches(place, parse({
+            "max_guest__gte": 4, "max_guest__lt": 5,
+            "amenity_ids__contains": "a", "name__in": ["loft", "flat"],
+            "city_id": ""}), Place))
+        self.assertFalse(matches(place, parse({"max_guest__gt": 4}), Place))
+        self.assertFalse(matches(place, parse({"pool": True}), Place))
+        self.assertFalse(matches(place, parse({"name__gt": 3}), Place))
+
+
+class TestHashIndex(unittest.TestCase):
+    """Test cases for HashIndex."""
+
+    def setUp(self):
+        self.index = HashIndex("city_id")
+
+    def test_add_lookup_discard(self):
+        """Keys move between buckets as their value changes"""
+        self.index.add("Place.1", "a")
+        self.index.add("Place.2", "a")
+        self.assertEqual(self.index.lookup("a"), ["Place.1", "Place.2"])
+        self.index.add("Place.1", "b")
+        self.assertEqual(self.index.lookup("a"), ["Place.2"])
+        self.index.discard("Place.2")
+        self.assertEqual(self.index.lookup("a"), [])
+        self.assertEqual(self.index.buckets, {"b": {"Place.1": None}})
+
+    def test_list_values(self):
+        """List values are indexed by element"""
+        self.index.add("Place.1", ["x", "y"])
+        self.assertEqual(self.index.lookup("y"), ["Place.1"])
+
+    def test_unhashable_values(self):
+        """Unhashable values are always candidates"""
+        self.index.add("Place.1", {"a": 1})
+        self.assertEqual(self.index.lookup("a"), ["Place.1"])
+        self.assertIsNone(self.index.lookup(["a"]))
+
+    def test_extend(self):
+        """extend() indexes pairs the way add() does"""
+        self.index.extend([("Place.1", "a"), ("Place.2", ["a", "b"]),
+                           ("Place.3", {"a": 1})])
+        self.assertEqual(self.index.lookup("a"),
+                         ["Place.1", "Place.2", "Place.3"])
+        self.assertEqual(self.index.lookup("b"), ["Place.2", "Place.3"])
+        self.index.add("Place.2", "c")
+        self.assertEqual(self.index.lookup("b"), ["Place.3"])
+
+    def test_candidates(self):
+        """Only hashable operators on indexed attributes narrow keys"""
+        self.index.add("Place.1", "a")
+        self.index.add("Place.2", "b")
+        indexes = {"city_id": self.index}
+        self.assertIsNone(candidates(indexes, parse({"name": "a"})))
+        self.assertIsNone(candidates(indexes, parse({"city_id__ne": "a"})))
+        self.assertEqual(candidates(indexes, parse({"city_id": "b"})),
+                         ["Place.2"])
+        self.assertEqual(
+            sorted(candidates(indexes, parse({"city_id__in": ["a", "b"]}))),
+            ["Place.1", "Place.2"])
+        self.assertIsNone(candidates(indexes, parse({"city_id__in": "ab"})))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+"""Unit tests for the RangeIndex."""
+import random
+import unittest
+from unittest import mock
+from models.engine import ranges
+from models.engine.query import matches, parse
+from models.engine.ranges import RangeIndex, SortedList
+from models.place import Place
+
+
+class TestRangeIndex(unittest.TestCase):
+    """Test cases for RangeIndex, in chunks of a few pairs."""
+
+    def setUp(self):
+        patcher = mock.patch.object(ranges, "LOAD", 4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        rand = random.Random(0)
+        self.records = {}
+        self.index = RangeIndex(Place._ranges, Place)
+        for i in range(300):
+            record = {"price_by_night": rand.choice([rand.randrange(20),
+                                                     rand.random() * 20]),
+                      "max_guest": rand.randrange(8)}
+            if i % 50 == 0:
+                record["price_by_night"] = rand.choice(["5", True, None])
+            self.records[f"Place.{i:03}"] = record
+            self.index.add(f"Place.{i:03}", record)
+
+    def scan(self, predicates):
+        conditions = parse(predicates)
+        return sorted(key for key, record in self.records.items()
+                      if matches(record, conditions, Place))
+
+    def check(self, **predicates):
+        """candidates() holds every match of the range conditions"""
+        candidates = self.index.candidates(parse(predicates))
+        self.assertEqual(len(candidates), len(set(candidates)))
+        self.assertLessEqual(set(self.scan(predicates)), set(candidates))
+        self.assertEqual(self.scan(predicates), sorted(
+            key for key in candidates
+            if matches(self.records[key], parse(predicates), Place)))
+        return candidates
+
+    def test_candidates(self):
+        """Ranges, points and the values kept aside"""
+        self.check(price_by_night__gte=5, price_by_night__lt=7.5)
+        self.check(price_by_night__gt=5, price_by_night__lte=5)
+        self.check(price_by_night=1)
+        self.check(price_by_night__in=[1, 2.0, "3"], price_by_night__lt=2)
+        self.check(max_guest__gte=6, price_by_night__lt=1)
+        found = self.check(max_guest=3, number_rooms=0)
+        self.assertEqual(len(found), len(self.scan({"max_guest": 3})))
+        self.assertIsNone(self.index.candidates(parse({"name": "loft"})))
+        self.assertIsNone(self.index.candidates(
+            parse({"max_guest__ne": 3})))
+
+    def test_ordered(self):
+        """Keys come by value then key, within the range"""
+        def value(key):
+            return self.records[key]["price_by_night"]
+        numbers = [key for key in sorted(self.records)
+                   if type(value(key)) in (int, float)]
+        self.assertEqual(list(self.index.ordered("price_by_night")),
+                         sorted(numbers, key=lambda key: (value(key), key)))
+        found = list(self.index.ordered(
+            "price_by_night", parse({"price_by_night__lt": 10}), True))
+        self.assertEqual(found, sorted(
+            (key for key in numbers if value(key) < 10),
+            key=lambda key: (value(key), key), reverse=True))
+
+    def test_updates(self):
+        """Values are moved on add() and removed on discard()"""
+        for i, key in enumerate(list(self.records)):
+            if i % 3 == 0:
+                self.index.discard(key)
+                del self.records[key]
+            elif i % 3 == 1:
+                self.records[key] = {"price_by_night": 100 - i % 7}
+                self.index.add(key, self.records[key])
+        self.check(price_by_night__gte=90)
+        self.check(max_guest__lt=1)
+        self.assertEqual(len(self.index), len(self.records))
+        self.assertEqual(len(self.index.lists["price_by_night"]), len([
+            record for record in self.records.values()
+            if type(record["price_by_night"]) in (int, float)]))
+
+    def test_sorted_list(self):
+        """Chunks are split and dropped as pairs come and go, and pairs
+        inserted before the first lookup are sorted at once"""
+        pairs, pending = SortedList(), SortedList()
+        pairs.settle()
+        for i in range(40):
+            pairs.insert(i % 5, f"{i:02}")
+            pending.insert(i % 5, f"{i:02}")
+        self.assertGreater(len(pairs.maxima), 2)
+        self.assertEqual(sum(pending.range(), []), sum(pairs.range(), []))
+        for i in range(0, 40, 2):
+            pairs.remove(i % 5, f"{i:02}")
+        keys = [key for part in pairs.range(1, 3, low_open=True)
+                for key in part]
+        self.assertEqual(keys, ["07", "17", "27", "37",
+                                "03", "13", "23", "33"])
+        self.assertEqual(len(pairs), 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+"""Unit tests for the instrumentation."""
+import os
+import unittest
+from models import storage
+from models.base_model import BaseModel
+from models.engine import stats
+from models.engine.file_storage import FileStorage
+
+
+class TestHistogram(unittest.TestCase):
+    """Test cases for stats.Histogram."""
+
+    def test_quantiles(self):
+        """Quantiles are within a bucket of the exact values"""
+        histogram = stats.Histogram()
+        for ns in range(1, 10001):
+            histogram.add(ns)
+        self.assertEqual(histogram.calls, 10000)
+        self.assertAlmostEqual(histogram.quantile(0.5), 5000, delta=1250)
+        self.assertAlmostEqual(histogram.quantile(0.99), 9900, delta=2500)
+        self.assertEqual(histogram.quantile(1), 10000)
+
+    def test_buckets(self):
+        """Every duration falls under the upper bound of its bucket"""
+        bucket, upper = stats.Histogram.bucket, stats.Histogram.upper
+        for ns in (0, 1, 3, 4, 7, 8, 1000, 123456789):
+            self.assertLessEqual(ns, upper(bucket(ns)))
+            self.assertEqual(bucket(upper(bucket(ns))), bucket(ns))
+            self.assertGreater(bucket(upper(bucket(ns)) + 1), bucket(ns))
+
+
+class TestStats(unittest.TestCase):
+    """Test cases for turning instrumentation on and off."""
+
+    def setUp(self):
+        """Start with instrumentation on and no figures."""
+        self.was_enabled = stats.enabled
+        stats.enable()
+        stats.reset()
+        storage._FileStorage__objects = {}
+
+    def tearDown(self):
+        """Restore the instrumentation setting and remove the file."""
+        if not self.was_enabled:
+            stats.disable()
+        try:
+            os.remove("file.json")
+        except FileNotFoundError:
+            pass
+
+    def test_records_calls_and_writes(self):
+        """Timed methods and write counters show in snapshot()"""
+        model = BaseModel()
+        model.save()
+        figures = stats.snapshot()
+        self.assertTrue(figures["enabled"])
+        self.assertEqual(figures["timers"]["BaseModel.save"]["calls"], 1)
+        self.assertEqual(figures["timers"]["FileStorage.save"]["calls"], 1)
+        self.assertGreaterEqual(
+            figures["timers"]["BaseModel.__init__"]["calls"], 1)
+        self.assertGreater(figures["counters"]["bytes_written"], 0)
+        self.assertEqual(figures["counters"]["objects_serialized"], 1)
+
+    def test_disable_restores_methods(self):
+        """Turning instrumentation off unwraps the methods"""
+        self.assertIsNot(FileStorage.__dict__["save"],
+                         stats._targets[(FileStorage, "save")])
+        stats.disable()
+        self.assertIs(FileStorage.__dict__["save"],
+                      stats._targets[(FileStorage, "save")])
+        BaseModel().save()
+        self.assertEqual(stats.snapshot()["timers"], {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+"""Unit tests for the TextIndex."""
+import unittest
+from models.engine.text import TextIndex, normalize
+from models.place import Place
+
+
+class TestTextIndex(unittest.TestCase):
+    """Test cases for TextIndex."""
+
+    def setUp(self):
+        self.index = TextIndex(("name", "description"), Place)
+        self.index.add("Place.1", {"name": "Café Lumière",
+                                   "description": "A quiet loft by the canal"})
+        self.index.add("Place.2", {"name": "Canal house",
+                                   "description": "Canal view, canal boats"})
+        self.index.add("Place.3", {"name": "Garden flat"})
+
+    def test_normalize(self):
+        """Case and accents are folded, words are not stemmed"""
+        self.assertEqual(normalize("Café CRÈME"), "cafe creme")
+        self.assertEqual(self.index.terms("Boats, boat!"), ["boats", "boat"])
+        plain = TextIndex(("name",), normalize=False)
+        self.assertEqual(plain.terms("Café"), ["café"])
+
+    def test_search_ranks_with_bm25(self):
+        """More frequent and rarer terms score higher"""
+        self.assertEqual([key for _, key in self.index.search("canal")],
+                         ["Place.2", "Place.1"])
+        found = self.index.search("cafe garden", limit=1)
+        self.assertEqual(len(found), 1)
+        self.assertGreater(found[0][0], 0)
+        self.assertEqual(self.index.search("nothing"), [])
+
+    def test_add_and_discard(self):
+        """Changed text is indexed again, removed keys are forgotten"""
+        self.index.add("Place.3", {"name": "Canal garden"})
+        self.assertIn("Place.3", dict(
+            (key, score) for score, key in self.index.search("canal")))
+        self.index.discard("Place.2")
+        self.index.add("Place.1", {})
+        self.assertEqual([key for _, key in self.index.search("canal")],
+                         ["Place.3"])
+        self.assertNotIn("loft", self.index.postings)
+        self.assertEqual(self.index.total, 2)
+
+    def test_dump_and_load(self):
+        """A loaded index skips unchanged documents and drops the ones
+        no add() confirmed"""
+        data = self.index.dump()
+        index = TextIndex(("name", "description"), Place)
+        self.assertFalse(index.load({"attrs": ["name"], "docs": {}}))
+        self.assertTrue(index.load(data))
+        self.assertEqual(index.search("canal"), self.index.search("canal"))
+        index.terms = None
+        index.add("Place.2", {"name": "Canal house",
+                              "description": "Canal view, canal boats"})
+        index.settle()
+        self.assertEqual(list(index.docs), ["Place.2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
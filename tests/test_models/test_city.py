@@ -32,6 +32,17 @@ class TestCity(unittest.TestCase):
         city.state_id = "city state_id"
         self.assertEqual(city.state_id, "city state_id")
 
+    def test_places(self):
+        """Test that places follows updates of Place.city_id"""
+        from models.place import Place
+        city, other = City(), City()
+        place = Place()
+        place.city_id = city.id
+        self.assertEqual(city.places, [place])
+        place.city_id = other.id
+        self.assertEqual(city.places, [])
+        self.assertEqual(other.places, [place])
+
 
 
 
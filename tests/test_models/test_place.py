@@ -121,6 +121,72 @@ class TestPlace(unittest.TestCase):
         place.amenity_ids = ["id1", "id2", "id3"]
         self.assertEqual(place.amenity_ids, ["id1", "id2", "id3"])
 
+    def test_reviews(self):
+        """Test that reviews lists the reviews of the place"""
+        from models.review import Review
+        place = Place()
+        review = Review()
+        review.place_id = place.id
+        self.assertEqual(place.reviews, [review])
+
+    def test_amenities(self):
+        """Test that amenities resolves amenity_ids, both ways"""
+        from models.amenity import Amenity
+        place = Place()
+        amenity = Amenity()
+        place.amenity_ids = [amenity.id, "missing"]
+        self.assertEqual(place.amenities, [amenity])
+        self.assertEqual(amenity.places, [place])
+
+
+class TestPlaceCompact(unittest.TestCase):
+    """Unittests for the slotted variant returned by Place.compact()."""
+
+    def setUp(self):
+        """Build an unsaved compact Place and a regular one."""
+        self.cls = Place.compact()
+
+    def test_is_place(self):
+        """The compact variant is a cached Place subclass"""
+        self.assertTrue(issubclass(self.cls, Place))
+        self.assertEqual(self.cls.__name__, "Place")
+        self.assertIs(Place.compact(), self.cls)
+        self.assertIs(self.cls.compact(), self.cls)
+
+    def test_declared_attributes_in_slots(self):
+        """Declared attributes live in slots, not in __dict__"""
+        place = self.cls()
+        place.name = "place name"
+        place.max_guest = 4
+        self.assertIn("name", self.cls.__slots__)
+        self.assertNotIn("name", place.__dict__)
+        self.assertEqual(place.name, "place name")
+
+    def test_defaults(self):
+        """Unset attributes fall back to the class defaults"""
+        place = self.cls()
+        self.assertEqual(place.city_id, "")
+        self.assertEqual(place.latitude, 0.0)
+        self.assertEqual(place.amenity_ids, [])
+        with self.assertRaises(AttributeError):
+            place.undeclared
+
+    def test_extra_attributes(self):
+        """Attributes that were not declared can still be set"""
+        place = self.cls()
+        place.pool = True
+        self.assertTrue(place.pool)
+        self.assertTrue(place.to_dict()["pool"])
+
+    def test_same_output_as_place(self):
+        """to_dict() and __str__ match a regular Place"""
+        regular = Place()
+        regular.name = "name"
+        regular.extra = 1
+        compact = self.cls(**regular.to_dict())
+        self.assertEqual(compact.to_dict(), regular.to_dict())
+        self.assertEqual(str(compact), str(regular))
+
 
 
 
@@ -0,0 +1,42 @@
+#!/usr/bin/python3
+"""Unit tests for the lazy storage and model registry of models."""
+import subprocess
+import sys
+import unittest
+import models
+from models.state import State
+
+
+class TestModelRegistry(unittest.TestCase):
+    """Test cases for models.classes and models.storage."""
+
+    def test_lookup(self):
+        """Classes are found by name, unknown names are not"""
+        self.assertIs(models.classes["State"], State)
+        self.assertIn("Review", models.classes)
+        self.assertNotIn("Foo", models.classes)
+        with self.assertRaises(KeyError):
+            models.classes["Foo"]
+        self.assertEqual(len(models.classes), 7)
+
+    def test_import_is_lazy(self):
+        """Importing models reads no data and imports no model class"""
+        script = (
+            "import sys, models\n"
+            "assert 'storage' not in vars(models)\n"
+            "assert 'models.user' not in sys.modules\n"
+            "assert models.classes['User'].__name__ == 'User'\n"
+            "assert 'models.user' in sys.modules\n"
+            "assert models.storage is models.storage\n")
+        result = subprocess.run([sys.executable, "-c", script],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_unknown_attribute(self):
+        """Other missing attributes raise AttributeError"""
+        with self.assertRaises(AttributeError):
+            models.missing
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -22,6 +22,26 @@ class TestState(unittest.TestCase):
         state.name = "state name"
         self.assertEqual(state.name, "state name")
 
+    def test_cities(self):
+        """Test that cities lists the cities referring to the state"""
+        from models.city import City
+        state, other = State(), State()
+        cities = [City(), City()]
+        for city in cities:
+            city.state_id = state.id
+        self.assertCountEqual(state.cities, cities)
+        self.assertEqual(other.cities, [])
+
+    def test_stored_key_named_like_property(self):
+        """A stored key that the cities property shadows is kept"""
+        state = State()
+        record = state.to_dict()
+        record["cities"] = "x"
+        loaded = State(**record)
+        self.assertEqual(loaded.cities, [])
+        self.assertEqual(loaded.to_dict(), record)
+        self.assertEqual(State.compact()(**record).to_dict(), record)
+
 
 
 